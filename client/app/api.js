@@ -5,7 +5,7 @@ async function searchFlowers({ text, file }) {
   if (text) form.append('q', text);
   if (file) form.append('q_img', file);
   const res = await fetch(`${API_BASE}/flowers/search/`, { method: 'POST', body: form });
-  const items = await res.json();
+  const data = await res.json();
   if (!res.ok) {
     let message = `HTTP ${res.status}`;
     if (data && typeof data.detail === 'string') {
@@ -13,7 +13,14 @@ async function searchFlowers({ text, file }) {
     }
     throw new Error(message);
   }
-  return items;
+  // Search results only hold the list view fields, getFlower loads the details
+  return data.items;
+}
+
+async function getFlower(id) {
+  const res = await fetch(`${API_BASE}/flowers/${encodeURIComponent(id)}`);
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
 }
 
 
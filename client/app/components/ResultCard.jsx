@@ -1,6 +1,8 @@
 function ResultCard({ item, onClick }) {
   const images = [item.image1_url, item.image2_url, item.image3_url, item.image4_url].filter(Boolean);
-  const imgSrc = images[0] || 'data:image/svg+xml;utf8,' + encodeURIComponent(`<svg xmlns="http://www.w3.org/2000/svg" width="400" height="300"><rect width="100%" height="100%" fill="#e9ecef"/><text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" fill="#6c757d" font-family="sans-serif" font-size="20">No Image</text></svg>`);
+  // Served thumbnails are a few KB, the remote originals are full size photos
+  const thumbnail = item.thumbnail && `${API_BASE}/images/thumb/${encodeURIComponent(item.thumbnail)}`;
+  const imgSrc = thumbnail || images[0] || 'data:image/svg+xml;utf8,' + encodeURIComponent(`<svg xmlns="http://www.w3.org/2000/svg" width="400" height="300"><rect width="100%" height="100%" fill="#e9ecef"/><text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" fill="#6c757d" font-family="sans-serif" font-size="20">No Image</text></svg>`);
   return (
     <div className="col-6 col-sm-4 col-md-3 col-lg-2 mb-3">
       <div className="card h-100" role="button" onClick={() => onClick(item)}>
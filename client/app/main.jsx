@@ -15,9 +15,14 @@ function App() {
   const [queryImageUrl, setQueryImageUrl] = React.useState(null);
   const modal = useModal();
 
-  const openDetail = (item) => {
+  const openDetail = async (item) => {
     setSelected(item);
     if (modal) modal.show();
+    try {
+      setSelected(await getFlower(item.id));
+    } catch (e) {
+      // Keep showing the list view fields of the result
+    }
   };
 
   const onSearch = async ({ text, file }) => {
@@ -78,7 +83,7 @@ function App() {
       )}
       <div className="row">
         {items.map((item) => (
-          <ResultCard key={(item.common_name || '') + (item.botanical_name || '')} item={item} onClick={openDetail} />
+          <ResultCard key={item.id} item={item} onClick={openDetail} />
         ))}
       </div>
 
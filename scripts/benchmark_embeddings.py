@@ -0,0 +1,64 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+from embedding_backends import EMBEDDING_BACKENDS, create_clip_embedding_function
+
+QUERIES = ["blue poppy", "rhododendron", "primula", "white orchid", "yellow daisy", "pink lily", "red rose",
+           "purple iris", "cobra lily", "edelweiss", "gentian", "saxifrage"]
+
+
+def benchmark(embedding_function, images, num_queries: int, batch_size: int) -> dict:
+    """Measure image embedding throughput in batches, and the latency of single text queries"""
+    embedding_function(QUERIES[:1] + images[:1])
+
+    started_at = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        embedding_function(images[start:start + batch_size])
+    images_per_sec = len(images) / (time.perf_counter() - started_at)
+
+    latencies = []
+    for i in range(num_queries):
+        started_at = time.perf_counter()
+        embedding_function([QUERIES[i % len(QUERIES)]])
+        latencies.append(time.perf_counter() - started_at)
+    latencies.sort()
+    return {
+        "images_per_sec": images_per_sec,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the CPU throughput and latency of the embedding backends')
+    parser.add_argument('--backends', nargs='+', choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS),
+                        help='Backends to compare (default: all)')
+    parser.add_argument('--onnx-model-dir', default='../src/models/clip-onnx',
+                        help='Models written by export_onnx_clip.py (default: ../src/models/clip-onnx)')
+    parser.add_argument('--fp32', action='store_true', help='Run the onnx backend without int8 quantization')
+    parser.add_argument('--threads', type=int, help='Intra-op threads of every backend')
+    parser.add_argument('--images', type=int, default=64, help='Images embedded per run (default: 64)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Images per call (default: 16)')
+    parser.add_argument('--queries', type=int, default=200, help='Text queries per run (default: 200)')
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(480, 640, 3), dtype=numpy.uint8) for _ in range(args.images)]
+    for backend in args.backends:
+        embedding_function = create_clip_embedding_function(backend, model_dir=args.onnx_model_dir,
+                                                            quantized=not args.fp32, intra_op_threads=args.threads)
+        result = benchmark(embedding_function, images, args.queries, args.batch_size)
+        print(f"{backend:>5}: {result['images_per_sec']:7.1f} images/sec, "
+              f"text p50 {result['p50_ms']:6.1f} ms, p99 {result['p99_ms']:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+import chroma
+from exact_search import SEARCH_ENGINES
+from search import SearchService
+
+QUERIES = ["blue poppy", "rhododendron", "primula", "white orchid", "yellow daisy", "pink lily", "red rose",
+           "purple iris", "cobra lily", "edelweiss", "gentian", "saxifrage"]
+
+
+def run_load(service: SearchService, concurrency: int, num_queries: int) -> dict:
+    """Fire num_queries text searches from `concurrency` client threads and collect latencies"""
+
+    def timed_search(i):
+        started_at = time.perf_counter()
+        service.search(QUERIES[i % len(QUERIES)], None)
+        return time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(timed_search, range(num_queries)))
+    elapsed = time.perf_counter() - started_at
+    return {
+        "qps": num_queries / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures search throughput with and without query micro-batching, '
+                                                 'on the Chroma and the exact search engine')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients (default: 16)')
+    parser.add_argument('--queries', type=int, default=256, help='Searches per run (default: 256)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='Max batch sizes to compare, 1 means no batching (default: 1 4 8 16)')
+    parser.add_argument('--max-wait-ms', type=float, default=5, help='Max batching wait (default: 5)')
+    parser.add_argument('--engines', nargs='+', choices=SEARCH_ENGINES, default=list(SEARCH_ENGINES),
+                        help='Search engines to compare (default: all)')
+    parser.add_argument('--exact-dtype', default='float32', choices=['float32', 'float16'],
+                        help='Matrix dtype of the exact engine (default: float32)')
+    args = parser.parse_args()
+
+    chromadb_client = chroma.client(persistent=True, path="../src/chroma")
+    chroma.warm_up()
+    for engine in args.engines:
+        for batch_size in args.batch_sizes:
+            service = SearchService(chromadb_client, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms,
+                                    engine=engine, exact_dtype=args.exact_dtype)
+            # The queries repeat, without the caches every one is embedded by CLIP and searched as a cold query would be
+            service.embedding_cache.maxsize = 0
+            service.results_cache.maxsize = 0
+            result = run_load(service, args.concurrency, args.queries)
+            print(f"{engine:>6}, batch size {batch_size:>3}: {result['qps']:7.1f} queries/sec, "
+                  f"p50 {result['p50_ms']:7.1f} ms, p99 {result['p99_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import sys
+from pathlib import Path
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+import chroma
+from fused_index import DEFAULT_TEXT_WEIGHT, delete_orphaned_fused_embeddings, update_fused_embeddings
+from search import SearchService
+
+
+def recall_at_n(reference_ids, candidate_ids) -> float:
+    """Share of the reference results that the candidate results also found"""
+    return len(set(reference_ids) & set(candidate_ids)) / len(reference_ids) if reference_ids else 1.0
+
+
+def compare_recall(service: SearchService, queries, n: int) -> dict:
+    """Mean recall@n of fused search measured against the current image and hybrid search paths"""
+
+    recalls = {"image": [], "hybrid": []}
+    for query in queries:
+        fused = [f.url for f in service.search(query, None, n=n, mode="fused")]
+        for mode, mode_recalls in recalls.items():
+            mode_recalls.append(recall_at_n([f.url for f in service.search(query, None, n=n, mode=mode)], fused))
+    return {mode: sum(values) / len(values) for mode, values in recalls.items() if values}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuilds the per-flower fused text and image embedding collection')
+    parser.add_argument('--text-weight', type=float, default=DEFAULT_TEXT_WEIGHT,
+                        help=f'Share of the description in the fused embedding (default: {DEFAULT_TEXT_WEIGHT})')
+    parser.add_argument('--recall-queries', type=int, default=50,
+                        help='Common names used as queries to compare recall, 0 skips it (default: 50)')
+    parser.add_argument('--n', type=int, default=20, help='Results per recall query (default: 20)')
+    args = parser.parse_args()
+
+    chromadb_client = chroma.client(persistent=True, path="../src/chroma")
+    service = SearchService(chromadb_client)
+    num_flowers = update_fused_embeddings(service.text_dao, service.image_dao, service.fused_dao,
+                                          text_weight=args.text_weight)
+    num_deleted = delete_orphaned_fused_embeddings(service.text_dao, service.fused_dao)
+    print(f"Fused embeddings of {num_flowers} flowers, deleted {num_deleted} orphaned")
+
+    if args.recall_queries:
+        flowers = service.text_dao.get(limit=args.recall_queries, include=["metadatas"])["metadatas"]
+        queries = [flower["common_name"] for flower in flowers if flower.get("common_name")]
+        for mode, recall in compare_recall(service, queries, args.n).items():
+            print(f"fused recall@{args.n} against {mode} search: {recall:.3f} over {len(queries)} queries")
+
+
+if __name__ == "__main__":
+    main()
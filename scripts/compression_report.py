@@ -0,0 +1,78 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+import chroma
+from chroma import FloraFusedDAO, FloraImageDAO, FloraTextDAO
+from compression import fit_codec
+from exact_search import ExactIndex, load_collection
+
+DEFAULT_CODECS = ["float16", "pca:64", "pca:128", "pca:256", "pq:32", "pq:64", "pq:128"]
+
+
+def recall_at_k(results, expected, k: int) -> float:
+    return statistics.mean(len(set(ids[:k]) & set(expected_ids[:k])) / k
+                           for ids, expected_ids in zip(results["ids"], expected["ids"]))
+
+
+def timed_query(index: ExactIndex, queries: list, k: int) -> tuple:
+    latencies, results = [], {"ids": []}
+    for query in queries:
+        started_at = time.perf_counter()
+        results["ids"].extend(index.query_embeddings([query], k)["ids"])
+        latencies.append(time.perf_counter() - started_at)
+    return results, statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reports the memory and recall@k tradeoff of the exact search '
+                                                 'engine\'s compressed codes, with and without re-ranking')
+    parser.add_argument('--collection', choices=['flora_images', 'flora_text', 'flora_fused'], default='flora_images',
+                        help='Collection searched (default: flora_images)')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='Held-out queries, description embeddings of flora_text (default: 200)')
+    parser.add_argument('--k', type=int, default=10, help='Results per query (default: 10)')
+    parser.add_argument('--rerank-factor', type=int, default=4, help='Candidates re-ranked per result (default: 4)')
+    parser.add_argument('--codecs', nargs='+', default=DEFAULT_CODECS,
+                        help='Codecs as float16, pca:<dims> or pq:<subspaces> (default: %(default)s)')
+    args = parser.parse_args()
+
+    chromadb_client = chroma.client(persistent=True, path="../src/chroma")
+    text_dao = FloraTextDAO(chromadb_client)
+    dao = {"flora_images": FloraImageDAO, "flora_text": FloraTextDAO,
+           "flora_fused": FloraFusedDAO}[args.collection](chromadb_client)
+
+    # Description embeddings stand in for text queries, held out by searching the photos or fused vectors
+    _, query_matrix, _ = load_collection(text_dao, [])
+    rng = numpy.random.default_rng(0)
+    queries = query_matrix[rng.choice(len(query_matrix), min(args.queries, len(query_matrix)), replace=False)]
+    queries = queries.tolist()
+    _, matrix, _ = load_collection(dao, [])
+
+    exact = ExactIndex(dao, [])
+    expected, exact_ms = timed_query(exact, queries, args.k)
+    print(f"{'codes':>10} {'bytes/vec':>9} {'memory':>7} {'recall@' + str(args.k):>9} {'reranked':>9} {'p50 ms':>7}")
+    print(f"{'float32':>10} {matrix.shape[1] * 4:9d} {'100%':>7} {1.0:9.3f} {1.0:9.3f} {exact_ms:7.2f}")
+    for spec in args.codecs:
+        kind, _, size = spec.partition(":")
+        params = {"dims": int(size)} if kind == "pca" else {"subspaces": int(size)} if kind == "pq" else {}
+        codec = fit_codec(kind, matrix, **params)
+        first_stage = ExactIndex(dao, [], codec=codec, rerank_factor=0)
+        reranked = ExactIndex(dao, [], codec=codec, rerank_factor=args.rerank_factor)
+        first_results, _ = timed_query(first_stage, queries, args.k)
+        reranked_results, reranked_ms = timed_query(reranked, queries, args.k)
+        bytes_per_vector = first_stage.nbytes / max(len(first_stage), 1)
+        print(f"{spec:>10} {bytes_per_vector:9.0f} {bytes_per_vector / (matrix.shape[1] * 4):7.1%} "
+              f"{recall_at_k(first_results, expected, args.k):9.3f} "
+              f"{recall_at_k(reranked_results, expected, args.k):9.3f} {reranked_ms:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import sys
+from pathlib import Path
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+from embedding_backends import (CLIP_CHECKPOINT, CLIP_CONTEXT_LENGTH, CLIP_IMAGE_SIZE, CLIP_MODEL_NAME,
+                                IMAGE_MODEL_FILE, QUANTIZED_SUFFIX, TEXT_MODEL_FILE, TOKENIZER_FILE)
+
+# The Hugging Face tokenizer of OpenAI's CLIP uses the same BPE vocabulary as open_clip's SimpleTokenizer
+HF_TOKENIZER = "openai/clip-vit-base-patch32"
+
+
+def export(output_dir: Path, opset: int = 17) -> None:
+    """Export the CLIP text and image towers to ONNX, then write int8 dynamically quantized copies of both.
+
+    Needs torch, open_clip, onnx and transformers, which the server does not, so this runs once on a dev machine.
+    """
+    import open_clip
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import CLIPTokenizerFast
+
+    model, _, _ = open_clip.create_model_and_transforms(CLIP_MODEL_NAME, pretrained=CLIP_CHECKPOINT, device="cpu")
+    model.eval()
+
+    class TextTower(torch.nn.Module):
+        def forward(self, input_ids):
+            return model.encode_text(input_ids)
+
+    class ImageTower(torch.nn.Module):
+        def forward(self, pixel_values):
+            return model.encode_image(pixel_values)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    towers = [
+        (TextTower(), open_clip.get_tokenizer(CLIP_MODEL_NAME)(["a photo of a flower"]), "input_ids", TEXT_MODEL_FILE),
+        (ImageTower(), torch.zeros(1, 3, CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE), "pixel_values", IMAGE_MODEL_FILE),
+    ]
+    for tower, example, input_name, file_name in towers:
+        path = output_dir / file_name
+        with torch.no_grad():
+            torch.onnx.export(tower, (example,), str(path), input_names=[input_name], output_names=["embeddings"],
+                              dynamic_axes={input_name: {0: "batch"}, "embeddings": {0: "batch"}},
+                              opset_version=opset)
+        # Weights of the matrix multiplications become int8, activations are quantized on the fly
+        quantize_dynamic(str(path), str(path.with_name(file_name.replace(".onnx", f"{QUANTIZED_SUFFIX}.onnx"))),
+                         weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"])
+        print(f"Exported {path} and its int8 copy")
+
+    tokenizer = CLIPTokenizerFast.from_pretrained(HF_TOKENIZER)
+    assert tokenizer.model_max_length == CLIP_CONTEXT_LENGTH
+    tokenizer.backend_tokenizer.save(str(output_dir / TOKENIZER_FILE))
+    print(f"Saved tokenizer to {output_dir / TOKENIZER_FILE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports CLIP to ONNX for the onnx embedding backend')
+    parser.add_argument('--output-dir', default='../src/models/clip-onnx',
+                        help='Where the models are written (default: ../src/models/clip-onnx)')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version (default: 17)')
+    args = parser.parse_args()
+    export(Path(args.output_dir), args.opset)
+
+
+if __name__ == "__main__":
+    main()
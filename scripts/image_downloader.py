@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from email.utils import formatdate
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageDownloader:
+    """Downloads images on a bounded pool of worker threads sharing one pooled HTTP session.
+
+    Failed requests are retried with exponential backoff, and no more than `per_host_limit`
+    downloads run against the same host at a time.
+    """
+
+    def __init__(self, workers: int = 8, per_host_limit: int = 4, retries: int = 3,
+                 backoff_factor: float = 0.5, timeout: float = 30):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-download")
+        self._host_limits: Dict[str, threading.Semaphore] = {}
+        self._host_limits_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit(self, url: str, file_path: Path, refresh: bool = False, conditional: bool = True) -> Future:
+        """Schedules a download and returns a future resolving to the local path, or None on failure"""
+        return self._executor.submit(self.download, url, file_path, refresh, conditional)
+
+    def download(self, url: str, file_path: Path, refresh: bool = False, conditional: bool = True) -> Optional[str]:
+        """Downloads url to file_path, returning the local path or None on failure.
+
+        An existing file is kept as is, unless `refresh` downloads it again: with `conditional` only if the server
+        has a copy newer than the file (If-Modified-Since), otherwise always, e.g. because the url changed. When a
+        refresh fails the existing file is kept.
+        """
+        if not url or url.strip() == "":
+            return None
+
+        file_path = Path(file_path)
+        exists = file_path.is_file()
+        if exists and not refresh:
+            return str(file_path)
+
+        headers = {"If-Modified-Since": formatdate(file_path.stat().st_mtime, usegmt=True)} \
+            if exists and conditional else None
+        try:
+            with self._host_limit(url):
+                print(f"Downloading image with URL: {url}")
+                self._stream_to_file(url, file_path, headers)
+            return str(file_path)
+        except Exception as e:
+            print(f"Failed to download image from {url}: {e}")
+            return str(file_path) if exists else None
+
+    def _stream_to_file(self, url: str, file_path: Path, headers: Optional[Dict[str, str]] = None) -> None:
+        # Write to a temporary file first so an interrupted download never leaves a truncated image behind. Each
+        # download gets its own, parallel downloads of one path then each publish a complete image
+        part_path = None
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code == 304:
+                    return
+                with tempfile.NamedTemporaryFile(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".part",
+                                                 delete=False) as f:
+                    part_path = Path(f.name)
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            os.replace(part_path, file_path)
+        finally:
+            if part_path:
+                part_path.unlink(missing_ok=True)
+
+    def _host_limit(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.Semaphore(self.per_host_limit)
+            return self._host_limits[host]
@@ -0,0 +1,40 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+
+class ImportCheckpoint:
+    """Append-only JSON lines manifest of the flowers, and their images, already written to ChromaDB.
+
+    Every import appends to the manifest. Only a resumed import consults it, to skip flowers that are done.
+    """
+
+    def __init__(self, path, resume: bool = False):
+        self.path = Path(path)
+        self.done: Dict[str, List[str]] = {}
+        if resume and self.path.is_file():
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A crash mid-write can leave a truncated last line, that flower is simply imported again
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.done[entry["flora_id"]] = entry["image_ids"]
+
+    def is_done(self, flora_id: str) -> bool:
+        return flora_id in self.done
+
+    def mark_done(self, image_ids_by_flora_id: Dict[str, List[str]]) -> None:
+        """Record a saved batch, synced to disk so it survives a crash of the import"""
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for flora_id, image_ids in image_ids_by_flora_id.items():
+                f.write(json.dumps({"flora_id": flora_id, "image_ids": image_ids}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(image_ids_by_flora_id)
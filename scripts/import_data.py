@@ -1,49 +1,117 @@
 import argparse
 import csv
+import hashlib
+import itertools
 import sys
+import time
 import typing
 import uuid
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
 from pathlib import Path
 from typing import Dict, Optional
 
-import requests
 from chromadb import ClientAPI
 
 src_path = Path(__file__).parent.parent / "src"
 sys.path.append(str(src_path))
 
 import chroma
-from chroma import FloraTextDAO, FloraImageDAO
+from chroma import FloraFusedDAO, FloraTextDAO, FloraImageDAO
+from compression import CODECS, DEFAULT_PCA_DIMS, DEFAULT_PQ_SUBSPACES
+from embedding_backends import EMBEDDING_BACKENDS
+from embedding_cache import CachedEmbeddingFunction
+from exact_search import snapshot_dir_for, write_codec
+from fused_index import update_fused_embeddings
+from image_downloader import ImageDownloader
+from import_checkpoint import ImportCheckpoint
 from models import Flower
+from thumbnails import make_thumbnails
+
+DEFAULT_BATCH_SIZE = 32
+# Metadata fields the search API can filter on, written to text and image records alike
+FILTER_FIELDS = ("family", "region", "color", "num_images")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StoredHashes:
+    """Content hashes of the records already in ChromaDB, used by a sync to skip unchanged records"""
+
+    text: Dict[str, str]
+    images: Dict[str, str]
+    image_ids_by_flora_id: Dict[str, set]
+    # Url each stored image was downloaded from, a changed url means a different photo under the same file name
+    image_urls: Dict[str, str] = field(default_factory=dict)
+    seen_flora_ids: set = field(default_factory=set)
 
 
 class FloraImporter:
     """Import flora data from CSV, download associated images and save the data to ChromaDB."""
 
     def __init__(self, csv_file_path: str, chromadb_client: ClientAPI, img_directory: str = "img",
-                 download_images: bool = True):
+                 download_images: bool = True, downloader: Optional[ImageDownloader] = None,
+                 checkpoint: Optional[ImportCheckpoint] = None, thumbnails: bool = True,
+                 embedding_cache_dir: Optional[str] = None):
         self.csv_file_path = csv_file_path
         self.img_directory = Path(img_directory)
         self.img_directory.mkdir(exist_ok=True)
         self.chromadb_client = chromadb_client
         self.download_images = download_images
+        self.thumbnails = thumbnails
+        self.embedding_cache_dir = embedding_cache_dir
+        self.downloader = downloader or ImageDownloader()
+        self.checkpoint = checkpoint
+        self.num_skipped = 0
+        self.num_unchanged = 0
+        self.num_without_id = 0
+        self.stored_hashes: Optional[StoredHashes] = None
 
-    def _download_image(self, url: str, filename: str) -> Optional[str]:
-        if not url or url.strip() == "":
+    @cached_property
+    def embedding_function(self) -> Optional[CachedEmbeddingFunction]:
+        """CLIP behind the on-disk embedding cache, None lets the DAOs embed with CLIP directly"""
+        if self.embedding_cache_dir is None:
             return None
+        return CachedEmbeddingFunction(chroma.clip_embedding_function(), Path(self.embedding_cache_dir))
 
-        try:
-            file_path = self.img_directory / f"{filename}{'.jpg'}"
-            if not Path(file_path).is_file():
-                print(f"Downloading image with URL: {url}")
-                response = requests.get(url, timeout=30)
-                response.raise_for_status()
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-            return str(file_path)
-        except Exception as e:
-            print(f"Failed to download image from {url}: {e}")
-            return None
+    @cached_property
+    def text_dao(self) -> FloraTextDAO:
+        # DAOs share the process wide CLIP model, so build them once per import rather than once per row
+        return FloraTextDAO(self.chromadb_client, self.embedding_function)
+
+    @cached_property
+    def image_dao(self) -> FloraImageDAO:
+        return FloraImageDAO(self.chromadb_client, self.embedding_function)
+
+    @cached_property
+    def fused_dao(self) -> FloraFusedDAO:
+        # Fused embeddings are computed from the stored ones, the embedding function only embeds queries
+        return FloraFusedDAO(self.chromadb_client, embedding_function=self.text_dao.embedding_function)
+
+    def _download_image(self, url: str, filename: str, refresh: bool = False, conditional: bool = True) -> Future:
+        """Schedule an image download, the returned future resolves to the local path or None"""
+        file_path = self.img_directory / f"{filename}{'.jpg'}"
+        return self.downloader.submit(url, file_path, refresh=refresh, conditional=conditional)
+
+    @staticmethod
+    def _flower_id(fields: Dict[str, str]) -> Optional[str]:
+        """Derive a stable flower id from its page url, so re-imports overwrite rather than duplicate.
+        None when the row has neither a url nor a name to derive it from"""
+        key = fields.get('url') or fields.get('botanical_name') or fields.get('common_name')
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, key)) if key else None
+
+    @staticmethod
+    def _hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
 
     @staticmethod
     def _create_safe_filename(name: str, image_num: int) -> str:
@@ -52,8 +120,8 @@ class FloraImporter:
         safe_name = safe_name.replace(' ', '_').lower()
         return f"{safe_name}_img{image_num}"
 
-    def _process_row(self, row: Dict[str, str]) -> tuple[Flower, dict[str, str]]:
-        """Process a single CSV row and download images."""
+    def _process_row(self, row: Dict[str, str]) -> tuple[Flower, dict[str, Future]]:
+        """Process a single CSV row and start downloading its images."""
 
         # Create Flower object from CSV row
         flower = Flower(
@@ -65,33 +133,90 @@ class FloraImporter:
             image1_url=row.get('image1_url'),
             image2_url=row.get('image2_url', ""),
             image3_url=row.get('image3_url', ""),
-            image4_url=row.get('image4_url', "")
+            image4_url=row.get('image4_url', ""),
+            region=self._filter_value(row.get('region')),
+            color=self._filter_value(row.get('color')),
         )
         # Download images if enabled
         image_paths = self._download_images(flower)
         return flower, image_paths
 
-    def _download_images(self, flower) -> dict[str, str]:
-        image_paths = {}
+    @staticmethod
+    def _filter_value(value: Optional[str]) -> Optional[str]:
+        value = (value or "").strip().lower()
+        return value or None
+
+    @staticmethod
+    def _flower_metadata(flower: Flower, local_image_paths: Dict[str, str]) -> Dict[str, typing.Any]:
+        """Flower fields plus typed filter fields, Chroma metadata cannot hold None so unset fields are left out"""
+
+        metadata = {key: value for key, value in asdict(flower).items() if value is not None}
+        if flower.family:
+            # Lower-cased like region and color, so filters match whatever case the CSV or the client uses
+            metadata["family"] = flower.family.strip().lower()
+        metadata.update(local_image_paths)
+        metadata["num_images"] = len(local_image_paths)
+        if local_image_paths:
+            # Result cards show the first photo, served by the API as /images/thumb/<file name>
+            metadata["thumbnail"] = Path(next(iter(local_image_paths.values()))).name
+        return metadata
+
+    @staticmethod
+    def _filter_metadata(metadata: Dict[str, typing.Any]) -> Dict[str, typing.Any]:
+        # Images carry the filter fields as well, so filters are pushed down into photo searches too
+        return {key: metadata[key] for key in FILTER_FIELDS if key in metadata}
+
+    def _make_thumbnails(self, image_paths: typing.Iterable[str]) -> None:
+        """Pre-render the WebP variants the API serves, so result grids never load the originals"""
+
+        if not self.thumbnails:
+            return
+        for image_path in image_paths:
+            try:
+                make_thumbnails(Path(image_path))
+            except (OSError, ValueError) as e:
+                print(f"Could not create thumbnails of {image_path}: {e}")
+
+    def _download_images(self, flower) -> dict[str, Future]:
+        """Start the downloads of a flower's photos. A sync asks the server again for photos already on disk,
+        and downloads them anew when the slot's url differs from the one the stored image came from"""
+
+        stored = self.stored_hashes
+        flower_id = self._flower_id(asdict(flower)) if stored else None
+        pending_downloads = {}
         for i, image_url in enumerate(
                 [flower.image1_url, flower.image2_url, flower.image3_url, flower.image4_url], 1
         ):
             if image_url:
                 filename = self._create_safe_filename(flower.common_name, i)
-                downloaded_path = self._download_image(image_url, filename)
-                if downloaded_path:
-                    image_paths[f"image{i}_local_uri"] = downloaded_path
+                refresh = {}
+                if stored:
+                    stored_url = stored.image_urls.get(self._image_id(flower_id, f"image{i}"))
+                    refresh = {"refresh": True, "conditional": stored_url == image_url}
+                pending_downloads[f"image{i}_local_uri"] = self._download_image(image_url, filename, **refresh)
+        return pending_downloads
+
+    @staticmethod
+    def _collect_downloads(pending_downloads: dict[str, Future]) -> dict[str, str]:
+        """Wait for the image downloads of a flower and keep the ones that succeeded"""
+
+        image_paths = {}
+        for key, download in pending_downloads.items():
+            downloaded_path = download.result()
+            if downloaded_path:
+                image_paths[key] = downloaded_path
         return image_paths
 
     @staticmethod
-    def _slice_rows(reader: typing.Iterable, start: int, end: int) -> list:
-        rows = list(reader)
-        # Apply start/end slicing
-        if end is not None:
-            rows = rows[start:end]
-        else:
-            rows = rows[start:]
-        return rows
+    def _slice_rows(reader: typing.Iterable, start: int, end: Optional[int]) -> typing.Iterator:
+        # Lazily skip to start and stop at end, so the CSV is never held in memory
+        return itertools.islice(reader, start, end)
+
+    @staticmethod
+    def _batched(rows: typing.Iterable, batch_size: int) -> typing.Iterator[list]:
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, batch_size)):
+            yield batch
 
     @staticmethod
     def _join_text_fields(flower):
@@ -101,54 +226,204 @@ class FloraImporter:
                         f"Description: {flower.description}"
         return document_text
 
-    def _process_rows(self, rows, start):
-        for i, row in enumerate(rows):
-            flower, local_image_paths = self._process_row(row)
-            document_text = self._join_text_fields(flower)
-            flower_id = str(uuid.uuid4())
-            metadata = vars(flower)
-            metadata.update(local_image_paths)
-            # Write to the expected collections for tests
-            self._save_to_text_collection(flower_id, document_text, metadata)
-            self._save_images(flower_id, local_image_paths)
-            print(f"Processed {start + i}: {flower.common_name}")
+    def _process_rows(self, rows, start, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """Processes rows in batches and returns the number of rows processed"""
+
+        num_processed = 0
+        started_at = time.perf_counter()
+        in_flight = None
+        rows = self._pending_rows(rows)
+        for batch in itertools.chain(self._batched(rows, batch_size), [None]):
+            # Start the downloads of this batch before embedding the previous one, so the two overlap
+            pending = [self._process_row(row) for row in self._unique_rows(batch)] if batch else None
+            if in_flight:
+                self._save_batch(in_flight)
+                num_processed += len(in_flight)
+                rate = num_processed / max(time.perf_counter() - started_at, 1e-9)
+                print(f"Processed {num_processed} rows from row {start} ({rate:.1f} rows/sec)")
+            in_flight = pending
+        return num_processed
+
+    def _pending_rows(self, rows: typing.Iterable) -> typing.Iterator:
+        """Skip rows whose flower the checkpoint records as already imported"""
+
+        for row in rows:
+            flower_id = self._flower_id(row)
+            if flower_id is None:
+                print(f"Skipped a row without url, botanical or common name: {row.get('description', '')[:60]!r}")
+                self.num_without_id += 1
+                continue
+            if self.stored_hashes:
+                self.stored_hashes.seen_flora_ids.add(flower_id)
+            if self.checkpoint and self.checkpoint.is_done(flower_id):
+                self.num_skipped += 1
+            else:
+                yield row
+
+    def _unique_rows(self, batch: list) -> list:
+        """Rows of a batch with one row per flower id, the last one wins as a later row would overwrite it anyway.
+        A single write cannot hold an id twice"""
+        return list({self._flower_id(row): row for row in batch}.values())
+
+    def _save_batch(self, processed_rows: list[tuple[Flower, dict[str, Future]]]):
+        """Waits for the images of a batch and upserts the batch with a single write per collection.
+
+        When syncing, records whose content hash matches the stored one are not embedded again.
+        """
+
+        stored = self.stored_hashes
+        flower_ids, documents, metadata_list = [], [], []
+        unchanged_ids, unchanged_metadata_list = [], []
+        image_ids, image_uris, image_metadata_list = [], [], []
+        unchanged_image_ids, unchanged_image_metadata_list = [], []
+        stale_image_ids = []
+        image_ids_by_flower_id = {}
+        for flower, pending_downloads in processed_rows:
+            local_image_paths = self._collect_downloads(pending_downloads)
+            self._make_thumbnails(local_image_paths.values())
+            metadata = self._flower_metadata(flower, local_image_paths)
+            flower_id = self._flower_id(metadata)
+            document = self._join_text_fields(flower)
+            metadata["text_hash"] = self._hash_text(document)
+            if stored and stored.text.get(flower_id) == metadata["text_hash"]:
+                # Only the metadata is rewritten, which does not run the embedding function
+                unchanged_ids.append(flower_id)
+                unchanged_metadata_list.append(metadata)
+            else:
+                flower_ids.append(flower_id)
+                documents.append(document)
+                metadata_list.append(metadata)
+
+            ids, uris, metadatas = self._image_documents(flower_id, local_image_paths)
+            for key, image_id, uri, image_metadata in zip(local_image_paths, ids, uris, metadatas):
+                image_metadata.update(self._filter_metadata(metadata))
+                source_url = getattr(flower, f"{key.split('_', 1)[0]}_url")
+                if source_url:
+                    image_metadata["source_url"] = source_url
+                image_metadata["image_hash"] = self._hash_file(uri)
+                if stored and stored.images.get(image_id) == image_metadata["image_hash"]:
+                    # Filter fields may still have changed with the flower's text
+                    unchanged_image_ids.append(image_id)
+                    unchanged_image_metadata_list.append(image_metadata)
+                    continue
+                image_ids.append(image_id)
+                image_uris.append(uri)
+                image_metadata_list.append(image_metadata)
+            if stored:
+                # Only photos whose url left the CSV are stale, a failed download keeps the stored image
+                slot_ids = {self._image_id(flower_id, key.split('_', 1)[0]) for key in pending_downloads}
+                stale_image_ids.extend(stored.image_ids_by_flora_id.get(flower_id, set()) - slot_ids)
+            image_ids_by_flower_id[flower_id] = ids
+
+        self.num_unchanged += len(unchanged_ids)
+        self._save_to_text_collection(flower_ids, documents, metadata_list)
+        if unchanged_ids:
+            self.text_dao.update_metadata_batch(unchanged_ids, unchanged_metadata_list)
+        self._save_to_image_collection(image_ids, image_uris, image_metadata_list)
+        if unchanged_image_ids:
+            self.image_dao.update_metadata_batch(unchanged_image_ids, unchanged_image_metadata_list)
+        if stale_image_ids:
+            self.image_dao.delete(ids=stale_image_ids)
+        self._save_to_fused_collection(list(image_ids_by_flower_id))
+        if self.checkpoint:
+            self.checkpoint.mark_done(image_ids_by_flower_id)
 
     def _save_to_new_text_collection(self, document_id, document, metadata):
         from chroma import FloraTextOnlyDAO
         text_collection = FloraTextOnlyDAO(self.chromadb_client)
         text_collection.add_document(document_id, document, metadata)
 
-    def _save_to_text_collection(self, document_id, document, metadata):
-        text_collection = FloraTextDAO(self.chromadb_client)
-        text_collection.add_document(document_id, document, metadata)
+    def _save_to_text_collection(self, document_ids, documents, metadata_list):
+        if document_ids:
+            self.text_dao.upsert_documents_batch(document_ids, documents, metadata_list)
+
+    @staticmethod
+    def _image_id(flower_id: str, image_slot: str) -> str:
+        """Stable id of the image in a flower's slot (image1..image4)"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{flower_id}/{image_slot}"))
 
-    def _save_images(self, flower_id, image_paths: Dict[str, str]):
-        """Save all images paths for a flower in the DB"""
+    @classmethod
+    def _image_documents(cls, flower_id, image_paths: Dict[str, str]) -> tuple[list, list, list]:
+        """Build the image collection ids, uris and metadata for all images of a flower"""
 
         document_ids, uris, metadata_list = [], [], []
-        for path in image_paths.values():
-            document_ids.append(str(uuid.uuid4()))
+        for key, path in image_paths.items():
+            # Keys look like image1_local_uri, so the id is stable per flower and image slot
+            document_ids.append(cls._image_id(flower_id, key.split('_', 1)[0]))
             uris.append(path)
             metadata_list.append({"flora_id": flower_id})
-        self._save_to_image_collection(document_ids, uris, metadata_list)
+        return document_ids, uris, metadata_list
 
     def _save_to_image_collection(self, document_ids, image_uris, metadata_list):
-        image_collection = FloraImageDAO(self.chromadb_client)
-        image_collection.add_documents_batch(
-            document_ids=document_ids,
-            uris=image_uris,
-            metadata_list=metadata_list
+        if document_ids:
+            self.image_dao.upsert_documents_batch(
+                document_ids=document_ids,
+                uris=image_uris,
+                metadata_list=metadata_list
+            )
+
+    def _save_to_fused_collection(self, flower_ids):
+        # Fused vectors are derived from the embeddings just written, so they follow every text or image change
+        if flower_ids:
+            update_fused_embeddings(self.text_dao, self.image_dao, self.fused_dao, flower_ids)
+
+    def _load_stored_hashes(self) -> StoredHashes:
+        text = self.text_dao.get(limit=None, include=["metadatas"])
+        images = self.image_dao.get(limit=None, include=["metadatas"])
+        image_ids_by_flora_id = {}
+        for image_id, metadata in zip(images["ids"], images["metadatas"]):
+            image_ids_by_flora_id.setdefault(metadata["flora_id"], set()).add(image_id)
+        return StoredHashes(
+            text={flora_id: metadata.get("text_hash") for flora_id, metadata in zip(text["ids"], text["metadatas"])},
+            images={image_id: metadata.get("image_hash")
+                    for image_id, metadata in zip(images["ids"], images["metadatas"])},
+            image_ids_by_flora_id=image_ids_by_flora_id,
+            image_urls={image_id: metadata.get("source_url")
+                        for image_id, metadata in zip(images["ids"], images["metadatas"])},
         )
 
-    def import_data(self, start: int = 0, end: Optional[int] = None) -> int:
-        """ Reads the CSV file and processes each row into a flower and its images """
+    def _delete_missing_flowers(self) -> int:
+        """Delete flowers, and their images, that are stored but no longer present in the CSV"""
 
-        print(f"Starting import from {self.csv_file_path}")
+        missing_ids = list(self.stored_hashes.text.keys() - self.stored_hashes.seen_flora_ids)
+        if missing_ids:
+            self.text_dao.delete(ids=missing_ids)
+            self.image_dao.delete(where={"flora_id": {"$in": missing_ids}})
+            self.fused_dao.delete(ids=missing_ids)
+        return len(missing_ids)
+
+    def compress_collections(self, kind: Optional[str], **params) -> None:
+        """Fit and save the codecs the exact search engine scans before re-ranking, None stores vectors uncompressed"""
+
+        snapshot_dir = snapshot_dir_for(self.chromadb_client)
+        if snapshot_dir is None:
+            print("Skipped compression, the exact search engine needs a persistent ChromaDB")
+            return
+        for dao in (self.text_dao, self.image_dao, self.fused_dao):
+            path = write_codec(dao, snapshot_dir, kind, **params)
+            print(f"{dao.collection_name}: {'saved ' + str(path) if path else 'uncompressed'}")
+
+    def import_data(self, start: int = 0, end: Optional[int] = None,
+                    batch_size: int = DEFAULT_BATCH_SIZE, sync: bool = False) -> int:
+        """ Streams the CSV file and processes its rows in batches of flowers and their images.
+
+        With sync, only records whose text or image bytes changed are embedded again, and flowers
+        missing from the CSV are deleted (only when the whole file is imported).
+        """
+
+        print(f"Starting {'sync' if sync else 'import'} from {self.csv_file_path}")
+        self.stored_hashes = self._load_stored_hashes() if sync else None
         with open(self.csv_file_path, 'r', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             rows = self._slice_rows(reader, start, end)
-            self._process_rows(rows, start)
-            return len(rows)
+            num_processed = self._process_rows(rows, start, batch_size)
+
+        if sync:
+            if start == 0 and end is None:
+                print(f"Deleted {self._delete_missing_flowers()} flowers no longer in the CSV")
+            else:
+                print("Skipped deleting missing flowers, the sync did not cover the whole CSV")
+        return num_processed
 
 
 def main():
@@ -157,15 +432,66 @@ def main():
                         help='Path to the CSV file (default: foi_himalayan_flowers.csv)')
     parser.add_argument('--start', type=int, default=0, help='Start row index (default: 0)')
     parser.add_argument('--end', type=int, help='End row index (optional)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Rows embedded and written per batch (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--download-workers', type=int, default=8,
+                        help='Number of images downloaded in parallel (default: 8)')
+    parser.add_argument('--per-host-limit', type=int, default=4,
+                        help='Maximum parallel downloads from a single host (default: 4)')
     parser.add_argument('--no-download', action='store_true',
                         help='Skip downloading images that already exist locally')
+    parser.add_argument('--checkpoint', default='import_checkpoint.jsonl',
+                        help='Manifest of imported flowers (default: import_checkpoint.jsonl)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip flowers the checkpoint records as already imported')
+    parser.add_argument('--sync', action='store_true',
+                        help='Only re-embed changed rows and images, and delete flowers missing from the CSV')
+    parser.add_argument('--no-thumbnails', action='store_true',
+                        help='Skip rendering the WebP thumbnails served by the API')
+    parser.add_argument('--embedding-backend', choices=EMBEDDING_BACKENDS,
+                        help='CLIP runtime, overrides FLORA_EMBEDDING_BACKEND (default: torch)')
+    parser.add_argument('--onnx-model-dir', help='Models written by export_onnx_clip.py (default: models/clip-onnx)')
+    parser.add_argument('--embedding-threads', type=int, help='Intra-op threads of the CLIP runtime')
+    parser.add_argument('--embedding-cache', default='embedding_cache',
+                        help='Folder of cached embeddings, keyed by model and content, so unchanged texts and images '
+                             'are never embedded twice (default: embedding_cache)')
+    parser.add_argument('--no-embedding-cache', action='store_true', help='Embed everything with CLIP again')
+    parser.add_argument('--compression', choices=('none', *CODECS),
+                        help='Codes the exact search engine scans before re-ranking at full precision, '
+                             'none removes them (default: keep the current setting)')
+    parser.add_argument('--pca-dims', type=int, default=DEFAULT_PCA_DIMS,
+                        help=f'Dimensions kept by pca compression (default: {DEFAULT_PCA_DIMS})')
+    parser.add_argument('--pq-subspaces', type=int, default=DEFAULT_PQ_SUBSPACES,
+                        help=f'One byte codes per vector of pq compression (default: {DEFAULT_PQ_SUBSPACES})')
+    parser.add_argument('--hnsw', type=chroma.parse_hnsw_settings, default={},
+                        help='HNSW settings of collections this import creates, e.g. space=cosine,max_neighbors=32, '
+                             'overrides FLORA_HNSW (see tune_hnsw.py)')
 
     args = parser.parse_args()
 
+    chroma.configure_hnsw(**args.hnsw)
+    chroma.configure_embedding_backend(backend=args.embedding_backend, model_dir=args.onnx_model_dir,
+                                       intra_op_threads=args.embedding_threads)
     chromadb_client = chroma.client(persistent=True, path="../src/chroma")
-    importer = FloraImporter(args.csv_file, chromadb_client, download_images=not args.no_download)
-    num_imported = importer.import_data(start=args.start, end=args.end)
-    print(f"Import complete! {num_imported} entries added to DB.")
+    started_at = time.perf_counter()
+    with ImageDownloader(workers=args.download_workers, per_host_limit=args.per_host_limit) as downloader:
+        importer = FloraImporter(args.csv_file, chromadb_client, download_images=not args.no_download,
+                                 downloader=downloader,
+                                 checkpoint=ImportCheckpoint(args.checkpoint, resume=args.resume),
+                                 thumbnails=not args.no_thumbnails,
+                                 embedding_cache_dir=None if args.no_embedding_cache else args.embedding_cache)
+        num_imported = importer.import_data(start=args.start, end=args.end, batch_size=args.batch_size,
+                                            sync=args.sync)
+        if args.compression:
+            importer.compress_collections(None if args.compression == "none" else args.compression,
+                                          dims=args.pca_dims, subspaces=args.pq_subspaces)
+    elapsed = time.perf_counter() - started_at
+    print(f"Import complete! {num_imported} entries added to DB in {elapsed:.1f}s "
+          f"({num_imported / max(elapsed, 1e-9):.1f} rows/sec), {importer.num_skipped} already imported, "
+          f"{importer.num_unchanged} unchanged, {importer.num_without_id} without a url or name.")
+    if importer.embedding_function is not None:
+        cache_stats = importer.embedding_function.cache.stats()
+        print(f"Embedding cache: {cache_stats['hits']} embeddings reused, {cache_stats['misses']} computed")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import chromadb
+import numpy
+from chromadb.api.client import SharedSystemClient
+
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+import chroma
+from chroma import FloraFusedDAO, FloraImageDAO, FloraTextDAO
+from exact_search import load_collection
+
+SPACES = ("l2", "cosine", "ip")
+
+
+def brute_force_ids(matrix: numpy.ndarray, queries: numpy.ndarray, k: int, space: str) -> list:
+    """Ground truth: the k rows closest to every query in the given space, by scanning all of them"""
+    scores = queries @ matrix.T
+    if space == "cosine":
+        scores = scores / numpy.linalg.norm(matrix, axis=1) / numpy.linalg.norm(queries, axis=1, keepdims=True)
+    elif space == "l2":
+        scores = 2 * scores - (matrix * matrix).sum(axis=1)
+    return [list(row) for row in numpy.argsort(-scores, axis=1, kind="stable")[:, :k]]
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+
+def build_index(client, matrix: numpy.ndarray, space: str, max_neighbors: int, ef_construction: int):
+    collection = client.create_collection(
+        f"tune_{space}_{max_neighbors}_{ef_construction}", embedding_function=None,
+        configuration={"hnsw": {"space": space, "max_neighbors": max_neighbors, "ef_construction": ef_construction}})
+    ids = [str(row) for row in range(len(matrix))]
+    batch_size = client.get_max_batch_size()
+    for start in range(0, len(matrix), batch_size):
+        collection.add(ids=ids[start:start + batch_size], embeddings=matrix[start:start + batch_size])
+    return collection
+
+
+def reopened(path: str, name: str, ef_search: int):
+    """The index with another ef_search, which a loaded index ignores until it is opened again"""
+    chromadb.PersistentClient(path=path).get_collection(name).modify(configuration={"hnsw": {"ef_search": ef_search}})
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(path=path).get_collection(name)
+
+
+def measure(collection, queries: numpy.ndarray, expected: list, k: int) -> tuple:
+    """recall@k, p50 and p99 milliseconds of querying one at a time, as the API does"""
+    recalls, latencies = [], []
+    # Loads the index, which is not what a query costs
+    collection.query(query_embeddings=[queries[0]], n_results=k, include=[])
+    for query, expected_ids in zip(queries, expected):
+        started_at = time.perf_counter()
+        ids = collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]
+        latencies.append(time.perf_counter() - started_at)
+        recalls.append(len({int(i) for i in ids} & set(expected_ids)) / k)
+    return statistics.mean(recalls), percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def held_out_queries(args, chromadb_client, matrix: numpy.ndarray) -> tuple:
+    """Queries and the rows left to index: text queries embedded with CLIP, or a sample of description embeddings,
+    removed from the index when they come from the collection being tuned"""
+    if args.queries_file:
+        texts = [line.strip() for line in Path(args.queries_file).read_text().splitlines() if line.strip()]
+        return numpy.asarray(chroma.clip_embedding_function()(texts), dtype=numpy.float32), matrix
+    _, description_matrix, _ = load_collection(FloraTextDAO(chromadb_client), [])
+    rng = numpy.random.default_rng(0)
+    sample = rng.choice(len(description_matrix), min(args.queries, len(description_matrix)), replace=False)
+    if args.collection == "flora_text":
+        return description_matrix[sample], numpy.delete(matrix, sample, axis=0)
+    return description_matrix[sample], matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweeps HNSW index parameters over a copy of a collection and '
+                                                 'reports recall@k against brute force with query latency')
+    parser.add_argument('--collection', choices=['flora_images', 'flora_text', 'flora_fused'], default='flora_images',
+                        help='Collection whose embeddings are indexed (default: flora_images)')
+    parser.add_argument('--queries-file', help='Text queries, one per line, embedded with CLIP '
+                                               '(default: a sample of the description embeddings)')
+    parser.add_argument('--queries', type=int, default=200, help='Sampled description queries (default: 200)')
+    parser.add_argument('--k', type=int, default=10, help='Results per query (default: 10)')
+    parser.add_argument('--spaces', nargs='+', choices=SPACES, default=['l2', 'cosine'],
+                        help='Distance functions (default: %(default)s)')
+    parser.add_argument('--max-neighbors', type=int, nargs='+', default=[8, 16, 32],
+                        help='Graph degrees, M (default: %(default)s)')
+    parser.add_argument('--ef-construction', type=int, nargs='+', default=[100, 200],
+                        help='Candidate lists while building (default: %(default)s)')
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[10, 20, 50, 100, 200],
+                        help='Candidate lists while searching (default: %(default)s)')
+    args = parser.parse_args()
+
+    chromadb_client = chroma.client(persistent=True, path="../src/chroma")
+    dao = {"flora_images": FloraImageDAO, "flora_text": FloraTextDAO,
+           "flora_fused": FloraFusedDAO}[args.collection](chromadb_client)
+    _, matrix, _ = load_collection(dao, [])
+    queries, matrix = held_out_queries(args, chromadb_client, matrix)
+    print(f"{len(matrix)} vectors of {args.collection}, {len(queries)} queries, k={args.k}")
+
+    print(f"{'space':>6} {'M':>4} {'ef_con':>6} {'build s':>8} {'ef_search':>9} "
+          f"{'recall@' + str(args.k):>9} {'p50 ms':>7} {'p99 ms':>7}")
+    for space in args.spaces:
+        expected = brute_force_ids(matrix, queries, args.k, space)
+        for max_neighbors, ef_construction in itertools.product(args.max_neighbors, args.ef_construction):
+            # Copies are built in a temporary folder, the persisted collections keep their index
+            with tempfile.TemporaryDirectory() as sweep_path:
+                started_at = time.perf_counter()
+                name = build_index(chromadb.PersistentClient(path=sweep_path), matrix, space, max_neighbors,
+                                   ef_construction).name
+                build_seconds = time.perf_counter() - started_at
+                for ef_search in args.ef_search:
+                    recall, p50, p99 = measure(reopened(sweep_path, name, ef_search), queries, expected, args.k)
+                    print(f"{space:>6} {max_neighbors:4d} {ef_construction:6d} {build_seconds:8.2f} {ef_search:9d} "
+                          f"{recall:9.3f} {p50:7.2f} {p99:7.2f}")
+                SharedSystemClient.clear_system_cache()
+    print("Apply the chosen settings with FLORA_HNSW_<COLLECTION>, e.g. "
+          "FLORA_HNSW_FLORA_IMAGES=space=cosine,max_neighbors=32,ef_construction=200,ef_search=50. "
+          "ef_search applies on the next start, the others once the collection is deleted and imported again")
+
+
+if __name__ == "__main__":
+    main()
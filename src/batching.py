@@ -0,0 +1,66 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Generic, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects items submitted concurrently from many threads and processes them together.
+
+    A batch is closed once it holds `max_batch_size` items or `max_wait_ms` after its first item arrived,
+    whichever comes first. `process_batch` receives the items and must return one result per item.
+    """
+
+    def __init__(self, process_batch: Callable[[List[T]], List[R]], max_batch_size: int = 8,
+                 max_wait_ms: float = 5):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_batches = 0
+        self.num_items = 0
+        self._queue: "queue.Queue[tuple[T, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: T) -> R:
+        """Queue an item and block until its batch has been processed"""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: List[T]) -> List[R]:
+        """Queue several items at once, so they usually land in the same batch, and wait for all of them"""
+        futures = []
+        for item in items:
+            future: Future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[tuple[T, Future]]) -> None:
+        self.num_batches += 1
+        self.num_items += len(batch)
+        try:
+            results: List[Any] = self.process_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries also expire `ttl_seconds` after they were stored.
+
+    Hits, misses and evictions are counted so the cache can be sized from real traffic.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PerceptualHashCache:
+    """Thread safe LRU cache of image embeddings keyed on a perceptual hash of the image.
+
+    Keys are a 64 bit difference hash and a colour signature (one quantised colour per grid cell). A lookup
+    that misses the exact key falls back to the closest stored hash within `max_distance` differing bits whose
+    colours are each within `max_color_distance` levels, so re-compressed or slightly edited copies of an image
+    still hit while the same shapes in other colours do not. The cache is capped by the memory its embeddings
+    use rather than by a number of entries.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_distance: int = 4, max_color_distance: int = 1):
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.max_color_distance = max_color_distance
+        self.nbytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[int, bytes], numpy.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[int, bytes]) -> Optional[numpy.ndarray]:
+        with self._lock:
+            found = key if key in self._entries else self._nearest(key)
+            if found is None:
+                self.misses += 1
+                return None
+            if found == key:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            self._entries.move_to_end(found)
+            return self._entries[found]
+
+    def _nearest(self, key: Tuple[int, bytes]) -> Optional[Tuple[int, bytes]]:
+        image_hash, color = key
+        colors = numpy.frombuffer(color, dtype=numpy.uint8).astype(numpy.int16)
+        best_key, best_distance = None, self.max_distance + 1
+        for stored_key in self._entries:
+            distance = (stored_key[0] ^ image_hash).bit_count()
+            if distance < best_distance and self._colors_match(colors, stored_key[1]):
+                best_key, best_distance = stored_key, distance
+        return best_key
+
+    def _colors_match(self, colors: numpy.ndarray, stored_color: bytes) -> bool:
+        stored_colors = numpy.frombuffer(stored_color, dtype=numpy.uint8)
+        if len(stored_colors) != len(colors):
+            return False
+        return not len(colors) or int(numpy.abs(colors - stored_colors).max()) <= self.max_color_distance
+
+    def put(self, key: Tuple[int, bytes], embedding) -> None:
+        embedding = numpy.asarray(embedding, dtype=numpy.float32)
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = embedding
+            self.nbytes += embedding.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
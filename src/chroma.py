@@ -1,12 +1,35 @@
+import itertools
+import os
+from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 import chromadb
+import numpy
 from chromadb import ClientAPI, EmbeddingFunction
 from chromadb.config import Settings
 from chromadb.utils.data_loaders import ImageLoader
-from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction, DefaultEmbeddingFunction
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+from embedding_backends import create_clip_embedding_function
 
 _chromadb_client = None
+_clip_embedding_function = None
+# CLIP runs on eager PyTorch (torch) or as an exported, int8 quantized graph on ONNX Runtime (onnx), see README
+_embedding_backend = {
+    "backend": os.getenv("FLORA_EMBEDDING_BACKEND", "torch"),
+    "model_dir": os.getenv("FLORA_ONNX_MODEL_DIR", "models/clip-onnx"),
+    "quantized": os.getenv("FLORA_ONNX_QUANTIZED", "1") == "1",
+    "intra_op_threads": int(os.getenv("FLORA_EMBEDDING_THREADS", "0")) or None,
+}
+# HNSW index settings of every collection (FLORA_HNSW) or of one (FLORA_HNSW_FLORA_IMAGES), as comma separated
+# key=value pairs, e.g. "space=cosine,max_neighbors=32,ef_construction=200,ef_search=64"
+HNSW_PARAMETERS = {"space": str, "max_neighbors": int, "ef_construction": int, "ef_search": int}
+# Fixed once a collection is created, changing them needs the collection deleted and imported again
+HNSW_BUILD_PARAMETERS = ("space", "max_neighbors", "ef_construction")
+_hnsw_overrides: Dict[Optional[str], Dict[str, Any]] = {}
+# Counts writes made through the DAOs in this process, the last one per collection, see FloraBase.data_version
+_local_writes = itertools.count(1)
+_last_local_writes: Dict[str, int] = {}
 
 
 def client(persistent: bool = True, path="chroma") -> ClientAPI:
@@ -19,24 +42,118 @@ def client(persistent: bool = True, path="chroma") -> ClientAPI:
     return _chromadb_client
 
 
+def configure_embedding_backend(**options) -> None:
+    """Overrides the FLORA_EMBEDDING_* environment settings, must be called before the model is first used"""
+    if _clip_embedding_function is not None:
+        raise RuntimeError("The CLIP embedding function is already loaded")
+    _embedding_backend.update({key: value for key, value in options.items() if value is not None})
+
+
+def parse_hnsw_settings(value: str) -> Dict[str, Any]:
+    settings = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        key, _, setting = pair.partition("=")
+        key = key.strip()
+        if key not in HNSW_PARAMETERS:
+            raise ValueError(f"Unknown HNSW parameter {key!r}, expected one of: {', '.join(HNSW_PARAMETERS)}")
+        settings[key] = HNSW_PARAMETERS[key](setting.strip())
+    return settings
+
+
+def configure_hnsw(collection_name: Optional[str] = None, **settings) -> None:
+    """Overrides the FLORA_HNSW* environment settings of one collection, or of all of them, for collections
+    opened from now on"""
+    unknown = settings.keys() - HNSW_PARAMETERS.keys()
+    if unknown:
+        raise ValueError(f"Unknown HNSW parameters: {', '.join(sorted(unknown))}")
+    _hnsw_overrides.setdefault(collection_name, {}).update(
+        {key: value for key, value in settings.items() if value is not None})
+
+
+def hnsw_settings(collection_name: str) -> Dict[str, Any]:
+    """HNSW settings of a collection, per collection settings win over those of all collections"""
+    return {
+        **parse_hnsw_settings(os.getenv("FLORA_HNSW", "")),
+        **_hnsw_overrides.get(None, {}),
+        **parse_hnsw_settings(os.getenv(f"FLORA_HNSW_{collection_name.upper()}", "")),
+        **_hnsw_overrides.get(collection_name, {}),
+    }
+
+
+def clip_embedding_function() -> EmbeddingFunction:
+    """Returns the process wide CLIP embedding function of the configured backend, loading the model on first use."""
+    global _clip_embedding_function
+    if _clip_embedding_function is None:
+        _clip_embedding_function = create_clip_embedding_function(**_embedding_backend)
+    return _clip_embedding_function
+
+
+def warm_up() -> None:
+    """Loads the shared CLIP model and runs a dummy text and image embedding, so the first real query of either
+    kind does not pay for lazy initialization."""
+    clip_embedding_function()(["warm up", numpy.zeros((224, 224, 3), dtype=numpy.uint8)])
+
+
 class FloraBase:
     def __init__(self, collection_name, chromadb_client,
                  embedding_function: EmbeddingFunction,
                  data_loader=None):
         self.collection_name = collection_name
         self.client = chromadb_client
+        self.embedding_function = embedding_function
+        self.data_loader = data_loader
+        # Touched on every write so other processes (the API while an import runs) notice the change
+        settings = chromadb_client.get_settings()
+        self.write_marker = Path(settings.persist_directory) / f"{collection_name}.updated" \
+            if settings.is_persistent else None
+        self.hnsw = hnsw_settings(collection_name)
         self.collection = self.client.get_or_create_collection(
             self.collection_name,
+            configuration={"hnsw": self.hnsw} if self.hnsw else None,
             embedding_function=embedding_function,
             data_loader=data_loader
         )
+        self._apply_hnsw_settings()
+
+    def _apply_hnsw_settings(self) -> None:
+        """Settings only take effect when a collection is created, so an existing one gets the ef_search it is
+        configured with, and a reminder when its build settings differ"""
+        current = self.hnsw_configuration()
+        if "ef_search" in self.hnsw and current.get("ef_search") != self.hnsw["ef_search"]:
+            self.collection.modify(configuration={"hnsw": {"ef_search": self.hnsw["ef_search"]}})
+        stale = {key: current.get(key) for key in HNSW_BUILD_PARAMETERS
+                 if key in self.hnsw and current.get(key) != self.hnsw[key]}
+        if stale:
+            print(f"{self.collection_name} was built with {stale}, delete it and import again to use "
+                  f"{ {key: self.hnsw[key] for key in stale} }")
+
+    def hnsw_configuration(self) -> Dict[str, Any]:
+        return dict((self.collection.configuration or {}).get("hnsw") or {})
+
+    def _record_write(self) -> None:
+        _last_local_writes[self.collection_name] = next(_local_writes)
+        if self.write_marker:
+            self.write_marker.touch()
+
+    def data_version(self) -> tuple:
+        """Changes whenever this collection is written, in this process or another one sharing the directory"""
+        try:
+            marker_mtime = self.write_marker.stat().st_mtime_ns if self.write_marker else 0
+        except FileNotFoundError:
+            marker_mtime = 0
+        return _last_local_writes.get(self.collection_name, 0), marker_mtime
 
     def delete_collection(self) -> None:
         self.client.delete_collection(name=self.collection_name)
+        self._record_write()
 
     def get_collection_count(self) -> int:
         return self.collection.count()
 
+    def distance_space(self) -> str:
+        """Distance function of the collection's index: l2 (squared), cosine or ip"""
+        return self.hnsw_configuration().get("space") or "l2"
+
     def query(
             self,
             query_text: str,
@@ -50,13 +167,29 @@ class FloraBase:
         )
         return results
 
+    def query_embeddings(
+            self,
+            query_embeddings: list,
+            n_results: int = 5,
+            where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Search with already computed embeddings, one result list per embedding"""
+
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+        )
+        return results
+
     def get(
             self,
             ids: list = None,
-            limit: int = 10,
+            limit: Optional[int] = 10,
             offset: int = 0,
             where: Optional[Dict[str, Any]] = None,
-            where_document: Optional[Dict[str, Any]] = None
+            where_document: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         results = self.collection.get(
             ids=ids,
@@ -64,15 +197,31 @@ class FloraBase:
             offset=offset,
             where=where,
             where_document=where_document,
+            include=include or ["metadatas", "documents"],
         )
         return results
 
+    def update_metadata_batch(self, ids: List[str], metadata_list: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of existing documents without re-embedding them"""
+
+        self.collection.update(ids=ids, metadatas=metadata_list)
+        self._record_write()
+
+    def delete(
+            self,
+            ids: Optional[List[str]] = None,
+            where: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.collection.delete(ids=ids, where=where)
+        self._record_write()
+
 
 class FloraTextDAO(FloraBase):
     """Class to interact with collection that stores Flower text and text embeddings"""
 
-    def __init__(self, chromadb_client):
-        super().__init__("flora_text", chromadb_client, embedding_function=OpenCLIPEmbeddingFunction())
+    def __init__(self, chromadb_client, embedding_function: Optional[EmbeddingFunction] = None):
+        super().__init__("flora_text", chromadb_client,
+                         embedding_function=embedding_function or clip_embedding_function())
 
     def add_document(
             self,
@@ -85,13 +234,30 @@ class FloraTextDAO(FloraBase):
             documents=[document],
             metadatas=[metadata]
         )
+        self._record_write()
+
+    def upsert_documents_batch(
+            self,
+            document_ids: List[str],
+            documents: List[str],
+            metadata_list: List[Dict[str, Any]]
+    ) -> None:
+        """Add multiple documents, replacing any already stored under the same ids"""
+
+        self.collection.upsert(
+            ids=document_ids,
+            documents=documents,
+            metadatas=metadata_list
+        )
+        self._record_write()
 
 
 class FloraImageDAO(FloraBase):
     """Interacts with collection that stores Flower image urls and image embeddings"""
 
-    def __init__(self, chromadb_client):
-        super().__init__("flora_images", chromadb_client, embedding_function=OpenCLIPEmbeddingFunction(),
+    def __init__(self, chromadb_client, embedding_function: Optional[EmbeddingFunction] = None):
+        super().__init__("flora_images", chromadb_client,
+                         embedding_function=embedding_function or clip_embedding_function(),
                          data_loader=ImageLoader())
 
     def add_document(
@@ -105,6 +271,7 @@ class FloraImageDAO(FloraBase):
             uris=[uri],
             metadatas=[metadata]
         )
+        self._record_write()
 
     def add_documents_batch(
             self,
@@ -120,6 +287,24 @@ class FloraImageDAO(FloraBase):
             uris=uris,
             metadatas=metadata_list
         )
+        self._record_write()
+
+    def upsert_documents_batch(
+            self,
+            document_ids: List[str],
+            uris: List[str],
+            metadata_list: List[Dict[str, Any]]
+    ) -> None:
+        """Add multiple documents, replacing any already stored under the same ids"""
+
+        # Unlike add, Chroma's upsert does not load uris itself, so the images are loaded here
+        self.collection.upsert(
+            ids=document_ids,
+            images=self.data_loader(uris),
+            uris=uris,
+            metadatas=metadata_list
+        )
+        self._record_write()
 
     def query(
             self,
@@ -131,7 +316,21 @@ class FloraImageDAO(FloraBase):
             query_images=[query_img],
             n_results=n_results,
             where=where,
-            include=["metadatas", "uris"]
+            include=["metadatas", "uris", "distances"]
+        )
+        return results
+
+    def query_embeddings(
+            self,
+            query_embeddings: list,
+            n_results: int = 5,
+            where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["metadatas", "uris", "distances"]
         )
         return results
 
@@ -153,3 +352,27 @@ class FloraTextOnlyDAO(FloraBase):
             documents=[document],
             metadatas=[metadata]
         )
+        self._record_write()
+
+
+class FloraFusedDAO(FloraBase):
+    """Interacts with collection that stores one fused text and image embedding per Flower with its full metadata"""
+
+    def __init__(self, chromadb_client, embedding_function: Optional[EmbeddingFunction] = None):
+        super().__init__("flora_fused", chromadb_client,
+                         embedding_function=embedding_function or clip_embedding_function())
+
+    def upsert_embeddings_batch(
+            self,
+            document_ids: List[str],
+            embeddings: List[numpy.ndarray],
+            metadata_list: List[Dict[str, Any]]
+    ) -> None:
+        """Store precomputed embeddings, replacing any already stored under the same ids"""
+
+        self.collection.upsert(
+            ids=document_ids,
+            embeddings=embeddings,
+            metadatas=metadata_list
+        )
+        self._record_write()
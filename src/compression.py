@@ -0,0 +1,160 @@
+from pathlib import Path
+from typing import Dict
+
+import numpy
+
+CODECS = ("float16", "pca", "pq")
+DEFAULT_PCA_DIMS = 128
+DEFAULT_PQ_SUBSPACES = 64
+# Centroids per product quantizer subspace, so every code is one byte
+PQ_CENTROIDS = 256
+PQ_ITERATIONS = 20
+# k-means of the product quantizer is trained on at most this many vectors
+PQ_TRAINING_ROWS = 20000
+# Rows of a float16 or PQ matrix widened to float32 at a time
+CHUNK_ROWS = 16384
+
+
+class Float16Codec:
+    """Stores vectors as float16, half the memory of float32 with nearly unchanged inner products"""
+
+    kind = "float16"
+
+    def encode(self, matrix: numpy.ndarray) -> numpy.ndarray:
+        return numpy.asarray(matrix, dtype=numpy.float16)
+
+    def decode(self, codes: numpy.ndarray) -> numpy.ndarray:
+        return numpy.asarray(codes, dtype=numpy.float32)
+
+    def inner_products(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        return numpy.concatenate([self.decode(codes[start:start + CHUNK_ROWS]) @ queries.T
+                                  for start in range(0, len(codes), CHUNK_ROWS)]).T
+
+    def arrays(self) -> Dict[str, numpy.ndarray]:
+        return {}
+
+    @classmethod
+    def from_arrays(cls, _arrays) -> "Float16Codec":
+        return cls()
+
+
+class PCACodec:
+    """Projects vectors onto their top principal components, keeping `dims` float32 values per vector"""
+
+    kind = "pca"
+
+    def __init__(self, mean: numpy.ndarray, components: numpy.ndarray):
+        self.mean = numpy.asarray(mean, dtype=numpy.float32)
+        self.components = numpy.asarray(components, dtype=numpy.float32)
+
+    @classmethod
+    def fit(cls, matrix: numpy.ndarray, dims: int = DEFAULT_PCA_DIMS) -> "PCACodec":
+        mean = matrix.mean(axis=0)
+        _, _, components = numpy.linalg.svd(matrix - mean, full_matrices=False)
+        return cls(mean, components[:dims])
+
+    def encode(self, matrix: numpy.ndarray) -> numpy.ndarray:
+        return ((matrix - self.mean) @ self.components.T).astype(numpy.float32)
+
+    def decode(self, codes: numpy.ndarray) -> numpy.ndarray:
+        return codes @ self.components + self.mean
+
+    def inner_products(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        # q . (mean + c P) = q . mean + c . (P q)
+        return (codes @ (queries @ self.components.T).T).T + (queries @ self.mean)[:, None]
+
+    def arrays(self) -> Dict[str, numpy.ndarray]:
+        return {"mean": self.mean, "components": self.components}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "PCACodec":
+        return cls(arrays["mean"], arrays["components"])
+
+
+class ProductQuantizer:
+    """Splits vectors into `subspaces` slices and stores each slice as the byte index of its nearest of 256
+    k-means centroids. Inner products with a query are sums of per-slice lookup tables."""
+
+    kind = "pq"
+
+    def __init__(self, centroids: numpy.ndarray):
+        # (subspaces, centroids, slice dimensions)
+        self.centroids = numpy.asarray(centroids, dtype=numpy.float32)
+
+    @classmethod
+    def fit(cls, matrix: numpy.ndarray, subspaces: int = DEFAULT_PQ_SUBSPACES, iterations: int = PQ_ITERATIONS,
+            seed: int = 0) -> "ProductQuantizer":
+        if matrix.shape[1] % subspaces:
+            raise ValueError(f"{matrix.shape[1]} dimensions cannot be split into {subspaces} subspaces")
+        rng = numpy.random.default_rng(seed)
+        matrix = numpy.asarray(matrix, dtype=numpy.float32)
+        if len(matrix) > PQ_TRAINING_ROWS:
+            matrix = matrix[rng.choice(len(matrix), PQ_TRAINING_ROWS, replace=False)]
+        num_centroids = min(PQ_CENTROIDS, len(matrix))
+        centroids = []
+        for part in numpy.split(matrix, subspaces, axis=1):
+            part_centroids = part[rng.choice(len(part), num_centroids, replace=False)]
+            for _ in range(iterations):
+                assignment = cls._nearest(part, part_centroids)
+                counts = numpy.bincount(assignment, minlength=num_centroids)
+                sums = numpy.zeros_like(part_centroids)
+                numpy.add.at(sums, assignment, part)
+                # Centroids left without members keep their position
+                filled = counts > 0
+                part_centroids[filled] = sums[filled] / counts[filled, None]
+            centroids.append(part_centroids)
+        return cls(numpy.stack(centroids))
+
+    @staticmethod
+    def _nearest(part: numpy.ndarray, centroids: numpy.ndarray) -> numpy.ndarray:
+        squared = (centroids * centroids).sum(axis=1) - 2 * part @ centroids.T
+        return squared.argmin(axis=1)
+
+    def encode(self, matrix: numpy.ndarray) -> numpy.ndarray:
+        parts = numpy.split(numpy.asarray(matrix, dtype=numpy.float32), len(self.centroids), axis=1)
+        return numpy.stack([self._nearest(part, centroids) for part, centroids in zip(parts, self.centroids)],
+                           axis=1).astype(numpy.uint8)
+
+    def decode(self, codes: numpy.ndarray) -> numpy.ndarray:
+        return self.centroids[numpy.arange(len(self.centroids)), codes].reshape(len(codes), -1)
+
+    def inner_products(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        parts = queries.reshape(len(queries), len(self.centroids), -1)
+        # (queries, subspaces, centroids) table of slice inner products
+        tables = numpy.einsum("qsd,scd->qsc", parts, self.centroids)
+        scores = numpy.zeros((len(queries), len(codes)), dtype=numpy.float32)
+        for subspace in range(len(self.centroids)):
+            scores += tables[:, subspace, codes[:, subspace]]
+        return scores
+
+    def arrays(self) -> Dict[str, numpy.ndarray]:
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "ProductQuantizer":
+        return cls(arrays["centroids"])
+
+
+CODEC_CLASSES = {codec.kind: codec for codec in (Float16Codec, PCACodec, ProductQuantizer)}
+
+
+def fit_codec(kind: str, matrix: numpy.ndarray, dims: int = DEFAULT_PCA_DIMS,
+              subspaces: int = DEFAULT_PQ_SUBSPACES):
+    if kind == "float16":
+        return Float16Codec()
+    if kind == "pca":
+        return PCACodec.fit(matrix, dims)
+    if kind == "pq":
+        return ProductQuantizer.fit(matrix, subspaces)
+    raise ValueError(f"Unknown codec {kind!r}, expected one of: {', '.join(CODECS)}")
+
+
+def save_codec(path: Path, codec) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:
+        numpy.savez(file, kind=numpy.array(codec.kind), **codec.arrays())
+
+
+def load_codec(path: Path):
+    with numpy.load(path) as arrays:
+        return CODEC_CLASSES[str(arrays["kind"])].from_arrays(arrays)
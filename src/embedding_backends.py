@@ -0,0 +1,165 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy
+from chromadb import EmbeddingFunction
+from chromadb.api.types import Embeddable, Embeddings, is_document, is_image
+from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+from PIL import Image
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+CLIP_MODEL_NAME = "ViT-B-32"
+CLIP_CHECKPOINT = "laion2b_s34b_b79k"
+CLIP_IMAGE_SIZE = 224
+CLIP_CONTEXT_LENGTH = 77
+# Normalization of open_clip's image transform for the OpenAI CLIP family
+CLIP_MEAN = numpy.array([0.48145466, 0.4578275, 0.40821073], dtype=numpy.float32)
+CLIP_STD = numpy.array([0.26862954, 0.26130258, 0.27577711], dtype=numpy.float32)
+# Files written by scripts/export_onnx_clip.py
+TEXT_MODEL_FILE = "clip_text.onnx"
+IMAGE_MODEL_FILE = "clip_image.onnx"
+QUANTIZED_SUFFIX = "_int8"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def normalized_embeddings(embeddings: Embeddings, positions: List[int], features: numpy.ndarray) -> None:
+    """Store L2 normalized float32 features at their positions of the embedding list"""
+    features = numpy.asarray(features, dtype=numpy.float32)
+    features = features / numpy.linalg.norm(features, axis=-1, keepdims=True)
+    for position, feature in zip(positions, features):
+        embeddings[position] = feature
+
+
+class BatchedOpenCLIPEmbeddingFunction(OpenCLIPEmbeddingFunction):
+    """OpenCLIP embedding function that encodes all texts, and all images, of a call in a single forward pass"""
+
+    def __init__(self, intra_op_threads: Optional[int] = None):
+        super().__init__(model_name=CLIP_MODEL_NAME, checkpoint=CLIP_CHECKPOINT, device="cpu")
+        if intra_op_threads:
+            self._torch.set_num_threads(intra_op_threads)
+
+    @staticmethod
+    def model_id() -> str:
+        return f"torch:{CLIP_MODEL_NAME}:{CLIP_CHECKPOINT}"
+
+    def __call__(self, input: Embeddable) -> Embeddings:
+        embeddings: Embeddings = [None] * len(input)
+        text_positions = [i for i, item in enumerate(input) if is_document(item)]
+        image_positions = [i for i, item in enumerate(input) if is_image(item)]
+        with self._torch.no_grad():
+            if text_positions:
+                tokens = self._tokenizer([input[i] for i in text_positions]).to(self.device)
+                normalized_embeddings(embeddings, text_positions, self._model.encode_text(tokens).cpu().numpy())
+            if image_positions:
+                pixels = self._torch.stack(
+                    [self._preprocess(self._PILImage.fromarray(input[i])) for i in image_positions]
+                ).to(self.device)
+                normalized_embeddings(embeddings, image_positions, self._model.encode_image(pixels).cpu().numpy())
+        return embeddings
+
+
+def clip_preprocess(pixels: numpy.ndarray, size: int = CLIP_IMAGE_SIZE) -> numpy.ndarray:
+    """NumPy port of open_clip's eval transform: bicubic resize of the shorter side to `size`, center crop,
+    scale to [0, 1] and normalize. Returns a CHW float32 array."""
+
+    image = Image.fromarray(pixels).convert("RGB")
+    width, height = image.size
+    # Same rounding as torchvision's Resize and CenterCrop, so both backends see the same pixels
+    if width <= height:
+        resized = (size, int(size * height / width))
+    else:
+        resized = (int(size * width / height), size)
+    image = image.resize(resized, Image.Resampling.BICUBIC)
+    left = int(round((resized[0] - size) / 2.0))
+    top = int(round((resized[1] - size) / 2.0))
+    image = image.crop((left, top, left + size, top + size))
+    array = numpy.asarray(image, dtype=numpy.float32) / 255.0
+    return ((array - CLIP_MEAN) / CLIP_STD).transpose(2, 0, 1)
+
+
+def pad_token_ids(token_ids: Sequence[Sequence[int]], context_length: int = CLIP_CONTEXT_LENGTH) -> numpy.ndarray:
+    """Pad with zeros, or truncate keeping the end of text token last, as open_clip's tokenizer does"""
+    padded = numpy.zeros((len(token_ids), context_length), dtype=numpy.int64)
+    for row, ids in enumerate(token_ids):
+        ids = list(ids)
+        if len(ids) > context_length:
+            ids = ids[:context_length - 1] + [ids[-1]]
+        padded[row, :len(ids)] = ids
+    return padded
+
+
+class OnnxCLIPEmbeddingFunction(EmbeddingFunction[Embeddable]):
+    """The same CLIP model as BatchedOpenCLIPEmbeddingFunction, exported to ONNX, graph optimized and by default
+    int8 quantized, running on ONNX Runtime without torch.
+
+    Embeddings live in the same space as the torch backend's, so it reports the same name and config to Chroma
+    and both can be used on the same collections.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: Optional[int] = None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ValueError("The onnxruntime python package is not installed. Please install it with "
+                             "`pip install onnxruntime`")
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ValueError("The tokenizers python package is not installed. Please install it with "
+                             "`pip install tokenizers`")
+
+        model_dir = Path(model_dir)
+        self.quantized = quantized
+        suffix = QUANTIZED_SUFFIX if quantized else ""
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # One request is a single batched graph run, so all threads go to the operators rather than to
+        # running independent graph branches
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+
+        def session(file_name: str):
+            path = model_dir / file_name.replace(".onnx", f"{suffix}.onnx")
+            return onnxruntime.InferenceSession(str(path), sess_options=options, providers=providers)
+
+        self._text_session = session(TEXT_MODEL_FILE)
+        self._image_session = session(IMAGE_MODEL_FILE)
+        self._tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+
+    def __call__(self, input: Embeddable) -> Embeddings:
+        embeddings: Embeddings = [None] * len(input)
+        text_positions = [i for i, item in enumerate(input) if is_document(item)]
+        image_positions = [i for i, item in enumerate(input) if is_image(item)]
+        if text_positions:
+            encodings = self._tokenizer.encode_batch([input[i].lower() for i in text_positions])
+            tokens = pad_token_ids([encoding.ids for encoding in encodings])
+            features = self._text_session.run(None, {"input_ids": tokens})[0]
+            normalized_embeddings(embeddings, text_positions, features)
+        if image_positions:
+            pixels = numpy.stack([clip_preprocess(input[i]) for i in image_positions])
+            features = self._image_session.run(None, {"pixel_values": pixels})[0]
+            normalized_embeddings(embeddings, image_positions, features)
+        return embeddings
+
+    @staticmethod
+    def name() -> str:
+        return OpenCLIPEmbeddingFunction.name()
+
+    def model_id(self) -> str:
+        # Quantized and fp32 graphs embed slightly differently, so they are told apart
+        return f"onnx:{CLIP_MODEL_NAME}:{CLIP_CHECKPOINT}:{'int8' if self.quantized else 'fp32'}"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": CLIP_MODEL_NAME, "checkpoint": CLIP_CHECKPOINT, "device": "cpu"}
+
+
+def create_clip_embedding_function(backend: str = "torch", model_dir: Optional[str] = None, quantized: bool = True,
+                                   intra_op_threads: Optional[int] = None) -> EmbeddingFunction:
+    if backend == "torch":
+        return BatchedOpenCLIPEmbeddingFunction(intra_op_threads=intra_op_threads)
+    if backend == "onnx":
+        return OnnxCLIPEmbeddingFunction(model_dir, quantized=quantized, intra_op_threads=intra_op_threads)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of: {', '.join(EMBEDDING_BACKENDS)}")
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy
+from chromadb import EmbeddingFunction
+from chromadb.api.types import Embeddable, Embeddings
+
+DIGEST_SIZE = 32
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+MODEL_FILE = "model.json"
+
+
+def content_digest(item: Any) -> bytes:
+    """sha256 of a text's UTF-8 bytes or of an image's pixels and shape, tagged so the two never collide"""
+    if isinstance(item, str):
+        return hashlib.sha256(b"text\0" + item.encode("utf-8")).digest()
+    pixels = numpy.ascontiguousarray(item)
+    digest = hashlib.sha256(b"image\0" + str((pixels.shape, pixels.dtype.str)).encode())
+    digest.update(pixels.data)
+    return digest.digest()
+
+
+def embedding_model_id(embedding_function: EmbeddingFunction) -> str:
+    """Identifies the weights and runtime behind an embedding function, embeddings of different ids never mix"""
+    model_id = getattr(embedding_function, "model_id", None)
+    if callable(model_id):
+        return model_id()
+    return f"{type(embedding_function).__module__}.{type(embedding_function).__qualname__}"
+
+
+class EmbeddingCache:
+    """Append-only on-disk store of one model's embeddings, keyed by the digest of the embedded content.
+
+    Each model gets its own folder holding two files that only ever grow: the float32 vectors, read back
+    through a memory map, and the 32 byte digests in the same order. Vectors are appended before their
+    digests, so a write cut short leaves at most a vector without a key, which is dropped on the next open.
+    """
+
+    def __init__(self, directory: Path, model_id: str):
+        self.model_id = model_id
+        self.directory = Path(directory) / hashlib.sha256(model_id.encode()).hexdigest()[:16]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.dimensions: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[numpy.ndarray] = None
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self) -> None:
+        model_path = self.directory / MODEL_FILE
+        if not model_path.exists():
+            return
+        self.dimensions = json.loads(model_path.read_text())["dimensions"]
+        keys = (self.directory / KEYS_FILE).read_bytes() if (self.directory / KEYS_FILE).exists() else b""
+        vectors_path = self.directory / VECTORS_FILE
+        num_vectors = vectors_path.stat().st_size // (4 * self.dimensions) if vectors_path.exists() else 0
+        num_rows = min(len(keys) // DIGEST_SIZE, num_vectors)
+        # Cut off the tail of an interrupted write, so the next append lines vectors and keys up again
+        if vectors_path.exists():
+            os.truncate(vectors_path, num_rows * 4 * self.dimensions)
+        if (self.directory / KEYS_FILE).exists():
+            os.truncate(self.directory / KEYS_FILE, num_rows * DIGEST_SIZE)
+        self._rows = {keys[row * DIGEST_SIZE:(row + 1) * DIGEST_SIZE]: row for row in range(num_rows)}
+
+    def _vector(self, row: int) -> numpy.ndarray:
+        if self._vectors is None or row >= len(self._vectors):
+            # Remap after appends, the map covers every row written so far
+            self._vectors = numpy.memmap(self.directory / VECTORS_FILE, dtype=numpy.float32, mode="r",
+                                         shape=(len(self._rows), self.dimensions))
+        return numpy.array(self._vectors[row])
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, digests: List[bytes]) -> List[Optional[numpy.ndarray]]:
+        with self._lock:
+            embeddings = [self._vector(self._rows[d]) if d in self._rows else None for d in digests]
+            found = sum(embedding is not None for embedding in embeddings)
+            self.hits += found
+            self.misses += len(digests) - found
+            return embeddings
+
+    def put_many(self, digests: List[bytes], embeddings: List[Any]) -> None:
+        with self._lock:
+            new = {d: numpy.asarray(e, dtype=numpy.float32) for d, e in zip(digests, embeddings) if d not in self._rows}
+            if not new:
+                return
+            if self.dimensions is None:
+                self.dimensions = len(next(iter(new.values())))
+                (self.directory / MODEL_FILE).write_text(
+                    json.dumps({"model_id": self.model_id, "dimensions": self.dimensions}))
+            with open(self.directory / VECTORS_FILE, "ab") as vectors_file:
+                vectors_file.write(numpy.stack(list(new.values())).tobytes())
+            with open(self.directory / KEYS_FILE, "ab") as keys_file:
+                keys_file.write(b"".join(new))
+            for digest in new:
+                self._rows[digest] = len(self._rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Embeddable]):
+    """Serves embeddings of texts and images seen before from an EmbeddingCache and embeds only the rest,
+    in one call of the wrapped function. Chroma sees the wrapped function's name and config."""
+
+    def __init__(self, embedding_function: EmbeddingFunction, directory: Path):
+        self.embedding_function = embedding_function
+        self.cache = EmbeddingCache(directory, embedding_model_id(embedding_function))
+
+    def __call__(self, input: Embeddable) -> Embeddings:
+        digests = [content_digest(item) for item in input]
+        embeddings = self.cache.get_many(digests)
+        missing = [position for position, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self.embedding_function([input[position] for position in missing])
+            self.cache.put_many([digests[position] for position in missing], computed)
+            for position, embedding in zip(missing, computed):
+                embeddings[position] = numpy.asarray(embedding, dtype=numpy.float32)
+        return embeddings
+
+    def name(self) -> str:
+        return self.embedding_function.name()
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.embedding_function.get_config()
+
+    def is_legacy(self) -> bool:
+        return self.embedding_function.is_legacy()
+
+    def default_space(self):
+        return self.embedding_function.default_space()
+
+    def supported_spaces(self):
+        return self.embedding_function.supported_spaces()
@@ -0,0 +1,352 @@
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy
+
+from cache import TTLCache
+from chroma import FloraBase
+from compression import fit_codec, load_codec, save_codec
+
+SEARCH_ENGINES = ("chroma", "exact")
+EXACT_DTYPES = ("float32", "float16")
+# float16 rows are widened to float32 this many at a time, numpy has no fast float16 matrix product
+FLOAT16_CHUNK_ROWS = 16384
+DEFAULT_PAGE_SIZE = 2048
+# With compressed codes, n_results * RERANK_FACTOR candidates (at least MIN_RERANK) are re-ranked at full precision
+RERANK_FACTOR = 4
+MIN_RERANK = 32
+SNAPSHOT_DIRECTORY = "exact"
+
+
+def snapshot_dir_for(chromadb_client) -> Optional[Path]:
+    """Folder of the exact engine's matrices and codecs, next to the data of a persistent client"""
+    settings = chromadb_client.get_settings()
+    return Path(settings.persist_directory) / SNAPSHOT_DIRECTORY if settings.is_persistent else None
+
+
+def codec_path(snapshot_dir: Path, collection_name: str) -> Path:
+    return snapshot_dir / f"{collection_name}.codec.npz"
+
+
+def load_collection(dao: FloraBase, include: List[str], page_size: int = DEFAULT_PAGE_SIZE) -> tuple:
+    """ids, float32 embedding matrix (rows normalized for the cosine space) and the included fields of a collection"""
+    ids, embeddings, extras = [], [], {key: [] for key in include}
+    offset = 0
+    while True:
+        page = dao.get(limit=page_size, offset=offset, include=["embeddings", *include])
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+        for key in include:
+            extras[key].extend(page[key])
+        offset += len(page["ids"])
+
+    matrix = numpy.asarray(embeddings, dtype=numpy.float32).reshape(len(ids), -1) if ids \
+        else numpy.zeros((0, 0), dtype=numpy.float32)
+    if dao.distance_space() == "cosine":
+        norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / numpy.where(norms > 0, norms, 1)
+    return ids, matrix, extras
+
+
+def stored_codec(snapshot_dir: Optional[Path], collection_name: str):
+    """The codec the importer saved for a collection, None when it is stored uncompressed"""
+    if snapshot_dir is None or not codec_path(snapshot_dir, collection_name).exists():
+        return None
+    return load_codec(codec_path(snapshot_dir, collection_name))
+
+
+def write_codec(dao: FloraBase, snapshot_dir: Path, kind: Optional[str], **params) -> Optional[Path]:
+    """Fit a codec of `kind` to the stored embeddings and save it for the exact engine, None removes the codec"""
+    path = codec_path(snapshot_dir, dao.collection_name)
+    if kind is None:
+        path.unlink(missing_ok=True)
+        return None
+    _, matrix, _ = load_collection(dao, [])
+    if not len(matrix):
+        return None
+    save_codec(path, fit_codec(kind, matrix, **params))
+    return path
+
+
+def where_mask(columns: Dict[str, numpy.ndarray], num_rows: int, where: Optional[Dict[str, Any]]) -> numpy.ndarray:
+    """Rows whose metadata matches a Chroma where filter, evaluated over per-field object arrays"""
+    if not where:
+        return numpy.ones(num_rows, dtype=bool)
+    masks = []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            sub_masks = [where_mask(columns, num_rows, sub_where) for sub_where in condition]
+            masks.append(numpy.logical_and.reduce(sub_masks) if key == "$and" else numpy.logical_or.reduce(sub_masks))
+            continue
+        column = columns.get(key)
+        if column is None:
+            column = numpy.full(num_rows, None, dtype=object)
+        operator, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+        masks.append(_compare(column, operator, value))
+    return numpy.logical_and.reduce(masks)
+
+
+def _compare(column: numpy.ndarray, operator: str, value: Any) -> numpy.ndarray:
+    if operator == "$eq":
+        return numpy.asarray(column == value, dtype=bool)
+    if operator == "$ne":
+        return numpy.asarray(column != value, dtype=bool)
+    if operator in ("$in", "$nin"):
+        values = set(value)
+        mask = numpy.fromiter((item in values for item in column), dtype=bool, count=len(column))
+        return mask if operator == "$in" else ~mask
+    comparisons = {"$gt": numpy.greater, "$gte": numpy.greater_equal, "$lt": numpy.less, "$lte": numpy.less_equal}
+    if operator not in comparisons:
+        raise ValueError(f"Unsupported where operator {operator!r}")
+    # Rows without the field never match an ordering comparison
+    present = numpy.fromiter((item is not None for item in column), dtype=bool, count=len(column))
+    mask = numpy.zeros(len(column), dtype=bool)
+    mask[present] = comparisons[operator](column[present], value).astype(bool)
+    return mask
+
+
+@dataclass(slots=True)
+class LoadedEmbeddings:
+    """Arrays of one load of a collection, replaced as a whole when the index reloads"""
+    data_version: tuple
+    ids: List[str]
+    extras: Dict[str, list]
+    matrix: numpy.ndarray
+    squared_norms: numpy.ndarray
+    columns: Dict[str, numpy.ndarray]
+    codes: Optional[numpy.ndarray] = None
+    code_squared_norms: Optional[numpy.ndarray] = None
+    group_order: Optional[numpy.ndarray] = None
+    group_starts: Optional[numpy.ndarray] = None
+    mask_cache: TTLCache = field(default_factory=lambda: TTLCache(maxsize=256))
+
+
+class ExactIndex:
+    """Every embedding of one collection in a contiguous matrix, searched exactly with one matrix product per batch
+    of queries instead of a round trip to Chroma's HNSW index.
+
+    Metadata filters are evaluated in NumPy over per-field columns. With `group_by`, rows sharing that metadata
+    field (the photos of one flower) are collapsed to their closest row before ranking, so n results are always
+    n distinct groups. `refresh` reloads the index when the collection's data version changed, the API calls it
+    periodically so imports are picked up without a query ever waiting for a reload.
+
+    Results have the shape and distance space of the collection's own query results. With `snapshot_dir` the
+    matrix is written there and memory-mapped back, so worker processes share one copy through the page cache.
+
+    With a `codec` (see compression.py) queries first scan compact codes in memory, then only the best
+    candidates are re-ranked against the full precision rows, which stay on disk when memory-mapped. A
+    `rerank_factor` of 0 skips the second stage and returns the approximate distances.
+    """
+
+    def __init__(self, dao: FloraBase, include: List[str], group_by: Optional[str] = None,
+                 dtype: str = "float32", snapshot_dir: Optional[Path] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                 codec=None, rerank_factor: int = RERANK_FACTOR):
+        if dtype not in EXACT_DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}, expected one of: {', '.join(EXACT_DTYPES)}")
+        self.dao = dao
+        self.include = include
+        self.group_by = group_by
+        self.dtype = numpy.dtype(dtype)
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.page_size = page_size
+        self.codec = codec
+        self.rerank_factor = rerank_factor
+        self.space = dao.distance_space()
+        # Only guards swapping in the arrays of a reload, queries take the current ones and search them unlocked
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded: Optional[LoadedEmbeddings] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._current().ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes scanned by every query: the codes when compressed, the full matrix otherwise"""
+        loaded = self._current()
+        return loaded.codes.nbytes if loaded.codes is not None else loaded.matrix.nbytes
+
+    @property
+    def data_version(self) -> Optional[tuple]:
+        """Data version of the collection when the loaded embeddings were read"""
+        return self._current().data_version
+
+    def refresh(self) -> bool:
+        """Reload the embeddings if the collection was written since they were loaded"""
+        with self._refresh_lock:
+            if self.dao.data_version() == self._current().data_version:
+                return False
+            self._load()
+            return True
+
+    def _current(self) -> LoadedEmbeddings:
+        with self._lock:
+            return self._loaded
+
+    def _load(self) -> None:
+        data_version = self.dao.data_version()
+        # Metadatas are always loaded, where filters are evaluated over them
+        ids, matrix, extras = load_collection(self.dao, list(dict.fromkeys(["metadatas", *self.include])),
+                                              self.page_size)
+        codes = code_squared_norms = None
+        if self.codec is not None and len(matrix):
+            codes = self.codec.encode(matrix)
+            decoded = self.codec.decode(codes)
+            code_squared_norms = numpy.einsum("ij,ij->i", decoded, decoded)
+        matrix = matrix.astype(self.dtype)
+        stored = matrix.astype(numpy.float32)
+        squared_norms = numpy.einsum("ij,ij->i", stored, stored)
+        metadatas = extras.get("metadatas") or [{}] * len(ids)
+        fields = {key for metadata in metadatas for key in (metadata or {})}
+        columns = {name: numpy.array([(metadata or {}).get(name) for metadata in metadatas], dtype=object)
+                   for name in fields}
+        loaded = LoadedEmbeddings(data_version, ids, extras, self._store(matrix), squared_norms, columns,
+                                  codes, code_squared_norms)
+        if self.group_by:
+            groups = columns.get(self.group_by, numpy.full(len(ids), None, dtype=object))
+            group_values, group_codes = numpy.unique(groups.astype(str), return_inverse=True)
+            # Rows sorted by group, the group minimum is one reduceat over each query's distances
+            loaded.group_order = numpy.argsort(group_codes, kind="stable")
+            loaded.group_starts = numpy.searchsorted(group_codes[loaded.group_order], numpy.arange(len(group_values)))
+        with self._lock:
+            self._loaded = loaded
+
+    def _store(self, matrix: numpy.ndarray) -> numpy.ndarray:
+        if self.snapshot_dir is None or not len(matrix):
+            return numpy.ascontiguousarray(matrix)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        path = self.snapshot_dir / f"{self.dao.collection_name}.{self.dtype.name}.npy"
+        # Processes loading at once (API workers, the benchmark) each write their own temporary file, the last rename
+        # wins and nobody maps a half written snapshot
+        with tempfile.NamedTemporaryFile(dir=self.snapshot_dir, prefix=f".{path.stem}.", suffix=".part",
+                                         delete=False) as partial_file:
+            try:
+                numpy.save(partial_file, matrix)
+            except BaseException:
+                os.unlink(partial_file.name)
+                raise
+        os.replace(partial_file.name, path)
+        return numpy.load(path, mmap_mode="r")
+
+    def _mask(self, loaded: LoadedEmbeddings, where: Optional[Dict[str, Any]]) -> Optional[numpy.ndarray]:
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        mask = loaded.mask_cache.get(key)
+        if mask is None:
+            mask = where_mask(loaded.columns, len(loaded.ids), where)
+            loaded.mask_cache.put(key, mask)
+        return mask
+
+    def _queries(self, query_embeddings: list) -> numpy.ndarray:
+        queries = numpy.asarray(query_embeddings, dtype=numpy.float32).reshape(len(query_embeddings), -1)
+        if self.space == "cosine":
+            norms = numpy.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / numpy.where(norms > 0, norms, 1)
+        return queries
+
+    def _as_distances(self, queries: numpy.ndarray, scores: numpy.ndarray,
+                      squared_norms: numpy.ndarray) -> numpy.ndarray:
+        """Inner products to distances of the collection's space (l2 is squared, as in Chroma)"""
+        if self.space in ("cosine", "ip"):
+            return 1 - scores
+        squared = numpy.einsum("ij,ij->i", queries, queries)[:, None] + squared_norms - 2 * scores
+        return numpy.maximum(squared, 0)
+
+    def _scores(self, matrix: numpy.ndarray, queries: numpy.ndarray) -> numpy.ndarray:
+        # Multiplying the row-major matrix from the left streams it through BLAS once, faster than queries @ matrix.T
+        if self.dtype == numpy.float32:
+            return (matrix @ queries.T).T
+        return numpy.concatenate(
+            [numpy.asarray(matrix[start:start + FLOAT16_CHUNK_ROWS], dtype=numpy.float32) @ queries.T
+             for start in range(0, len(matrix), FLOAT16_CHUNK_ROWS)]).T
+
+    def distances(self, query_embeddings: list, loaded: Optional[LoadedEmbeddings] = None) -> numpy.ndarray:
+        """Full precision distance of every stored row to every query"""
+        loaded = loaded or self._current()
+        queries = self._queries(query_embeddings)
+        return self._as_distances(queries, self._scores(loaded.matrix, queries), loaded.squared_norms)
+
+    def approximate_distances(self, query_embeddings: list,
+                              loaded: Optional[LoadedEmbeddings] = None) -> numpy.ndarray:
+        """Distance of every stored row's codes to every query, the first stage of a compressed search"""
+        loaded = loaded or self._current()
+        queries = self._queries(query_embeddings)
+        return self._as_distances(queries, self.codec.inner_products(queries, loaded.codes),
+                                  loaded.code_squared_norms)
+
+    def _reranked_distances(self, loaded: LoadedEmbeddings, query_embeddings: list, mask: Optional[numpy.ndarray],
+                            n_results: int) -> numpy.ndarray:
+        """Approximate distances narrow each query down to its best candidates, only those get the full precision
+        distance and every other row stays at infinity"""
+        approximate = self.approximate_distances(query_embeddings, loaded)
+        if not self.rerank_factor:
+            return approximate
+        if mask is not None:
+            approximate[:, ~mask] = numpy.inf
+        if self.group_by:
+            approximate = numpy.minimum.reduceat(approximate[:, loaded.group_order], loaded.group_starts, axis=1)
+        num_candidates = min(max(n_results * self.rerank_factor, MIN_RERANK), approximate.shape[1])
+        queries = self._queries(query_embeddings)
+        distances = numpy.full((len(queries), len(loaded.ids)), numpy.inf, dtype=numpy.float32)
+        for row, query in enumerate(queries):
+            candidates = numpy.argpartition(approximate[row], num_candidates - 1)[:num_candidates] \
+                if num_candidates < approximate.shape[1] else numpy.arange(approximate.shape[1])
+            rows = numpy.sort(numpy.concatenate([self._group_rows(loaded, group) for group in candidates])
+                              if self.group_by else candidates)
+            # Sorted rows read a memory-mapped matrix front to back
+            scores = numpy.asarray(loaded.matrix[rows], dtype=numpy.float32) @ query
+            distances[row, rows] = self._as_distances(query[None], scores[None], loaded.squared_norms[rows])[0]
+        return distances
+
+    def query_embeddings(self, query_embeddings: list, n_results: int = 5,
+                         where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Same contract as FloraBase.query_embeddings, one result list per query embedding"""
+        # Searched without the lock, a reload meanwhile swaps in new arrays and leaves these untouched
+        loaded = self._current()
+        results: Dict[str, Any] = {"ids": [], "distances": [], **{key: [] for key in self.include}}
+        if not loaded.ids:
+            for values in results.values():
+                values.extend([] for _ in query_embeddings)
+            return results
+
+        mask = self._mask(loaded, where)
+        distances = self.distances(query_embeddings, loaded) if self.codec is None \
+            else self._reranked_distances(loaded, query_embeddings, mask, n_results)
+        if mask is not None:
+            distances[:, ~mask] = numpy.inf
+        if self.group_by:
+            candidates = numpy.minimum.reduceat(distances[:, loaded.group_order], loaded.group_starts, axis=1)
+        else:
+            candidates = distances
+        k = min(n_results, candidates.shape[1])
+        for row, query_distances in enumerate(distances):
+            top = numpy.argpartition(candidates[row], k - 1)[:k] if k < candidates.shape[1] \
+                else numpy.arange(candidates.shape[1])
+            top = top[numpy.argsort(candidates[row, top], kind="stable")]
+            top = top[numpy.isfinite(candidates[row, top])]
+            positions = [self._closest_in_group(loaded, query_distances, group) for group in top] if self.group_by \
+                else top.tolist()
+            results["ids"].append([loaded.ids[p] for p in positions])
+            results["distances"].append(query_distances[positions].tolist())
+            for key in self.include:
+                results[key].append([loaded.extras[key][p] for p in positions])
+        return results
+
+    @staticmethod
+    def _group_rows(loaded: LoadedEmbeddings, group: int) -> numpy.ndarray:
+        end = loaded.group_starts[group + 1] if group + 1 < len(loaded.group_starts) else len(loaded.group_order)
+        return loaded.group_order[loaded.group_starts[group]:end]
+
+    @classmethod
+    def _closest_in_group(cls, loaded: LoadedEmbeddings, query_distances: numpy.ndarray, group: int) -> int:
+        rows = cls._group_rows(loaded, group)
+        return int(rows[numpy.argmin(query_distances[rows])])
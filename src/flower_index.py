@@ -0,0 +1,80 @@
+import hashlib
+import json
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from chroma import FloraTextDAO
+from models import Flower
+from search import FLOWER_FIELDS
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+@dataclass(slots=True)
+class IndexedFlower:
+    flora_id: str
+    flower: Flower
+    etag: str
+
+
+def flower_etag(flower: Flower) -> str:
+    return hashlib.blake2b(json.dumps(asdict(flower), sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+class FlowerIndex:
+    """In-memory copy of the flower metadata in flora_text, keyed by flora id and by botanical name.
+
+    Lookups are dictionary reads that never touch Chroma or the embedding model. `refresh` re-reads the
+    metadata only when the text collection reports a new data version, and swaps in only the flowers
+    whose content changed.
+    """
+
+    def __init__(self, text_dao: FloraTextDAO, page_size: int = DEFAULT_PAGE_SIZE):
+        self.text_dao = text_dao
+        self.page_size = page_size
+        self._by_id: Dict[str, IndexedFlower] = {}
+        self._by_botanical_name: Dict[str, IndexedFlower] = {}
+        self._data_version = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, flora_id: str) -> Optional[IndexedFlower]:
+        return self._by_id.get(flora_id)
+
+    def get_by_botanical_name(self, botanical_name: str) -> Optional[IndexedFlower]:
+        return self._by_botanical_name.get(" ".join(botanical_name.lower().split()))
+
+    def refresh(self) -> int:
+        """Bring the index up to date with flora_text, returns the number of flowers added, changed or removed"""
+
+        with self._lock:
+            data_version = self.text_dao.data_version()
+            if data_version == self._data_version:
+                return 0
+            by_id, num_changed = {}, 0
+            offset = 0
+            while True:
+                page = self.text_dao.get(limit=self.page_size, offset=offset, include=["metadatas"])
+                for flora_id, metadata in zip(page["ids"], page["metadatas"]):
+                    flower = Flower(**{k: v for k, v in metadata.items() if k in FLOWER_FIELDS}, id=flora_id)
+                    etag = flower_etag(flower)
+                    previous = self._by_id.get(flora_id)
+                    if previous is not None and previous.etag == etag:
+                        by_id[flora_id] = previous
+                    else:
+                        by_id[flora_id] = IndexedFlower(flora_id, flower, etag)
+                        num_changed += 1
+                if len(page["ids"]) < self.page_size:
+                    break
+                offset += self.page_size
+            num_changed += len(self._by_id.keys() - by_id.keys())
+
+            # Readers see either the old or the new dictionaries, never a half updated one
+            self._by_botanical_name = {" ".join(entry.flower.botanical_name.lower().split()): entry
+                                       for entry in by_id.values() if entry.flower.botanical_name}
+            self._by_id = by_id
+            self._data_version = data_version
+            return num_changed
@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy
+
+from chroma import FloraFusedDAO, FloraImageDAO, FloraTextDAO
+
+# Share of the description in a flower's fused embedding, the photos share the rest equally
+DEFAULT_TEXT_WEIGHT = 0.5
+DEFAULT_BATCH_SIZE = 256
+
+
+def _unit(vector) -> numpy.ndarray:
+    vector = numpy.asarray(vector, dtype=numpy.float32)
+    norm = numpy.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def fuse_embeddings(text_embedding, image_embeddings: Sequence,
+                    text_weight: float = DEFAULT_TEXT_WEIGHT) -> numpy.ndarray:
+    """Weighted mean of a flower's normalized CLIP text embedding and the mean of its normalized photo embeddings.
+
+    Both live in the same CLIP space, so the result can be searched with either a text or an image query.
+    """
+    fused = _unit(text_embedding)
+    if len(image_embeddings):
+        photos = _unit(numpy.mean([_unit(e) for e in image_embeddings], axis=0))
+        fused = text_weight * fused + (1 - text_weight) * photos
+    return _unit(fused)
+
+
+def update_fused_embeddings(text_dao: FloraTextDAO, image_dao: FloraImageDAO, fused_dao: FloraFusedDAO,
+                            flora_ids: Optional[List[str]] = None, text_weight: float = DEFAULT_TEXT_WEIGHT,
+                            batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Recompute the fused embeddings of flora_ids, or of every stored flower, from the stored embeddings.
+
+    No model runs here, the text and photo embeddings are read back from their collections. Returns the
+    number of flowers written.
+    """
+    if flora_ids is not None:
+        return sum(_update_batch(text_dao, image_dao, fused_dao, flora_ids[i:i + batch_size], text_weight)
+                   for i in range(0, len(flora_ids), batch_size))
+
+    num_updated, offset = 0, 0
+    while True:
+        ids = text_dao.get(limit=batch_size, offset=offset, include=[])["ids"]
+        if not ids:
+            break
+        num_updated += _update_batch(text_dao, image_dao, fused_dao, ids, text_weight)
+        offset += len(ids)
+    return num_updated
+
+
+def _update_batch(text_dao: FloraTextDAO, image_dao: FloraImageDAO, fused_dao: FloraFusedDAO,
+                  flora_ids: List[str], text_weight: float) -> int:
+    if not flora_ids:
+        return 0
+    texts = text_dao.get(flora_ids, limit=None, include=["embeddings", "metadatas"])
+    images = image_dao.get(where={"flora_id": {"$in": list(flora_ids)}}, limit=None,
+                           include=["embeddings", "metadatas"])
+    image_embeddings: Dict[str, list] = {}
+    for metadata, embedding in zip(images["metadatas"], images["embeddings"]):
+        image_embeddings.setdefault(metadata["flora_id"], []).append(embedding)
+
+    embeddings = [fuse_embeddings(text_embedding, image_embeddings.get(flora_id, []), text_weight)
+                  for flora_id, text_embedding in zip(texts["ids"], texts["embeddings"])]
+    if embeddings:
+        fused_dao.upsert_embeddings_batch(list(texts["ids"]), embeddings, list(texts["metadatas"]))
+    return len(embeddings)
+
+
+def delete_orphaned_fused_embeddings(text_dao: FloraTextDAO, fused_dao: FloraFusedDAO) -> int:
+    """Delete fused embeddings of flowers that are no longer in the text collection"""
+
+    orphaned_ids = list(set(fused_dao.get(limit=None, include=[])["ids"])
+                        - set(text_dao.get(limit=None, include=[])["ids"]))
+    if orphaned_ids:
+        fused_dao.delete(ids=orphaned_ids)
+    return len(orphaned_ids)
@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+
+class InferenceQueueFull(Exception):
+    """Raised when more inference calls are waiting than the executor accepts"""
+
+
+class InferenceExecutor:
+    """Runs blocking CLIP inference off the event loop on a dedicated, sized thread pool.
+
+    At most `workers` calls run at once and at most `max_queue` more wait for a worker. Calls beyond
+    that are rejected straight away with InferenceQueueFull, so callers can shed load instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        # Only touched from the event loop thread, so the counter needs no lock
+        if self.pending >= self.workers + self.max_queue:
+            raise InferenceQueueFull()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
@@ -1,16 +1,110 @@
+import asyncio
+import io
+import os
+from contextlib import asynccontextmanager
 from dataclasses import asdict
-from typing import Optional
+from pathlib import Path
+from typing import List, Optional
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, HTTPException, Form, File, Header, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 
 import chroma
-from search import SearchService
+from flower_index import FlowerIndex
+from inference import InferenceExecutor, InferenceQueueFull
+from payloads import parse_fields, project
+from search import IMAGE_FUSIONS, SEARCH_MODES, InvalidCursor, SearchService, build_where
+from startup import Startup
+from thumbnails import THUMBNAIL_SIZES, file_etag, make_thumbnail, thumbnail_path
 
 MAX_IMG_SIZE = 4 * 1024 * 1024
+MAX_PAGE_SIZE = 100
+# Photos of one flower accepted by a single search, all embedded in one batched pass
+MAX_QUERY_IMAGES = 8
+# Set FLORA_WARM_UP=0 to skip the dummy CLIP text and image forward pass at startup, the first search then pays for it
+WARM_UP = os.getenv("FLORA_WARM_UP", "1") == "1"
+# Searches running CLIP at once, and searches allowed to wait for them before new ones get a 503
+INFERENCE_WORKERS = int(os.getenv("FLORA_INFERENCE_WORKERS", "8"))
+INFERENCE_QUEUE = int(os.getenv("FLORA_INFERENCE_QUEUE", "16"))
+# Concurrent searches are embedded together, up to this many per batch or after waiting this long.
+# A batch size of 1 disables batching.
+BATCH_MAX_SIZE = int(os.getenv("FLORA_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("FLORA_BATCH_MAX_WAIT_MS", "5"))
+# Entries kept in each of the text embedding and search result caches, and how long they stay valid
+CACHE_SIZE = int(os.getenv("FLORA_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("FLORA_CACHE_TTL_SECONDS", "3600"))
+# Memory cap of the cache of image query embeddings, keyed on a perceptual hash of the upload
+IMAGE_CACHE_MB = float(os.getenv("FLORA_IMAGE_CACHE_MB", "32"))
+# chroma searches the collections' HNSW indexes, exact loads every embedding into memory and scans it
+SEARCH_ENGINE = os.getenv("FLORA_SEARCH_ENGINE", "chroma")
+EXACT_DTYPE = os.getenv("FLORA_EXACT_DTYPE", "float32")
+# Candidates per wanted result re-ranked at full precision when the importer compressed a collection
+EXACT_RERANK_FACTOR = int(os.getenv("FLORA_EXACT_RERANK_FACTOR", "4"))
+# How often the in-memory flower index and exact engine check their collections for imported changes, and how long
+# clients may cache flower details
+INDEX_REFRESH_SECONDS = float(os.getenv("FLORA_INDEX_REFRESH_SECONDS", "30"))
+FLOWER_MAX_AGE_SECONDS = int(os.getenv("FLORA_FLOWER_MAX_AGE_SECONDS", "300"))
+# Downloaded flower photos (see README), their WebP variants are kept in img/thumbs/
+IMG_DIRECTORY = Path(os.getenv("FLORA_IMG_DIR", "img"))
+IMAGE_MAX_AGE_SECONDS = int(os.getenv("FLORA_IMAGE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
 
-app = FastAPI()
+
+def open_chroma():
+    app.chromadb_client = chroma.client()
+
+
+def load_search_service():
+    # Opens the collections and loads the CLIP weights, which imports torch and open_clip
+    app.search_service = SearchService(app.chromadb_client, max_batch_size=BATCH_MAX_SIZE,
+                                       max_wait_ms=BATCH_MAX_WAIT_MS, cache_size=CACHE_SIZE,
+                                       cache_ttl_seconds=CACHE_TTL_SECONDS,
+                                       image_cache_bytes=int(IMAGE_CACHE_MB * 1024 * 1024),
+                                       engine=SEARCH_ENGINE, exact_dtype=EXACT_DTYPE,
+                                       rerank_factor=EXACT_RERANK_FACTOR)
+
+
+def load_flower_index():
+    app.flower_index = FlowerIndex(app.search_service.text_dao)
+    app.flower_index.refresh()
+
+
+def startup_steps():
+    steps = [("chroma", open_chroma), ("search_service", load_search_service), ("flower_index", load_flower_index)]
+    if WARM_UP:
+        steps.append(("warm_up", chroma.warm_up))
+    return steps
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Startup runs in the background so the port is bound at once, /readyz tells when searches can be served
+    app.startup = Startup(startup_steps())
+    startup_task = asyncio.create_task(asyncio.to_thread(app.startup.run))
+    refresh_task = asyncio.create_task(refresh_indexes())
+    yield
+    refresh_task.cancel()
+    startup_task.cancel()
+    app.inference.shutdown()
+
+
+async def refresh_indexes():
+    """Pick up imports, the flower index and exact indexes are only re-read when their collection was written to"""
+    while not app.startup.ready.is_set():
+        await asyncio.sleep(1)
+    while True:
+        await asyncio.sleep(INDEX_REFRESH_SECONDS)
+        for refresh in (app.flower_index.refresh, app.search_service.refresh_exact_indexes):
+            try:
+                await asyncio.to_thread(refresh)
+            except Exception as e:
+                print(e)
+
+
+# orjson serializes the plain dicts and lists the endpoints return several times faster than the json module
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Enable CORS for local development and simple personal usage
 app.add_middleware(
@@ -21,40 +115,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.chromadb_client = chroma.client()
-app.search_service = SearchService(app.chromadb_client)
 
-form_default = Form(default=None)
+class PayloadGZipMiddleware(GZipMiddleware):
+    """Compresses API payloads. Photos are already compressed, so they skip it and keep their zero-copy responses"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/images/"):
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+app.add_middleware(PayloadGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+app.inference = InferenceExecutor(workers=INFERENCE_WORKERS, max_queue=INFERENCE_QUEUE)
+
+# FastAPI stores the parameter's name (its alias) and annotation on the Form object, so every parameter needs its own
+q_default = Form(default=None)
+family_default = Form(default=None)
+region_default = Form(default=None)
+color_default = Form(default=None)
+min_images_default = Form(default=None)
+cursor_default = Form(default=None)
+fields_default = Form(default=None)
 file_default = File(default=None)
+mode_default = Form(default="text")
+fusion_default = Form(default="rrf")
+limit_default = Form(default=20)
+header_default = Header(default=None)
 
 
+# Cheap endpoints are async so they are served on the event loop and never wait behind inference
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World", "And": "we are on..."}
 
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness, the process serves requests. Only a failed startup makes it unhealthy"""
+    if app.startup.error:
+        raise HTTPException(status_code=503, detail=app.startup.error)
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness, searches can be served because Chroma is open and CLIP is loaded (and warm)"""
+    status = app.startup.status()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+def require_ready():
+    if not app.startup.ready.is_set():
+        raise HTTPException(status_code=503, detail="Starting up, try again shortly", headers={"Retry-After": "5"})
+
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    require_ready()
+    return app.search_service.cache_stats()
+
+
 @app.get("/flowers/{id}")
-def get_flower(id: int):
-    return {"flower_id": id}
+async def get_flower(id: str, response: Response, if_none_match: Optional[str] = header_default):
+    """Flower details by flora id or botanical name, served from the in-memory index"""
+    require_ready()
+    entry = app.flower_index.get(id) or app.flower_index.get_by_botanical_name(id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Flower not found")
+
+    headers = {"ETag": f'"{entry.etag}"', "Cache-Control": f"public, max-age={FLOWER_MAX_AGE_SECONDS}"}
+    if if_none_match and etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return asdict(entry.flower)
+
+
+@app.get("/images/{variant}/{filename}")
+async def get_image(variant: str, filename: str, if_none_match: Optional[str] = header_default):
+    """A flower photo as original or as one of its WebP variants, which are rendered on first use if missing"""
+    original = IMG_DIRECTORY / filename
+    if (variant != "original" and variant not in THUMBNAIL_SIZES) or Path(filename).name != filename \
+            or not original.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    path = original
+    if variant != "original":
+        path = thumbnail_path(original, variant)
+        if not path.is_file():
+            path = await asyncio.to_thread(make_thumbnail, original, variant)
+    etag = await asyncio.to_thread(file_etag, path)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={IMAGE_MAX_AGE_SECONDS}"}
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse streams the file, with sendfile where the server supports zero-copy sends
+    return FileResponse(path, headers=headers, media_type="image/webp" if variant != "original" else None)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    return if_none_match.strip() == "*" or etag in {
+        tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
 
 
 @app.post("/flowers/search/")
-def search_flowers(
-        q: Optional[str] = form_default,
-        q_img: Optional[UploadFile] = file_default,
+async def search_flowers(
+        q: Optional[str] = q_default,
+        q_img: Optional[List[UploadFile]] = file_default,
+        mode: str = mode_default,
+        fusion: str = fusion_default,
+        family: Optional[str] = family_default,
+        region: Optional[str] = region_default,
+        color: Optional[str] = color_default,
+        min_images: Optional[int] = min_images_default,
+        limit: int = limit_default,
+        cursor: Optional[str] = cursor_default,
+        fields: Optional[str] = fields_default,
 ):
-    validate_search_params(q, q_img)
+    require_ready()
+    q_img = q_img or []
+    validate_search_params(q, q_img, mode, fusion)
+    validate_page_params(limit, min_images)
+    try:
+        field_names = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Filters are pushed down into the Chroma queries as a where clause
+    where = build_where(family, region, color, min_images)
     try:
-        results = app.search_service.search(q, q_img.file if q_img else None)
+        query_img_files = [io.BytesIO(await f.read()) for f in q_img]
+        results, next_cursor = await app.inference.run(app.search_service.search_page, q, query_img_files,
+                                                       limit=limit, cursor=cursor, where=where, mode=mode,
+                                                       fusion=fusion)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Search is busy, try again shortly", headers={"Retry-After": "1"})
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Search failed")
     finally:
-        q_img.file.close() if q_img else None
+        for f in q_img:
+            await f.close()
 
-    # Return dataclass payloads as plain dicts
-    items = [asdict(f) for f in results]
-    return {"q": q, "q_img": q_img.filename if q_img else None, "items": items}
+    items = [project(f, field_names) for f in results]
+    filenames = [f.filename for f in q_img]
+    return {"q": q, "q_img": filenames[0] if len(filenames) == 1 else filenames or None, "items": items,
+            "next_cursor": next_cursor}
 
 
 def validate_file_properties(q_img: UploadFile):
@@ -67,14 +274,28 @@ def validate_file_properties(q_img: UploadFile):
             raise HTTPException(status_code=415, detail="Image must be a JPEG or PNG file")
 
 
-def validate_search_params(q: str, q_img: UploadFile):
+def validate_page_params(limit: int, min_images: Optional[int]):
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    if min_images is not None and min_images < 0:
+        raise HTTPException(status_code=400, detail="'min_images' must not be negative")
+
+
+def validate_search_params(q: str, q_img: List[UploadFile], mode: str = "text", fusion: str = "rrf"):
     # Check if at least one parameter is provided and valid
     if not q and not q_img:
         raise HTTPException(
             status_code=400,
             detail="Either 'q' (text query) or 'q_img' (image file) must be provided",
         )
-    validate_file_properties(q_img)
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"'mode' must be one of: {', '.join(SEARCH_MODES)}")
+    if fusion not in IMAGE_FUSIONS:
+        raise HTTPException(status_code=400, detail=f"'fusion' must be one of: {', '.join(IMAGE_FUSIONS)}")
+    if len(q_img) > MAX_QUERY_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUERY_IMAGES} images can be searched at once")
+    for f in q_img:
+        validate_file_properties(f)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,11 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class Flower:
     botanical_name: str
+    # Stored lower-cased, like the other filterable attributes
     family: str
     url: str
     common_name: str
@@ -12,3 +14,16 @@ class Flower:
     image2_url: str = None
     image3_url: str = None
     image4_url: str = None
+    # Optional filterable attributes, stored lower-cased
+    region: str = None
+    color: str = None
+    # File name of the first local photo, whose variants the API serves under /images/{variant}/
+    thumbnail: str = None
+    # Flora id, the key of the flower's details under /flowers/{id}. Not stored in the metadata, set when read
+    id: str = None
+
+
+@dataclass(slots=True)
+class ScoredFlower(Flower):
+    # Distance of the closest description or photo to the query, lower is closer
+    distance: Optional[float] = None
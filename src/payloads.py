@@ -0,0 +1,33 @@
+from dataclasses import fields
+from typing import Any, Dict, Optional, Tuple
+
+from models import Flower, ScoredFlower
+
+# Result grids only show a name, the family and a thumbnail, details come from /flowers/{id}
+LIST_FIELDS = ("id", "botanical_name", "common_name", "family", "thumbnail", "distance")
+FULL_FIELDS = tuple(f.name for f in fields(ScoredFlower))
+FIELD_PRESETS = {"list": LIST_FIELDS, "full": FULL_FIELDS}
+
+
+def parse_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """Fields of a search result projection, a preset name or a comma separated list of flower fields"""
+
+    if not value:
+        return LIST_FIELDS
+    if value in FIELD_PRESETS:
+        return FIELD_PRESETS[value]
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in FULL_FIELDS]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields given")
+    return names
+
+
+def project(flower: Flower, names: Tuple[str, ...]) -> Dict[str, Any]:
+    """Shallow projection of a flower that leaves out unset fields, unlike asdict it copies nothing"""
+    projection = {}
+    for name in names:
+        value = getattr(flower, name, None)
+        if value is not None:
+            projection[name] = value
+    return projection
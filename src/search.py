@@ -1,11 +1,36 @@
-import inspect
-from typing import Dict, Any, Optional, List, BinaryIO
+import base64
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Any, Optional, List, BinaryIO, Tuple, Union
 
 import numpy
-from PIL import Image
+from chromadb import EmbeddingFunction
+from PIL import Image, ImageOps
 
-from chroma import FloraImageDAO, FloraTextDAO
-from models import Flower
+from batching import MicroBatcher
+from cache import PerceptualHashCache, TTLCache
+from chroma import FloraBase, FloraFusedDAO, FloraImageDAO, FloraTextDAO
+from exact_search import RERANK_FACTOR, SEARCH_ENGINES, ExactIndex, snapshot_dir_for, stored_codec
+from models import Flower, ScoredFlower
+
+FLOWER_FIELDS = frozenset(f.name for f in fields(Flower))
+# Shorter side of the images the CLIP ViT-B-32 model is fed, after its own resize and center crop
+CLIP_INPUT_SIZE = 224
+SEARCH_MODES = ("text", "image", "hybrid", "fused")
+# A flower has up to four photos (image1..4), so n photo hits can collapse into as few as n / 4 flowers
+IMAGES_PER_FLOWER = 4
+# Photos fetched per wanted flower in the first round of an image search
+IMAGE_OVERFETCH = 2
+# How the hits of several query photos of one flower are combined into one ranking
+IMAGE_FUSIONS = ("rrf", "max", "mean")
+# Rank damping constant of reciprocal rank fusion, 60 is the value from the original paper
+RRF_K = 60
+# Deepest result a search can page to, every page re-runs the search for offset + limit results
+MAX_SEARCH_DEPTH = 200
+# Keys of a Chroma query result that hold one list per query embedding
+PER_QUERY_RESULT_KEYS = ("ids", "embeddings", "documents", "uris", "data", "metadatas", "distances")
 
 
 def unique_ids(image_matches):
@@ -19,43 +44,402 @@ def unique_ids(image_matches):
     return ids
 
 
-def process_results(metadatas: List[Dict[str, str]], ids: List[str], ordered_ids: List[str]) -> List[Flower]:
+def preprocess_query_image(query_img_file: BinaryIO, size: int = CLIP_INPUT_SIZE) -> numpy.ndarray:
+    """Decode an uploaded image straight down to roughly the model's input size.
+
+    JPEGs are downscaled while decoding (DCT scaling via draft), the EXIF orientation is applied and the
+    image is resized so its shorter side is `size`, leaving CLIP's center crop to do the rest.
+    """
+    image = Image.open(query_img_file)
+    image.draft("RGB", (size, size))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    scale = size / min(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.BICUBIC)
+    return numpy.asarray(image)
+
+
+def dhash(pixels: numpy.ndarray, hash_size: int = 8) -> int:
+    """64 bit difference hash: whether each pixel of a tiny grayscale copy is brighter than its right neighbour.
+
+    Re-compressed or resized copies of a photo hash to the same, or nearly the same, value.
+    """
+    image = Image.fromarray(pixels).convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    small = numpy.asarray(image, dtype=numpy.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(numpy.packbits(bits).tobytes(), "big")
+
+
+def color_signature(pixels: numpy.ndarray, grid_size: int = 4, levels: int = 16) -> bytes:
+    """Mean colour of each cell of a grid over the image, quantised to `levels` per channel.
+
+    The difference hash only sees brightness gradients, so flat or equally shaded photos of different colours
+    share it. The signature tells them apart.
+    """
+    image = Image.fromarray(pixels).convert("RGB").resize((grid_size, grid_size), Image.Resampling.BOX)
+    return (numpy.asarray(image, dtype=numpy.uint16) * levels // 256).astype(numpy.uint8).tobytes()
+
+
+def image_key(pixels: numpy.ndarray) -> Tuple[int, bytes]:
+    """Key of an image in the PerceptualHashCache: its structure and its colours"""
+    return dhash(pixels), color_signature(pixels)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K,
+                           weights: Optional[List[float]] = None) -> List[str]:
+    """Merge rankings of ids, scoring each id by the sum of weight / (k + rank) over the rankings it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def flower_distances(image_matches: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Distance of each flower's closest photo over the matches of one or more query images"""
+    distances: Dict[str, float] = {}
+    for matches in image_matches:
+        for metadata, distance in zip(matches["metadatas"][0], matches["distances"][0]):
+            distances[metadata["flora_id"]] = min(distance, distances.get(metadata["flora_id"], distance))
+    return distances
+
+
+def fuse_image_matches(image_matches: List[Dict[str, Any]], fusion: str = "rrf") -> List[str]:
+    """Rank flowers over the photo matches of several query images.
+
+    rrf votes with each image's ranking of distinct flowers, max ranks a flower by its closest photo to any query
+    image and mean by its closest photo averaged over the query images, counting the farthest distance seen for
+    images that did not retrieve it.
+    """
+    rankings = [unique_ids(matches) for matches in image_matches]
+    if len(rankings) == 1:
+        return rankings[0]
+    if fusion == "rrf":
+        return reciprocal_rank_fusion(rankings)
+
+    best_distances = [flower_distances([matches]) for matches in image_matches]
+    flora_ids = list(dict.fromkeys(flora_id for ranking in rankings for flora_id in ranking))
+    if not flora_ids:
+        return []
+    if fusion == "max":
+        score = {flora_id: min(best.get(flora_id, numpy.inf) for best in best_distances) for flora_id in flora_ids}
+    else:
+        worst = max(distance for best in best_distances for distance in best.values())
+        score = {flora_id: sum(best.get(flora_id, worst) for best in best_distances) / len(best_distances)
+                 for flora_id in flora_ids}
+    return sorted(flora_ids, key=score.get)
+
+
+def process_results(metadatas: List[Dict[str, str]], ids: List[str], ordered_ids: List[str],
+                    distances: Optional[Dict[str, float]] = None) -> List[Flower]:
+    metadata_by_id = dict(zip(ids, metadatas))
     flowers = []
-    for id in ordered_ids:
-        metadata = metadatas[ids.index(id)]
-        flower_fields = inspect.signature(Flower).parameters
-        flower_dict = {k: v for k, v in metadata.items() if k in flower_fields}
-        flowers.append(Flower(**flower_dict))
+    for flower_id in ordered_ids:
+        metadata = metadata_by_id[flower_id]
+        flower_fields = {k: v for k, v in metadata.items() if k in FLOWER_FIELDS}
+        flower_fields["id"] = flower_id
+        if distances is None:
+            flowers.append(Flower(**flower_fields))
+        else:
+            flowers.append(ScoredFlower(**flower_fields, distance=distances.get(flower_id)))
     return flowers
 
 
+def build_where(family: Optional[str] = None, region: Optional[str] = None, color: Optional[str] = None,
+                min_images: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Chroma where filter over the typed filter fields the importer writes, comma separated values match any"""
+
+    conditions = []
+    for field_name, value in (("family", family), ("region", region), ("color", color)):
+        values = [v.strip() for v in (value or "").split(",") if v.strip()]
+        # Filter fields are stored lower-cased
+        values = [v.lower() for v in values]
+        if len(values) == 1:
+            conditions.append({field_name: values[0]})
+        elif values:
+            conditions.append({field_name: {"$in": values}})
+    if min_images is not None:
+        conditions.append({"num_images": {"$gte": min_images}})
+    if len(conditions) > 1:
+        return {"$and": conditions}
+    return conditions[0] if conditions else None
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(offset: int, fingerprint: str) -> str:
+    payload = json.dumps({"offset": offset, "search": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    """Offset of the next page, the cursor must come from a search with the same query, filters and mode"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = payload["offset"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("search") != fingerprint or not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("Cursor belongs to a different search")
+    return offset
+
+
+def search_fingerprint(query_text: Optional[str], query_img_files: List[BinaryIO], *params) -> str:
+    digest = hashlib.sha256(json.dumps([query_text, *params], sort_keys=True).encode())
+    for query_img_file in query_img_files:
+        digest.update(query_img_file.read())
+        query_img_file.seek(0)
+    return digest.hexdigest()[:16]
+
+
+def normalize_query(query_text: str) -> str:
+    return " ".join(query_text.lower().split())
+
+
+def split_query_results(results: Dict[str, Any], position: int) -> Dict[str, Any]:
+    """Extract the results of one query embedding from a multi-query Chroma result"""
+    return {
+        key: [value[position]] if key in PER_QUERY_RESULT_KEYS and value is not None else value
+        for key, value in results.items()
+    }
+
+
+@dataclass
+class BatchedQuery:
+    dao: FloraBase
+    query: Any
+    n: int
+    where: Optional[Dict[str, Any]]
+
+
 class SearchService:
-    def __init__(self, chromadb_client):
-        self.image_dao = FloraImageDAO(chromadb_client)
+    def __init__(self, chromadb_client, max_batch_size: int = 1, max_wait_ms: float = 5,
+                 embedding_function: Optional[EmbeddingFunction] = None,
+                 cache_size: int = 1024, cache_ttl_seconds: Optional[float] = 3600,
+                 image_cache_bytes: int = 32 * 1024 * 1024, engine: str = "chroma", exact_dtype: str = "float32",
+                 rerank_factor: int = RERANK_FACTOR):
+        self.image_dao = FloraImageDAO(chromadb_client, embedding_function)
         # Use the same collection that import currently writes to
-        self.text_dao = FloraTextDAO(chromadb_client)
+        self.text_dao = FloraTextDAO(chromadb_client, embedding_function)
+        # One fused text and photo embedding per flower with its metadata, searched without a get or dedup pass
+        self.fused_dao = FloraFusedDAO(chromadb_client, embedding_function)
+        # Concurrent searches are embedded and queried together when batching is enabled
+        self.batcher = MicroBatcher(self._query_batch, max_batch_size, max_wait_ms) if max_batch_size > 1 else None
+        # Text embeddings only depend on the model, search results also on the stored data
+        self.embedding_cache = TTLCache(cache_size, cache_ttl_seconds)
+        self.results_cache = TTLCache(cache_size, cache_ttl_seconds)
+        # Image embeddings are keyed on a perceptual hash, so repeated uploads of a photo skip the image encoder
+        self.image_embedding_cache = PerceptualHashCache(image_cache_bytes)
+        self._data_version = None
+        # Searches of different collections in one batch (hybrid mode) run side by side
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chroma-search")
+        # The exact engine keeps every embedding in memory and searches it with a matrix product instead of Chroma,
+        # collections the importer compressed are searched on their codes and re-ranked at full precision
+        if engine not in SEARCH_ENGINES:
+            raise ValueError(f"Unknown search engine {engine!r}, expected one of: {', '.join(SEARCH_ENGINES)}")
+        self.exact_indexes: Dict[str, ExactIndex] = {}
+        if engine == "exact":
+            snapshot_dir = snapshot_dir_for(chromadb_client)
+            for dao, include, group_by in ((self.text_dao, ["metadatas", "documents"], None),
+                                           (self.image_dao, ["metadatas", "uris"], "flora_id"),
+                                           (self.fused_dao, ["metadatas", "documents"], None)):
+                self.exact_indexes[dao.collection_name] = ExactIndex(
+                    dao, include, group_by, exact_dtype, snapshot_dir,
+                    codec=stored_codec(snapshot_dir, dao.collection_name), rerank_factor=rerank_factor)
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "image_embeddings": self.image_embedding_cache.stats(),
+            "results": self.results_cache.stats(),
+        }
+
+    def _embedding_cache_for(self, query: Any) -> tuple:
+        if isinstance(query, str):
+            return self.embedding_cache, normalize_query(query)
+        return self.image_embedding_cache, image_key(query)
+
+    def refresh_exact_indexes(self) -> int:
+        """Reload the exact engine's indexes of collections written since they were loaded, returns how many were"""
+        return sum(index.refresh() for index in self.exact_indexes.values())
+
+    def _current_data_version(self) -> tuple:
+        """Version of the stored data, the results cache is dropped whenever it changes. The exact indexes catch up
+        with writes on their next refresh, so the versions they loaded are part of it too"""
+        data_version = (self.text_dao.data_version(), self.image_dao.data_version(), self.fused_dao.data_version(),
+                        *(index.data_version for index in self.exact_indexes.values()))
+        if data_version != self._data_version:
+            self.results_cache.clear()
+            self._data_version = data_version
+        return data_version
+
+    def _query(self, dao: FloraBase, query: Any, n: int, where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return self._query_many([BatchedQuery(dao, query, n, where)])[0]
+
+    def _query_many(self, queries: List[BatchedQuery]) -> List[Dict[str, Any]]:
+        if self.batcher is None:
+            return self._query_batch(queries)
+        return self.batcher.submit_many(queries)
+
+    def _query_flowers(self, queries: List[BatchedQuery]) -> List[Dict[str, Any]]:
+        """Run queries whose results are collapsed to distinct flowers, deepening photo searches as needed.
+
+        Photo searches first fetch IMAGE_OVERFETCH * n photos and, while that holds fewer than n distinct
+        flowers and more photos exist, are repeated with twice the fetch size up to IMAGES_PER_FLOWER * n,
+        which always covers n flowers. Callers trim the distinct flowers to n.
+        """
+        results = [None] * len(queries)
+        # The exact engine already collapses photos to their flowers, so n hits are n distinct flowers
+        fetch = [query.n * IMAGE_OVERFETCH if query.dao is self.image_dao and not self.exact_indexes else query.n
+                 for query in queries]
+        pending = list(range(len(queries)))
+        while pending:
+            matches = self._query_many([replace(queries[p], n=fetch[p]) for p in pending])
+            deepen = []
+            for position, position_matches in zip(pending, matches):
+                results[position] = position_matches
+                query = queries[position]
+                if query.dao is not self.image_dao or len(position_matches["ids"][0]) < fetch[position]:
+                    continue
+                limit = query.n * IMAGES_PER_FLOWER
+                if fetch[position] < limit and len(unique_ids(position_matches)) < query.n:
+                    fetch[position] = min(fetch[position] * 2, limit)
+                    deepen.append(position)
+            pending = deepen
+        return results
+
+    def _query_batch(self, queries: List[BatchedQuery]) -> List[Dict[str, Any]]:
+        """Embed a batch of queries in one call per embedding function, then run one multi-query
+        search per collection, n and filter, and hand each query back its own results"""
+
+        embeddings = [None] * len(queries)
+        caches = [self._embedding_cache_for(query.query) for query in queries]
+        # Queries with the same embedding function and cache key, like both halves of a hybrid search, embed once
+        misses = {}
+        for position, query in enumerate(queries):
+            cache, key = caches[position]
+            embeddings[position] = cache.get(key)
+            if embeddings[position] is None:
+                misses.setdefault(id(query.dao.embedding_function), {}).setdefault(key, []).append(position)
+        for positions_by_key in misses.values():
+            first_positions = [positions[0] for positions in positions_by_key.values()]
+            embedding_function = queries[first_positions[0]].dao.embedding_function
+            computed = embedding_function([queries[p].query for p in first_positions])
+            for positions, embedding in zip(positions_by_key.values(), computed):
+                cache, key = caches[positions[0]]
+                cache.put(key, embedding)
+                for position in positions:
+                    embeddings[position] = embedding
+
+        by_search = {}
+        for position, query in enumerate(queries):
+            key = (query.dao.collection_name, query.n, json.dumps(query.where, sort_keys=True))
+            by_search.setdefault(key, []).append(position)
+
+        def run_search(positions):
+            first = queries[positions[0]]
+            engine = self.exact_indexes.get(first.dao.collection_name, first.dao)
+            return engine.query_embeddings([embeddings[p] for p in positions], first.n, first.where)
+
+        groups = list(by_search.values())
+        searches = self._search_pool.map(run_search, groups) if len(groups) > 1 else map(run_search, groups)
+        results = [None] * len(queries)
+        for positions, matches in zip(groups, searches):
+            for i, position in enumerate(positions):
+                results[position] = split_query_results(matches, i)
+        return results
+
+    def _flowers_for_ids(self, ordered_ids: List[str], distances: Optional[Dict[str, float]] = None) -> List[Flower]:
+        # Filters can leave nothing to fetch, and Chroma rejects a get of no ids
+        if not ordered_ids:
+            return []
+        flower_matches = self.text_dao.get(ordered_ids, len(ordered_ids))
+        return process_results(flower_matches["metadatas"], flower_matches["ids"], ordered_ids, distances)
+
+    def search_page(
+            self,
+            query_text: Optional[str],
+            query_img_files: Optional[List[BinaryIO]] = None,
+            limit: int = 20,
+            cursor: Optional[str] = None,
+            where: Optional[Dict[str, Any]] = None,
+            mode: str = "text",
+            fusion: str = "rrf",
+    ) -> tuple[List[Flower], Optional[str]]:
+        """One page of search results and the cursor of the next page, None on the last page.
+
+        Similarity search has no stable position to resume from, so a cursor carries the offset of the next
+        page and a fingerprint of the search; a page re-runs the search for offset + limit results. Every page
+        asks for a different depth and so misses the results cache, only the query's embedding is reused from the
+        embedding caches.
+        """
+        query_img_files = query_img_files or []
+        fingerprint = search_fingerprint(query_text, query_img_files, where, mode, fusion)
+        offset = decode_cursor(cursor, fingerprint) if cursor else 0
+        depth = min(offset + limit, MAX_SEARCH_DEPTH)
+        flowers = self.search(query_text, query_img_files, n=depth, where=where, mode=mode, fusion=fusion)
+        page = flowers[offset:depth]
+        has_more = len(flowers) == depth and depth < MAX_SEARCH_DEPTH
+        return page, encode_cursor(depth, fingerprint) if has_more else None
+
+    @staticmethod
+    def _fused_flowers(matches: List[Dict[str, Any]], n: int) -> List[Flower]:
+        """Flowers straight from fused collection matches, rank fused when there were several queries"""
+        metadata_by_id, distances = {}, {}
+        for query_matches in matches:
+            for flora_id, metadata, distance in zip(query_matches["ids"][0], query_matches["metadatas"][0],
+                                                    query_matches["distances"][0]):
+                metadata_by_id[flora_id] = metadata
+                distances[flora_id] = min(distance, distances.get(flora_id, distance))
+        rankings = [query_matches["ids"][0] for query_matches in matches]
+        ordered_ids = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings)
+        return process_results(list(metadata_by_id.values()), list(metadata_by_id), ordered_ids[:n], distances)
+
+    def _search_text(self, query_text: str, n: int, where: Optional[Dict[str, Any]], mode: str) -> List[Flower]:
+        """Search flower descriptions (text), flower photos (image), both fused by rank (hybrid) or the
+        precomputed per-flower embeddings of description and photos (fused)"""
+
+        daos = {"text": [self.text_dao], "image": [self.image_dao], "hybrid": [self.text_dao, self.image_dao],
+                "fused": [self.fused_dao]}[mode]
+        matches = self._query_flowers([BatchedQuery(dao, query_text, n, where) for dao in daos])
+        if mode == "fused":
+            return self._fused_flowers(matches, n)
+        if mode == "text":
+            ids = matches[0]["ids"][0]
+            return process_results(matches[0]["metadatas"][0], ids, ids, dict(zip(ids, matches[0]["distances"][0])))
+        if mode == "image":
+            return self._flowers_for_ids(unique_ids(matches[0])[:n], flower_distances(matches))
+        # Text and photo distances are not comparable, so hybrid results only carry their fused rank
+        fused_ids = reciprocal_rank_fusion([matches[0]["ids"][0], unique_ids(matches[1])[:n]])
+        return self._flowers_for_ids(fused_ids[:n])
 
     def search(
             self,
             query_text: Optional[str],
-            query_img_file: BinaryIO,
+            query_img_file: Union[BinaryIO, List[BinaryIO], None],
             n: int = 20,
             where: Optional[Dict[str, Any]] = None,
+            mode: str = "text",
+            fusion: str = "rrf",
     ) -> List[Flower]:
 
         if query_img_file:
-            image = Image.open(query_img_file)
-            numpy_img = numpy.asarray(image)
-            image_matches = self.image_dao.query(numpy_img, n, where)
-            ordered_ids = unique_ids(image_matches)
-            flower_matches = self.text_dao.get(ordered_ids, len(ordered_ids))
-            return process_results(flower_matches["metadatas"], flower_matches["ids"], ordered_ids)
+            # Several photos of one flower (close-up, leaves, habit) are embedded and searched as one batch
+            query_img_files = query_img_file if isinstance(query_img_file, list) else [query_img_file]
+            dao = self.fused_dao if mode == "fused" else self.image_dao
+            queries = [BatchedQuery(dao, preprocess_query_image(f), n, where) for f in query_img_files]
+            image_matches = self._query_flowers(queries)
+            if mode == "fused":
+                return self._fused_flowers(image_matches, n)
+            ordered_ids = fuse_image_matches(image_matches, fusion)
+            return self._flowers_for_ids(ordered_ids[:n], flower_distances(image_matches))
         else:
-
-            # WIP: Activate and make this code switchable based on parameter
-            # image_matches = FloraBase.query(self.image_dao, query_text, n, where)
-            # ordered_ids = unique_ids(image_matches)
-            # flower_matches = self.text_dao.get(ordered_ids, len(ordered_ids))
-            # return process_results(flower_matches["metadatas"], flower_matches["ids"], ordered_ids)
-            text_matches = self.text_dao.query(query_text, n, where)
-            return process_results(text_matches["metadatas"][0], text_matches["ids"][0], text_matches["ids"][0])
+            cache_key = (self._current_data_version(), normalize_query(query_text), n,
+                         json.dumps(where, sort_keys=True), mode)
+            flowers = self.results_cache.get(cache_key)
+            if flowers is None:
+                flowers = self._search_text(query_text, n, where, mode)
+                self.results_cache.put(cache_key, flowers)
+            return list(flowers)
@@ -0,0 +1,44 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class Startup:
+    """Runs the slow startup steps (opening Chroma, loading CLIP, warming it up) off the event loop.
+
+    The server binds its port and answers health checks right away, while readiness is only reported once
+    every step has finished. Each step is timed and logged, so slow phases of a deploy are easy to spot.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        self.steps = steps
+        self.phases: Dict[str, float] = {}
+        self.current_phase: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started_at = time.perf_counter()
+        self.ready = threading.Event()
+
+    def run(self) -> None:
+        for name, step in self.steps:
+            self.current_phase = name
+            phase_started_at = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.error = f"{name} failed: {e!r}"
+                print(f"Startup {self.error}")
+                return
+            self.phases[name] = time.perf_counter() - phase_started_at
+            print(f"Startup phase {name} took {self.phases[name]:.2f}s")
+        self.current_phase = None
+        self.phases["total"] = time.perf_counter() - self.started_at
+        print(f"Startup complete in {self.phases['total']:.2f}s")
+        self.ready.set()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready.is_set(),
+            "phase": self.current_phase,
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "error": self.error,
+        }
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+# Longest side in pixels of each served image variant, all encoded as WebP
+THUMBNAIL_SIZES = {"thumb": 320, "medium": 960}
+WEBP_QUALITY = 80
+
+
+def thumbnail_path(image_path: Path, variant: str) -> Path:
+    """Variants live next to the originals, e.g. img/thumbs/thumb/primrose_img1.webp for img/primrose_img1.jpg"""
+    return image_path.parent / "thumbs" / variant / f"{image_path.stem}.webp"
+
+
+def make_thumbnail(image_path: Path, variant: str) -> Path:
+    """Write one WebP variant of an image unless an up-to-date one exists, and return its path"""
+
+    image_path = Path(image_path)
+    path = thumbnail_path(image_path, variant)
+    if path.is_file() and path.stat().st_mtime_ns >= image_path.stat().st_mtime_ns:
+        return path
+
+    size = THUMBNAIL_SIZES[variant]
+    with Image.open(image_path) as image:
+        # Decode JPEGs at a reduced scale instead of decoding the full image and then shrinking it
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Every writer gets its own temporary file, so concurrent renders (two first requests, or the API racing
+        # the importer) each publish a complete WebP and the last rename wins
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.stem}.", suffix=".part",
+                                         delete=False) as partial_file:
+            try:
+                image.save(partial_file, "WEBP", quality=WEBP_QUALITY, method=4)
+            except BaseException:
+                os.unlink(partial_file.name)
+                raise
+    os.replace(partial_file.name, path)
+    return path
+
+
+def make_thumbnails(image_path: Path) -> Dict[str, Path]:
+    return {variant: make_thumbnail(image_path, variant) for variant in THUMBNAIL_SIZES}
+
+
+def file_etag(path: Path) -> str:
+    """Strong ETag of a file's content, only re-hashed when its size or modification time changes"""
+    stat = path.stat()
+    return _content_hash(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(path: str, _mtime_ns: int, _size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()[:32]
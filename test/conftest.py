@@ -0,0 +1,119 @@
+import threading
+import zlib
+
+import chromadb
+import numpy
+import pytest
+from chromadb import EmbeddingFunction
+
+from chroma import FloraFusedDAO, FloraImageDAO, FloraTextDAO
+from search import SearchService
+
+
+def fake_embedding(seed: int) -> numpy.ndarray:
+    return numpy.random.default_rng(seed).random(8, dtype=numpy.float32)
+
+
+class CountingEmbeddingFunction(EmbeddingFunction):
+    """Cheap stand-in for CLIP that records how many texts and images it was asked to embed.
+
+    Equal inputs get equal embeddings, so a query matching a stored document exactly ranks it first.
+    """
+
+    def __init__(self):
+        self.num_calls = 0
+        self.num_texts = 0
+        self.num_images = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        embeddings = []
+        for item in input:
+            if isinstance(item, str):
+                embeddings.append(fake_embedding(zlib.crc32(item.encode())))
+            else:
+                embeddings.append(fake_embedding(zlib.crc32(numpy.ascontiguousarray(item).tobytes())))
+        with self._lock:
+            self.num_calls += 1
+            self.num_texts += sum(isinstance(item, str) for item in input)
+            self.num_images += sum(not isinstance(item, str) for item in input)
+        return embeddings
+
+
+@pytest.fixture
+def counting_embedding_function():
+    return CountingEmbeddingFunction()
+
+
+@pytest.fixture
+def flower_metadata():
+    """Stored metadata of test flower i, as the importer writes it"""
+
+    def metadata(i, description="A small perennial " * 20):
+        return {
+            "botanical_name": f"Primula {i}",
+            "family": "primulaceae",
+            "url": f"https://example.com/{i}",
+            "common_name": f"Primrose {i}",
+            "description": description,
+            "image1_url": f"https://example.com/{i}.jpg",
+            "image1_local_uri": f"img/primrose_{i}_img1.jpg",
+            "text_hash": "0" * 64,
+        }
+
+    return metadata
+
+
+@pytest.fixture
+def chroma_client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+
+@pytest.fixture
+def text_dao(chroma_client, counting_embedding_function):
+    return FloraTextDAO(chroma_client, counting_embedding_function)
+
+
+@pytest.fixture
+def image_dao(chroma_client, counting_embedding_function):
+    return FloraImageDAO(chroma_client, counting_embedding_function)
+
+
+@pytest.fixture
+def fused_dao(chroma_client, counting_embedding_function):
+    return FloraFusedDAO(chroma_client, counting_embedding_function)
+
+
+@pytest.fixture
+def make_search_service(tmp_path, counting_embedding_function, flower_metadata):
+    """Factory of SearchServices over a temporary ChromaDB in `path` (default tmp_path) holding num_flowers flowers"""
+
+    def make(num_flowers=20, path=None, **kwargs):
+        service = SearchService(chromadb.PersistentClient(path=str((path or tmp_path) / "chroma")),
+                                embedding_function=counting_embedding_function, **kwargs)
+        ids = [f"id{i}" for i in range(num_flowers)]
+        metadatas = [flower_metadata(i) for i in range(num_flowers)]
+        service.text_dao.upsert_documents_batch(ids, [f"Primrose {i}" for i in range(num_flowers)], metadatas)
+        service.refresh_exact_indexes()
+        return service
+
+    return make
+
+
+@pytest.fixture
+def add_clustered_photo_embeddings():
+    """Stores photo embeddings around a query's embedding, all photos of flower i closer than those of flower i + 1"""
+
+    def add(service, query_text, num_flowers=6, images_per_flower=4):
+        query_embedding = numpy.asarray(service.image_dao.embedding_function([query_text])[0])
+        ids, embeddings, metadatas = [], [], []
+        for i in range(num_flowers):
+            for j in range(images_per_flower):
+                offset = numpy.zeros_like(query_embedding)
+                offset[j % len(offset)] = 0.1 * (i * images_per_flower + j + 1)
+                ids.append(f"img{i}-{j}")
+                embeddings.append((query_embedding + offset).tolist())
+                metadatas.append({"flora_id": f"id{i}"})
+        service.image_dao.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+
+    return add
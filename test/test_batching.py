@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class TestMicroBatcher:
+    """Test suite for MicroBatcher class."""
+
+    def test_concurrent_submits_are_processed_together(self):
+        """Test items submitted from concurrent threads share batches and get their own results."""
+        # Arrange
+        batcher = MicroBatcher(lambda items: [item * 10 for item in items], max_batch_size=4, max_wait_ms=200)
+        results = {}
+        start = threading.Barrier(8)
+
+        def submit(i):
+            start.wait()
+            results[i] = batcher.submit(i)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+
+        # Act
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        assert results == {i: i * 10 for i in range(8)}
+        assert batcher.num_items == 8
+        assert batcher.num_batches < 8
+
+    def test_batch_closes_after_max_wait(self):
+        """Test a lone item is processed once max_wait_ms passes without more items."""
+        batcher = MicroBatcher(lambda items: [len(items)] * len(items), max_batch_size=16, max_wait_ms=1)
+
+        assert batcher.submit("only") == 1
+        assert batcher.num_batches == 1
+
+    def test_failures_are_raised_in_every_caller_of_the_batch(self):
+        """Test an exception from process_batch reaches the submitting thread."""
+
+        def fail(items):
+            raise RuntimeError("model failed")
+
+        batcher = MicroBatcher(fail, max_batch_size=2, max_wait_ms=1)
+
+        with pytest.raises(RuntimeError, match="model failed"):
+            batcher.submit("query")
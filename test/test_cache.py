@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+import numpy
+
+from cache import PerceptualHashCache, TTLCache
+
+
+class TestTTLCache:
+    """Test suite for TTLCache class."""
+
+    def test_get_returns_stored_value_and_counts_hits_and_misses(self):
+        """Test get finds stored values and the counters reflect every lookup."""
+        cache = TTLCache(maxsize=4)
+        cache.put("blue poppy", [1, 2])
+
+        assert cache.get("blue poppy") == [1, 2]
+        assert cache.get("primula") is None
+        assert cache.stats() == {"size": 1, "maxsize": 4, "hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test the entry not read for the longest time is evicted once maxsize is exceeded."""
+        cache = TTLCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+
+    @patch("cache.time.monotonic")
+    def test_entries_expire_after_ttl(self, mock_monotonic):
+        """Test an entry is a miss once ttl_seconds have passed since it was stored."""
+        cache = TTLCache(maxsize=2, ttl_seconds=60)
+        mock_monotonic.return_value = 1000
+        cache.put("rhododendron", "flowers")
+
+        mock_monotonic.return_value = 1059
+        assert cache.get("rhododendron") == "flowers"
+        mock_monotonic.return_value = 1061
+        assert cache.get("rhododendron") is None
+        assert len(cache) == 0
+
+    def test_zero_size_disables_cache(self):
+        """Test a cache with maxsize 0 stores nothing."""
+        cache = TTLCache(maxsize=0)
+        cache.put("a", 1)
+
+        assert cache.get("a") is None
+
+
+class TestPerceptualHashCache:
+    """Test suite for PerceptualHashCache class."""
+
+    def test_near_duplicate_hash_hits(self):
+        """Test a hash a few bits away from a stored one returns the stored embedding."""
+        cache = PerceptualHashCache(max_distance=4)
+        cache.put((0b1011_0000, b"\x08\x02"), numpy.ones(4))
+
+        assert cache.get((0b1011_0000, b"\x08\x02")) is not None
+        assert cache.get((0b1011_0111, b"\x08\x02")) is not None
+        assert cache.get((0b0100_1111, b"\x08\x02")) is None
+        assert (cache.hits, cache.near_hits, cache.misses) == (1, 1, 1)
+
+    def test_near_hits_need_matching_colors(self):
+        """Test a close hash only hits when every colour of the signature is within max_color_distance levels."""
+        cache = PerceptualHashCache(max_distance=4, max_color_distance=1)
+        cache.put((0b1011_0000, b"\x08\x02"), numpy.ones(4))
+
+        assert cache.get((0b1011_0001, b"\x09\x01")) is not None
+        assert cache.get((0b1011_0001, b"\x08\x04")) is None
+        assert cache.get((0b1011_0000, b"\x0f\x00")) is None
+        assert (cache.hits, cache.near_hits, cache.misses) == (0, 1, 2)
+
+    def test_memory_cap_evicts_least_recently_used(self):
+        """Test entries are evicted oldest first once their embeddings exceed max_bytes."""
+        embedding = numpy.ones(512, dtype=numpy.float32)
+        cache = PerceptualHashCache(max_bytes=2 * embedding.nbytes, max_distance=0)
+        cache.put((1, b""), embedding)
+        cache.put((2, b""), embedding)
+        cache.get((1, b""))
+
+        cache.put((4, b""), embedding)
+
+        assert cache.get((2, b"")) is None
+        assert cache.get((1, b"")) is not None
+        assert cache.nbytes == 2 * embedding.nbytes
+        assert cache.evictions == 1
@@ -0,0 +1,103 @@
+import numpy
+import pytest
+
+from compression import Float16Codec, PCACodec, ProductQuantizer, fit_codec, load_codec, save_codec
+from exact_search import ExactIndex, codec_path, stored_codec, write_codec
+
+
+def unit_rows(num_rows: int, dims: int = 16, seed: int = 0) -> numpy.ndarray:
+    matrix = numpy.random.default_rng(seed).standard_normal((num_rows, dims)).astype(numpy.float32)
+    return matrix / numpy.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+class TestCodecs:
+    """Test suite for the codecs of compressed exact search."""
+
+    @pytest.mark.parametrize("codec", [Float16Codec(), PCACodec.fit(unit_rows(300), 6),
+                                       ProductQuantizer.fit(unit_rows(300), 4)], ids=["float16", "pca", "pq"])
+    def test_inner_products_are_those_of_the_decoded_vectors(self, codec):
+        """Test the first stage scores codes exactly as it would score their decoded vectors."""
+        matrix, queries = unit_rows(300), unit_rows(3, seed=1)
+
+        codes = codec.encode(matrix)
+
+        assert codec.inner_products(queries, codes) == pytest.approx(queries @ codec.decode(codes).T, abs=1e-4)
+
+    def test_smaller_codes_lose_more_precision(self):
+        """Test the reconstruction error grows as PCA keeps fewer dimensions, and vanishes when it keeps all."""
+        matrix = unit_rows(300)
+
+        errors = [numpy.abs(codec.decode(codec.encode(matrix)) - matrix).mean()
+                  for codec in (PCACodec.fit(matrix, 16), PCACodec.fit(matrix, 8), PCACodec.fit(matrix, 2))]
+
+        assert errors[0] < 1e-5
+        assert errors[0] < errors[1] < errors[2]
+
+    def test_pq_codes_are_one_byte_per_subspace(self):
+        codec = ProductQuantizer.fit(unit_rows(300), 4)
+
+        codes = codec.encode(unit_rows(10, seed=2))
+
+        assert codes.dtype == numpy.uint8 and codes.shape == (10, 4)
+        with pytest.raises(ValueError, match="cannot be split"):
+            ProductQuantizer.fit(unit_rows(300), 5)
+
+    def test_saved_codec_loads_identically(self, tmp_path):
+        matrix = unit_rows(300)
+        codec = fit_codec("pq", matrix, subspaces=8)
+
+        save_codec(tmp_path / "codec.npz", codec)
+        loaded = load_codec(tmp_path / "codec.npz")
+
+        assert isinstance(loaded, ProductQuantizer)
+        assert numpy.array_equal(loaded.encode(matrix), codec.encode(matrix))
+
+
+class TestCompressedExactIndex:
+    """Tests of two-stage search over compressed codes against a real, temporary ChromaDB."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, counting_embedding_function, text_dao):
+        self.embedding_function = counting_embedding_function
+        self.text_dao = text_dao
+        ids = [f"id{i}" for i in range(200)]
+        self.text_dao.upsert_documents_batch(ids, [f"Primrose {i}" for i in range(200)],
+                                             [{"num_images": i % 4} for i in range(200)])
+        self.queries = self.embedding_function([f"Primrose {i}" for i in range(0, 200, 20)])
+
+    def test_reranking_restores_the_exact_results(self):
+        """Test coarse codes alone miss neighbours, re-ranking their candidates at full precision finds them."""
+        # Arrange
+        exact = ExactIndex(self.text_dao, [])
+        codec = fit_codec("pca", exact._loaded.matrix, dims=4)
+        first_stage = ExactIndex(self.text_dao, [], codec=codec, rerank_factor=0)
+        reranked = ExactIndex(self.text_dao, [], codec=codec, rerank_factor=8)
+
+        # Act
+        expected = exact.query_embeddings(self.queries, 5, where={"num_images": {"$gte": 1}})
+        approximate = first_stage.query_embeddings(self.queries, 5, where={"num_images": {"$gte": 1}})
+        results = reranked.query_embeddings(self.queries, 5, where={"num_images": {"$gte": 1}})
+
+        # Assert
+        assert results["ids"] == expected["ids"]
+        assert numpy.allclose(results["distances"], expected["distances"], rtol=1e-5)
+        assert approximate["ids"] != expected["ids"]
+        assert reranked.nbytes * 2 == exact.nbytes
+
+    def test_codec_written_at_import_time_is_used_by_the_search_service(self, tmp_path, make_search_service):
+        """Test the exact engine searches the codes the importer saved, and falls back once they are removed."""
+        # Arrange
+        service = make_search_service(path=tmp_path / "service")
+        snapshot_dir = tmp_path / "service" / "chroma" / "exact"
+
+        # Act
+        path = write_codec(service.text_dao, snapshot_dir, "pca", dims=4)
+        compressed_service = make_search_service(path=tmp_path / "service", engine="exact")
+        write_codec(service.text_dao, snapshot_dir, None)
+
+        # Assert
+        assert path == codec_path(snapshot_dir, "flora_text")
+        assert isinstance(compressed_service.exact_indexes["flora_text"].codec, PCACodec)
+        assert [f.botanical_name for f in compressed_service.search("Primrose 3", None, n=3)] == \
+            [f.botanical_name for f in service.search("Primrose 3", None, n=3)]
+        assert stored_codec(snapshot_dir, "flora_text") is None
@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+
+import numpy
+import pytest
+
+from embedding_backends import (CLIP_CONTEXT_LENGTH, IMAGE_MODEL_FILE, QUANTIZED_SUFFIX, clip_preprocess,
+                                create_clip_embedding_function, pad_token_ids)
+
+ONNX_MODEL_DIR = Path(os.getenv("FLORA_ONNX_MODEL_DIR", Path(__file__).parent.parent / "src" / "models" / "clip-onnx"))
+
+
+class TestClipPreprocess:
+    """Test suite for the NumPy port of open_clip's image transform."""
+
+    def test_shorter_side_is_resized_and_center_cropped(self):
+        """Test a landscape image keeps its center and comes out as a normalized CHW square."""
+        # Arrange: red left third, green middle, blue right third
+        pixels = numpy.zeros((300, 900, 3), dtype=numpy.uint8)
+        pixels[:, :300, 0] = pixels[:, 300:600, 1] = pixels[:, 600:, 2] = 255
+
+        # Act
+        array = clip_preprocess(pixels, size=224)
+
+        # Assert: only the green middle survives the crop
+        assert array.shape == (3, 224, 224)
+        assert array.dtype == numpy.float32
+        assert numpy.all(array[1] > 1.5)
+        assert numpy.all(array[0] < -1.5) and numpy.all(array[2] < -1.0)
+
+
+class TestPadTokenIds:
+    """Test suite for pad_token_ids."""
+
+    def test_short_sequences_are_zero_padded(self):
+        padded = pad_token_ids([[49406, 320, 49407], [49406, 49407]])
+
+        assert padded.shape == (2, CLIP_CONTEXT_LENGTH)
+        assert padded.dtype == numpy.int64
+        assert padded[0, :4].tolist() == [49406, 320, 49407, 0]
+        assert padded[1, 2:].sum() == 0
+
+    def test_long_sequences_keep_the_end_of_text_token(self):
+        padded = pad_token_ids([[49406] + [320] * 100 + [49407]])
+
+        assert padded[0, -1] == 49407
+        assert padded[0, -2] == 320
+
+
+class TestCreateClipEmbeddingFunction:
+    """Test suite for the backend factory."""
+
+    def test_unknown_backend_is_rejected(self):
+        with pytest.raises(ValueError, match="Unknown embedding backend 'tpu'"):
+            create_clip_embedding_function("tpu")
+
+    def test_onnx_and_torch_backends_agree(self):
+        """Test the int8 ONNX model embeds texts and images close to the torch model they were exported from."""
+        pytest.importorskip("open_clip")
+        if not (ONNX_MODEL_DIR / IMAGE_MODEL_FILE.replace(".onnx", f"{QUANTIZED_SUFFIX}.onnx")).exists():
+            pytest.skip(f"No exported ONNX models in {ONNX_MODEL_DIR}, see scripts/export_onnx_clip.py")
+        # Arrange
+        rng = numpy.random.default_rng(0)
+        inputs = ["blue poppy", "a white orchid in the snow",
+                  rng.integers(0, 256, size=(320, 480, 3), dtype=numpy.uint8),
+                  rng.integers(0, 256, size=(500, 400, 3), dtype=numpy.uint8)]
+        torch_function = create_clip_embedding_function("torch")
+        onnx_function = create_clip_embedding_function("onnx", model_dir=str(ONNX_MODEL_DIR))
+
+        # Act
+        expected = numpy.stack(torch_function(inputs))
+        actual = numpy.stack(onnx_function(inputs))
+
+        # Assert: both are unit length, so the row wise dot product is the cosine similarity
+        assert numpy.all(numpy.sum(expected * actual, axis=1) > 0.98)
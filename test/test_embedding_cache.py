@@ -0,0 +1,86 @@
+import numpy
+import pytest
+
+from embedding_cache import (KEYS_FILE, VECTORS_FILE, CachedEmbeddingFunction, EmbeddingCache, content_digest,
+                             embedding_model_id)
+
+
+class TestEmbeddingCache:
+    """Test suite for the append-only on-disk embedding cache."""
+
+    def test_digest_depends_on_content_and_kind(self):
+        pixels = numpy.zeros((2, 2, 3), dtype=numpy.uint8)
+
+        assert content_digest("blue poppy") == content_digest("blue poppy")
+        assert content_digest("blue poppy") != content_digest("Blue poppy")
+        assert content_digest(pixels) == content_digest(pixels.copy())
+        assert content_digest(pixels) != content_digest(pixels.reshape(3, 2, 2))
+        assert len(content_digest(pixels)) == 32
+
+    def test_embeddings_survive_reopening(self, tmp_path):
+        """Test stored embeddings are found by a new instance, and other models do not see them."""
+        # Arrange
+        cache = EmbeddingCache(tmp_path, "model-a")
+        digests = [content_digest(f"text {i}") for i in range(3)]
+        cache.put_many(digests[:2], [[1.0, 2.0], [3.0, 4.0]])
+
+        # Act
+        reopened = EmbeddingCache(tmp_path, "model-a")
+        found = reopened.get_many(digests)
+
+        # Assert
+        assert found[0].tolist() == [1.0, 2.0] and found[1].tolist() == [3.0, 4.0]
+        assert found[2] is None
+        assert reopened.stats() == {"size": 2, "hits": 2, "misses": 1}
+        assert EmbeddingCache(tmp_path, "model-b").get_many(digests[:1]) == [None]
+
+    def test_appends_after_reads_are_found(self, tmp_path):
+        """Test an embedding appended after the vectors were memory-mapped is read back."""
+        cache = EmbeddingCache(tmp_path, "model-a")
+        cache.put_many([content_digest("a")], [[1.0]])
+        cache.get_many([content_digest("a")])
+
+        cache.put_many([content_digest("b")], [[2.0]])
+
+        assert cache.get_many([content_digest("b")])[0].tolist() == [2.0]
+
+    def test_vector_without_its_key_is_ignored(self, tmp_path):
+        """Test a write cut short between the vector and its key leaves a readable cache."""
+        # Arrange
+        cache = EmbeddingCache(tmp_path, "model-a")
+        cache.put_many([content_digest("a")], [[1.0, 2.0]])
+        with open(cache.directory / VECTORS_FILE, "ab") as vectors_file:
+            vectors_file.write(numpy.array([9.0, 9.0], dtype=numpy.float32).tobytes())
+
+        # Act
+        reopened = EmbeddingCache(tmp_path, "model-a")
+        reopened.put_many([content_digest("b")], [[3.0, 4.0]])
+
+        # Assert
+        assert len(reopened) == 2
+        assert reopened.get_many([content_digest("b")])[0].tolist() == [3.0, 4.0]
+        assert (cache.directory / KEYS_FILE).stat().st_size == 64
+
+
+class TestCachedEmbeddingFunction:
+    """Test suite for CachedEmbeddingFunction."""
+
+    def test_only_unseen_inputs_are_embedded(self, tmp_path, counting_embedding_function):
+        """Test known texts and images come from the cache and the rest are embedded in one call."""
+        # Arrange
+        pixels = numpy.full((4, 4, 3), 7, dtype=numpy.uint8)
+        cached = CachedEmbeddingFunction(counting_embedding_function, tmp_path)
+        first = cached(["blue poppy", pixels])
+
+        # Act
+        second = CachedEmbeddingFunction(counting_embedding_function, tmp_path)(["white orchid", pixels, "blue poppy"])
+
+        # Assert
+        assert counting_embedding_function.num_calls == 2
+        assert (counting_embedding_function.num_texts, counting_embedding_function.num_images) == (2, 1)
+        assert second[1] == pytest.approx(first[1])
+        assert second[2] == pytest.approx(first[0])
+        assert second[0] == pytest.approx(counting_embedding_function(["white orchid"])[0])
+
+    def test_model_id_of_embedding_functions_without_one(self, counting_embedding_function):
+        assert embedding_model_id(counting_embedding_function).endswith("conftest.CountingEmbeddingFunction")
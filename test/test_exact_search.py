@@ -0,0 +1,196 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+
+from exact_search import ExactIndex, where_mask
+
+
+class TestWhereMask:
+    """Test suite for the NumPy evaluation of Chroma where filters."""
+
+    def test_operators_match_chroma_semantics(self):
+        columns = {
+            "family": numpy.array(["Primulaceae", "Rosaceae", "Primulaceae", None], dtype=object),
+            "num_images": numpy.array([1, 4, 2, None], dtype=object),
+        }
+
+        def mask(where):
+            return where_mask(columns, 4, where).tolist()
+
+        assert mask(None) == [True] * 4
+        assert mask({"family": "Primulaceae"}) == [True, False, True, False]
+        assert mask({"family": {"$in": ["Rosaceae", "Poaceae"]}}) == [False, True, False, False]
+        assert mask({"num_images": {"$gte": 2}}) == [False, True, True, False]
+        assert mask({"$and": [{"family": "Primulaceae"}, {"num_images": {"$gte": 2}}]}) == [False, False, True, False]
+        assert mask({"$or": [{"family": "Rosaceae"}, {"num_images": {"$lt": 2}}]}) == [True, True, False, False]
+        assert mask({"region": "sikkim"}) == [False] * 4
+
+
+class TestExactIndex:
+    """Tests comparing the exact index with Chroma's own results on a real, temporary ChromaDB."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, counting_embedding_function, text_dao):
+        self.tmp_path = tmp_path
+        self.embedding_function = counting_embedding_function
+        self.text_dao = text_dao
+        ids = [f"id{i}" for i in range(30)]
+        self.text_dao.upsert_documents_batch(ids, [f"Primrose {i}" for i in range(30)],
+                                             [{"family": "Primulaceae" if i % 2 else "Rosaceae", "num_images": i % 4}
+                                              for i in range(30)])
+
+    def test_results_match_chroma_ids_and_distances(self):
+        """Test a batch of filtered queries returns what Chroma returns, in the same shape and distance space."""
+        # Arrange
+        index = ExactIndex(self.text_dao, ["metadatas", "documents"])
+        queries = self.embedding_function(["Primrose 3", "Primrose 17"])
+        where = {"$and": [{"family": "Primulaceae"}, {"num_images": {"$gte": 1}}]}
+
+        # Act
+        exact = index.query_embeddings(queries, n_results=5, where=where)
+        expected = self.text_dao.query_embeddings(queries, n_results=5, where=where)
+
+        # Assert
+        assert exact["ids"] == expected["ids"]
+        assert exact["documents"] == expected["documents"]
+        assert exact["metadatas"] == expected["metadatas"]
+        for distances, expected_distances in zip(exact["distances"], expected["distances"]):
+            assert distances == pytest.approx(expected_distances, rel=1e-4, abs=1e-5)
+
+    def test_photos_are_grouped_into_distinct_flowers(self, make_search_service, add_clustered_photo_embeddings):
+        """Test a grouped index returns each flower once, at the distance of its closest photo."""
+        # Arrange
+        service = make_search_service(path=self.tmp_path / "service")
+        add_clustered_photo_embeddings(service, "Primrose 0", num_flowers=6, images_per_flower=4)
+        index = ExactIndex(service.image_dao, ["metadatas", "uris"], group_by="flora_id")
+        query = self.embedding_function(["Primrose 0"])
+
+        # Act
+        results = index.query_embeddings(query, n_results=3)
+
+        # Assert
+        assert [m["flora_id"] for m in results["metadatas"][0]] == ["id0", "id1", "id2"]
+        photos = service.image_dao.query_embeddings(query, n_results=24)
+        closest = {}
+        for metadata, distance in zip(photos["metadatas"][0], photos["distances"][0]):
+            closest.setdefault(metadata["flora_id"], distance)
+        assert results["distances"][0] == pytest.approx([closest[f"id{i}"] for i in range(3)], rel=1e-4)
+
+    def test_concurrent_snapshot_writes_publish_a_complete_matrix(self):
+        """Test indexes writing one snapshot at once (worker processes loading together) each map a complete matrix
+        and leave no partial file behind."""
+        # Arrange
+        index = ExactIndex(self.text_dao, ["metadatas"], snapshot_dir=self.tmp_path / "exact")
+        matrix = numpy.random.default_rng(0).random((4096, 512), dtype=numpy.float32)
+        start = threading.Barrier(8)
+
+        def store(_):
+            start.wait()
+            return index._store(matrix)
+
+        # Act
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            snapshots = list(pool.map(store, range(8)))
+
+        # Assert
+        for snapshot in snapshots:
+            assert numpy.array_equal(snapshot, matrix)
+        assert os.listdir(self.tmp_path / "exact") == ["flora_text.float32.npy"]
+
+    def test_concurrent_queries_scan_at_once(self):
+        """Test queries on one index run their matrix products side by side instead of queueing on a lock."""
+        # Arrange
+        index = ExactIndex(self.text_dao, ["metadatas"])
+        both_scanning = threading.Barrier(2, timeout=5)
+        scores = index._scores
+
+        def scores_together(matrix, queries):
+            both_scanning.wait()
+            return scores(matrix, queries)
+
+        index._scores = scores_together
+        queries = self.embedding_function(["Primrose 4", "Primrose 9"])
+
+        # Act
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda query: index.query_embeddings([query], n_results=1), queries))
+
+        # Assert
+        assert [result["ids"] for result in results] == [[["id4"]], [["id9"]]]
+
+    def test_refresh_reloads_written_collections_only(self, fused_dao):
+        """Test queries keep the loaded embeddings until a refresh, which only reloads after its collection's writes."""
+        # Arrange
+        index = ExactIndex(self.text_dao, ["metadatas", "documents"])
+        query = self.embedding_function(["Blue poppy"])
+        fused_dao.upsert_embeddings_batch(["id1"], query, [{"botanical_name": "Primula 1"}])
+        unchanged = index.refresh()
+        self.text_dao.upsert_documents_batch(["new"], ["Blue poppy"], [{"family": "Papaveraceae"}])
+
+        # Act
+        before = index.query_embeddings(query, n_results=1)
+        reloaded = index.refresh()
+        after = index.query_embeddings(query, n_results=1)
+
+        # Assert
+        assert not unchanged
+        assert before["ids"] != [["new"]]
+        assert reloaded and not index.refresh()
+        assert after["ids"] == [["new"]]
+        assert len(index) == 31
+
+    def test_service_refreshes_its_indexes_and_results(self, make_search_service, flower_metadata):
+        """Test cached results of a stale exact index are not served once the index caught up with a write."""
+        # Arrange
+        service = make_search_service(path=self.tmp_path / "service", engine="exact")
+        service.search("Blue poppy", None, n=1)
+        service.text_dao.upsert_documents_batch(["new"], ["Blue poppy"],
+                                                [{**flower_metadata(99), "botanical_name": "Meconopsis"}])
+        service.search("Blue poppy", None, n=1)
+
+        # Act
+        num_reloaded = service.refresh_exact_indexes()
+        results = service.search("Blue poppy", None, n=1)
+
+        # Assert
+        assert num_reloaded == 1
+        assert [flower.botanical_name for flower in results] == ["Meconopsis"]
+
+    def test_float16_snapshot_is_memory_mapped_and_ranks_alike(self):
+        """Test the float16 matrix halves memory, is memory-mapped from its snapshot and keeps the ranking."""
+        # Arrange
+        full = ExactIndex(self.text_dao, ["metadatas"])
+        half = ExactIndex(self.text_dao, ["metadatas"], dtype="float16", snapshot_dir=self.tmp_path / "exact")
+        queries = self.embedding_function(["Primrose 8", "Primrose 21"])
+
+        # Act / Assert
+        assert half.nbytes * 2 == full.nbytes
+        assert isinstance(half._loaded.matrix, numpy.memmap)
+        assert half.query_embeddings(queries, 3)["ids"] == full.query_embeddings(queries, 3)["ids"]
+
+
+class TestExactSearchEngine:
+    """Test suite for SearchService running on the exact engine."""
+
+    def test_exact_engine_returns_the_chroma_results(self, make_search_service, add_clustered_photo_embeddings):
+        """Test text and image mode searches give the same flowers on both engines."""
+        # Arrange
+        chroma_service = make_search_service()
+        add_clustered_photo_embeddings(chroma_service, "Primrose 0")
+        exact_service = make_search_service(engine="exact")
+
+        for mode in ("text", "image"):
+            # Act
+            expected = chroma_service.search("Primrose 0", None, n=4, mode=mode)
+            flowers = exact_service.search("Primrose 0", None, n=4, mode=mode)
+
+            # Assert
+            assert [f.botanical_name for f in flowers] == [f.botanical_name for f in expected]
+            assert [f.distance for f in flowers] == pytest.approx([f.distance for f in expected], rel=1e-4)
+
+    def test_unknown_engine_is_rejected(self, make_search_service):
+        with pytest.raises(ValueError, match="Unknown search engine"):
+            make_search_service(engine="faiss")
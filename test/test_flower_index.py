@@ -0,0 +1,54 @@
+import pytest
+
+from flower_index import FlowerIndex
+
+
+class TestFlowerIndex:
+    """Test suite for the in-memory flower metadata index."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, counting_embedding_function, text_dao, flower_metadata):
+        self.embedding_function = counting_embedding_function
+        self.flower_metadata = flower_metadata
+        self.text_dao = text_dao
+        self.text_dao.upsert_documents_batch([f"id{i}" for i in range(5)], [f"Primrose {i}" for i in range(5)],
+                                             [flower_metadata(i) for i in range(5)])
+
+    def test_lookups_by_id_and_botanical_name_skip_chroma_and_model(self):
+        """Test an indexed flower is found by flora id and by case-insensitive botanical name."""
+        # Arrange
+        index = FlowerIndex(self.text_dao, page_size=2)
+        index.refresh()
+        calls_before = self.embedding_function.num_calls
+        self.text_dao.get = None
+
+        # Act
+        by_id = index.get("id3")
+        by_name = index.get_by_botanical_name("  primula   3 ")
+
+        # Assert
+        assert len(index) == 5
+        assert by_id is by_name
+        assert by_id.flower.common_name == "Primrose 3"
+        assert index.get("id9") is None
+        assert self.embedding_function.num_calls == calls_before
+
+    def test_refresh_only_replaces_changed_flowers(self):
+        """Test a refresh after writes swaps in changed flowers, drops deleted ones and keeps the rest."""
+        # Arrange
+        index = FlowerIndex(self.text_dao)
+        index.refresh()
+        unchanged, changed = index.get("id1"), index.get("id2")
+        self.text_dao.update_metadata_batch(["id2"], [self.flower_metadata(2, "Now with purple flowers")])
+        self.text_dao.delete(ids=["id4"])
+
+        # Act
+        num_changed = index.refresh()
+
+        # Assert
+        assert num_changed == 2
+        assert index.get("id1") is unchanged
+        assert index.get("id2").flower.description == "Now with purple flowers"
+        assert index.get("id2").etag != changed.etag
+        assert index.get("id4") is None and index.get_by_botanical_name("Primula 4") is None
+        assert index.refresh() == 0
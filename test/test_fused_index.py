@@ -0,0 +1,61 @@
+import numpy
+import pytest
+
+from fused_index import delete_orphaned_fused_embeddings, fuse_embeddings, update_fused_embeddings
+
+
+class TestFuseEmbeddings:
+    """Test suite for fuse_embeddings."""
+
+    def test_fused_embedding_is_unit_length_weighted_mean(self):
+        """Test the fused vector lies between the description and the mean photo, weighted by text_weight."""
+        text, photos = [2.0, 0.0], [[0.0, 3.0], [0.0, 1.0]]
+
+        fused = fuse_embeddings(text, photos, text_weight=0.75)
+
+        assert numpy.linalg.norm(fused) == pytest.approx(1.0)
+        assert fused[0] / fused[1] == pytest.approx(3.0)
+
+    def test_flower_without_photos_keeps_its_text_direction(self):
+        """Test a flower with no photos is represented by its normalized text embedding alone."""
+        fused = fuse_embeddings([3.0, 4.0], [])
+
+        assert fused == pytest.approx([0.6, 0.8])
+
+
+class TestUpdateFusedEmbeddings:
+    """Test suite for update_fused_embeddings and delete_orphaned_fused_embeddings."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, counting_embedding_function, text_dao, image_dao, fused_dao):
+        self.embedding_function = counting_embedding_function
+        self.text_dao, self.image_dao, self.fused_dao = text_dao, image_dao, fused_dao
+        ids = [f"id{i}" for i in range(5)]
+        self.text_dao.upsert_documents_batch(ids, [f"Primrose {i}" for i in range(5)],
+                                             [{"common_name": f"Primrose {i}"} for i in range(5)])
+        self.image_dao.collection.upsert(ids=["img0-0", "img0-1"], embeddings=[[1.0] * 8, [0.5] * 8],
+                                         metadatas=[{"flora_id": "id0"}, {"flora_id": "id0"}])
+
+    def test_rebuild_stores_one_embedding_per_flower_with_its_metadata(self):
+        """Test a full rebuild pages through every flower without running the embedding function."""
+        calls_before = self.embedding_function.num_calls
+
+        num_updated = update_fused_embeddings(self.text_dao, self.image_dao, self.fused_dao, batch_size=2)
+
+        assert num_updated == 5
+        assert self.embedding_function.num_calls == calls_before
+        fused = self.fused_dao.get(["id0", "id4"], include=["metadatas", "embeddings"])
+        by_id = dict(zip(fused["ids"], zip(fused["metadatas"], fused["embeddings"])))
+        assert by_id["id4"][0] == {"common_name": "Primrose 4"}
+        text_embedding = self.text_dao.get(["id0"], include=["embeddings"])["embeddings"][0]
+        assert by_id["id0"][1] == pytest.approx(fuse_embeddings(text_embedding, [[1.0] * 8, [0.5] * 8]))
+
+    def test_orphaned_fused_embeddings_are_deleted(self):
+        """Test flowers removed from the text collection lose their fused embedding."""
+        update_fused_embeddings(self.text_dao, self.image_dao, self.fused_dao)
+        self.text_dao.delete(ids=["id1", "id2"])
+
+        num_deleted = delete_orphaned_fused_embeddings(self.text_dao, self.fused_dao)
+
+        assert num_deleted == 2
+        assert sorted(self.fused_dao.get(limit=None, include=[])["ids"]) == ["id0", "id3", "id4"]
@@ -0,0 +1,70 @@
+import pytest
+
+import chroma
+from chroma import FloraImageDAO, FloraTextDAO, hnsw_settings, parse_hnsw_settings
+
+
+class TestHnswSettings:
+    """Test suite for the configurable HNSW index settings of the collections."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, chroma_client, counting_embedding_function):
+        monkeypatch.setattr(chroma, "_hnsw_overrides", {})
+        monkeypatch.delenv("FLORA_HNSW", raising=False)
+        self.monkeypatch = monkeypatch
+        self.client = chroma_client
+        self.embedding_function = counting_embedding_function
+
+    def test_settings_are_parsed_and_typed(self):
+        assert parse_hnsw_settings(" space=cosine, max_neighbors=32,ef_search=64 ") == \
+            {"space": "cosine", "max_neighbors": 32, "ef_search": 64}
+        assert parse_hnsw_settings("") == {}
+        with pytest.raises(ValueError, match="Unknown HNSW parameter 'M'"):
+            parse_hnsw_settings("M=16")
+
+    def test_collection_settings_win_over_shared_ones(self):
+        """Test per collection settings override those of every collection, and configure_hnsw the environment."""
+        # Arrange
+        self.monkeypatch.setenv("FLORA_HNSW", "space=cosine,ef_search=40")
+        self.monkeypatch.setenv("FLORA_HNSW_FLORA_IMAGES", "max_neighbors=32,ef_search=80")
+
+        # Act
+        chroma.configure_hnsw("flora_text", ef_search=20)
+
+        # Assert
+        assert hnsw_settings("flora_images") == {"space": "cosine", "max_neighbors": 32, "ef_search": 80}
+        assert hnsw_settings("flora_text") == {"space": "cosine", "ef_search": 20}
+        with pytest.raises(ValueError, match="Unknown HNSW parameters: M"):
+            chroma.configure_hnsw(M=16)
+
+    def test_new_collection_is_built_with_its_settings(self):
+        """Test a collection created with settings gets them, and the others keep Chroma's defaults."""
+        # Arrange
+        chroma.configure_hnsw("flora_images", space="cosine", max_neighbors=32, ef_construction=200, ef_search=64)
+
+        # Act
+        image_dao = FloraImageDAO(self.client, self.embedding_function)
+        text_dao = FloraTextDAO(self.client, self.embedding_function)
+
+        # Assert
+        configuration = image_dao.hnsw_configuration()
+        assert {key: configuration[key] for key in chroma.HNSW_PARAMETERS} == \
+            {"space": "cosine", "max_neighbors": 32, "ef_construction": 200, "ef_search": 64}
+        assert image_dao.distance_space() == "cosine"
+        assert text_dao.distance_space() == "l2"
+
+    def test_existing_collection_takes_ef_search_and_reports_build_settings(self, capsys):
+        """Test ef_search changes on an existing collection, while build settings only need a rebuild."""
+        # Arrange
+        FloraTextDAO(self.client, self.embedding_function).upsert_documents_batch(
+            ["id0"], ["Primrose"], [{"num_images": 0}])
+        chroma.configure_hnsw("flora_text", space="cosine", ef_search=25)
+
+        # Act
+        text_dao = FloraTextDAO(self.client, self.embedding_function)
+
+        # Assert
+        assert text_dao.hnsw_configuration()["ef_search"] == 25
+        assert text_dao.distance_space() == "l2"
+        assert "flora_text was built with {'space': 'l2'}" in capsys.readouterr().out
+        assert text_dao.get_collection_count() == 1
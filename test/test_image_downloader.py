@@ -0,0 +1,198 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from image_downloader import ImageDownloader
+
+IMAGE_BYTES = b"\xff\xd8\xff" + b"flower" * 50_000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves fake images: /ok always works, /flaky fails once per server, /missing is a 404, /unchanged
+    answers conditional requests with 304 Not Modified and /slow sends its body in pieces"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/flaky") and self.path not in server.failed_once:
+                server.failed_once.add(self.path)
+                self.send_response(503)
+                self.end_headers()
+            elif self.path.startswith("/unchanged") and self.headers.get("If-Modified-Since"):
+                self.send_response(304)
+                self.end_headers()
+            elif self.path.startswith("/missing"):
+                self.send_response(404)
+                self.end_headers()
+            else:
+                time.sleep(server.delay)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(IMAGE_BYTES)))
+                self.end_headers()
+                pieces = 10 if self.path.startswith("/slow") else 1
+                for start in range(0, len(IMAGE_BYTES), len(IMAGE_BYTES) // pieces):
+                    self.wfile.write(IMAGE_BYTES[start:start + len(IMAGE_BYTES) // pieces])
+                    self.wfile.flush()
+                    time.sleep(0.01 if pieces > 1 else 0)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.failed_once = set()
+    httpd.active = 0
+    httpd.max_active = 0
+    httpd.delay = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+class TestImageDownloader:
+    """Test suite for ImageDownloader against a local HTTP stand-in server."""
+
+    def test_download_streams_image_to_disk(self, server, tmp_path):
+        """Test download writes the full response body and leaves no partial file."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+
+        # Act
+        with ImageDownloader(workers=2) as downloader:
+            result = downloader.download(url(server, "/ok/rose.jpg"), file_path)
+
+        # Assert
+        assert result == str(file_path)
+        assert file_path.read_bytes() == IMAGE_BYTES
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    def test_download_skips_existing_file(self, server, tmp_path):
+        """Test download does not request images already on disk."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+        file_path.write_bytes(b"cached")
+
+        # Act
+        with ImageDownloader(workers=2) as downloader:
+            result = downloader.download(url(server, "/ok/rose.jpg"), file_path)
+
+        # Assert
+        assert result == str(file_path)
+        assert server.requests == []
+
+    def test_download_retries_server_errors(self, server, tmp_path):
+        """Test a 503 response is retried and the download then succeeds."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+
+        # Act
+        with ImageDownloader(workers=2, backoff_factor=0) as downloader:
+            result = downloader.download(url(server, "/flaky/rose.jpg"), file_path)
+
+        # Assert
+        assert result == str(file_path)
+        assert server.requests == ["/flaky/rose.jpg", "/flaky/rose.jpg"]
+
+    def test_download_failure_returns_none(self, server, tmp_path):
+        """Test a failed download returns None and does not leave a file behind."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+
+        # Act
+        with ImageDownloader(workers=2, backoff_factor=0) as downloader:
+            result = downloader.download(url(server, "/missing/rose.jpg"), file_path)
+            empty_url_result = downloader.download("  ", file_path)
+
+        # Assert
+        assert result is None
+        assert empty_url_result is None
+        assert list(tmp_path.iterdir()) == []
+
+    def test_submit_downloads_in_parallel_within_host_limit(self, server, tmp_path):
+        """Test submitted downloads run concurrently but never exceed the per host limit."""
+        # Arrange
+        server.delay = 0.05
+
+        # Act
+        with ImageDownloader(workers=8, per_host_limit=3) as downloader:
+            futures = [downloader.submit(url(server, f"/ok/{i}.jpg"), tmp_path / f"{i}.jpg") for i in range(12)]
+            results = [f.result() for f in futures]
+
+        # Assert
+        assert results == [str(tmp_path / f"{i}.jpg") for i in range(12)]
+        assert 1 < server.max_active <= 3
+
+    def test_parallel_downloads_of_one_path_all_succeed(self, server, tmp_path):
+        """Test flowers sharing a file name, downloaded at once, each get the path of one complete image."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+
+        # Act
+        with ImageDownloader(workers=4, per_host_limit=4) as downloader:
+            futures = [downloader.submit(url(server, f"/slow/rose{i}.jpg"), file_path) for i in range(4)]
+            results = [f.result() for f in futures]
+
+        # Assert
+        assert results == [str(file_path)] * 4
+        assert file_path.read_bytes() == IMAGE_BYTES
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    def test_refresh_keeps_file_the_server_reports_unchanged(self, server, tmp_path):
+        """Test a conditional refresh sends If-Modified-Since and keeps the file on 304 Not Modified."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+        file_path.write_bytes(b"cached")
+
+        # Act
+        with ImageDownloader(workers=2) as downloader:
+            result = downloader.download(url(server, "/unchanged/rose.jpg"), file_path, refresh=True)
+
+        # Assert
+        assert result == str(file_path)
+        assert server.requests == ["/unchanged/rose.jpg"]
+        assert file_path.read_bytes() == b"cached"
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    def test_unconditional_refresh_replaces_file(self, server, tmp_path):
+        """Test a refresh of a file whose url changed downloads it again without asking the server."""
+        # Arrange
+        file_path = tmp_path / "rose_img1.jpg"
+        file_path.write_bytes(b"old photo")
+
+        # Act
+        with ImageDownloader(workers=2) as downloader:
+            result = downloader.download(url(server, "/unchanged/rose.jpg"), file_path, refresh=True,
+                                         conditional=False)
+
+        # Assert
+        assert result == str(file_path)
+        assert file_path.read_bytes() == IMAGE_BYTES
+
+    def test_failed_refresh_keeps_existing_file(self, server, tmp_path):
+        file_path = tmp_path / "rose_img1.jpg"
+        file_path.write_bytes(b"cached")
+
+        with ImageDownloader(workers=2, backoff_factor=0) as downloader:
+            result = downloader.download(url(server, "/missing/rose.jpg"), file_path, refresh=True)
+
+        assert result == str(file_path)
+        assert file_path.read_bytes() == b"cached"
@@ -0,0 +1,48 @@
+from import_checkpoint import ImportCheckpoint
+
+
+class TestImportCheckpoint:
+    """Test suite for ImportCheckpoint class."""
+
+    def test_resume_loads_recorded_flowers(self, tmp_path):
+        """Test a resumed checkpoint knows the flowers recorded by an earlier run."""
+        # Arrange
+        path = tmp_path / "checkpoint.jsonl"
+        ImportCheckpoint(path).mark_done({"flower-1": ["img-1", "img-2"], "flower-2": []})
+
+        # Act
+        checkpoint = ImportCheckpoint(path, resume=True)
+
+        # Assert
+        assert checkpoint.is_done("flower-1")
+        assert checkpoint.is_done("flower-2")
+        assert not checkpoint.is_done("flower-3")
+        assert checkpoint.done["flower-1"] == ["img-1", "img-2"]
+
+    def test_without_resume_records_but_skips_nothing(self, tmp_path):
+        """Test a fresh checkpoint ignores, but keeps appending to, an existing manifest."""
+        # Arrange
+        path = tmp_path / "checkpoint.jsonl"
+        ImportCheckpoint(path).mark_done({"flower-1": []})
+
+        # Act
+        checkpoint = ImportCheckpoint(path)
+        checkpoint.mark_done({"flower-2": []})
+
+        # Assert
+        assert not checkpoint.is_done("flower-1")
+        assert ImportCheckpoint(path, resume=True).done.keys() == {"flower-1", "flower-2"}
+
+    def test_resume_ignores_truncated_last_line(self, tmp_path):
+        """Test a line cut short by a crash does not break resuming."""
+        # Arrange
+        path = tmp_path / "checkpoint.jsonl"
+        ImportCheckpoint(path).mark_done({"flower-1": []})
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"flora_id": "flower-2", "ima')
+
+        # Act
+        checkpoint = ImportCheckpoint(path, resume=True)
+
+        # Assert
+        assert checkpoint.done == {"flower-1": []}
@@ -1,9 +1,31 @@
+import csv
+from concurrent.futures import Future
+from dataclasses import asdict
+from pathlib import Path
 from unittest.mock import MagicMock, mock_open, patch
 
-from import_data import FloraImporter
+import chromadb
+import numpy
+import pytest
+from PIL import Image
+
+from chroma import FloraImageDAO, FloraTextDAO
+from embedding_cache import CachedEmbeddingFunction
+from import_checkpoint import ImportCheckpoint
+from import_data import DEFAULT_BATCH_SIZE, FloraImporter
 from models import Flower
 
 
+def set_fields(flower: Flower) -> dict:
+    return {key: value for key, value in asdict(flower).items() if value is not None}
+
+
+def completed(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
 class TestFloraImporter:
     """Test suite for FloraImporter class."""
 
@@ -51,29 +73,15 @@ class TestFloraImporter:
         assert importer.download_images is True
         mock_path_class.assert_called_once_with("img")
 
-    @patch("import_data.open", new_callable=mock_open)
-    @patch("import_data.requests.get")
-    @patch("import_data.Path")
-    def test_download_image_successful_download(self, mock_path_class, mock_requests_get, mock_file_open):
-        """Test _download_image successfully downloads and saves an image."""
+    def test_download_image_submits_to_downloader(self):
+        """Test _download_image schedules the download into the image directory."""
         # Arrange
-        mock_path_instance = MagicMock()
-        mock_path_class.return_value = mock_path_instance
-
-        # Setup file path mocking
-        mock_file_path = MagicMock()
-        mock_path_instance.__truediv__.return_value = mock_file_path
-        mock_path_class.return_value.is_file.return_value = False
-
-        # Setup requests mock
-        mock_response = MagicMock()
-        mock_response.content = b"fake_image_content"
-        mock_requests_get.return_value = mock_response
-
+        mock_downloader = MagicMock()
         importer = FloraImporter(
             csv_file_path=self.csv_file_path,
             chromadb_client=self.mock_chromadb_client,
-            img_directory=self.img_directory
+            img_directory=self.img_directory,
+            downloader=mock_downloader
         )
 
         url = "https://example.com/flower.jpg"
@@ -83,54 +91,20 @@ class TestFloraImporter:
         result = importer._download_image(url, filename)
 
         # Assert
-        assert result == str(mock_file_path)
-        mock_requests_get.assert_called_once_with(url, timeout=30)
-        mock_response.raise_for_status.assert_called_once()
-        mock_file_open.assert_called_once_with(mock_file_path, "wb")
-
-    @patch("import_data.Path")
-    def test_download_image_file_already_exists(self, mock_path_class):
-        """Test _download_image when file already exists locally."""
-        # Arrange
-        mock_path_instance = MagicMock()
-        mock_path_class.return_value = mock_path_instance
-
-        mock_file_path = MagicMock()
-        mock_path_instance.__truediv__.return_value = mock_file_path
-        mock_path_class.return_value.is_file.return_value = True
-
-        importer = FloraImporter(
-            csv_file_path=self.csv_file_path,
-            chromadb_client=self.mock_chromadb_client,
-            img_directory=self.img_directory
-        )
-
-        url = "https://example.com/flower.jpg"
-        filename = "test_flower_img1"
+        assert result == mock_downloader.submit.return_value
+        mock_downloader.submit.assert_called_once_with(url, Path(self.img_directory) / "test_flower_img1.jpg",
+                                                       refresh=False, conditional=True)
 
+    def test_collect_downloads_skips_failed_downloads(self):
+        """Test _collect_downloads waits for downloads and drops the ones that failed."""
         # Act
-        result = importer._download_image(url, filename)
+        result = FloraImporter._collect_downloads({
+            "image1_local_uri": completed("/path/img1.jpg"),
+            "image2_local_uri": completed(None),
+        })
 
         # Assert
-        assert result == str(mock_file_path)
-
-    @patch("import_data.Path")
-    def test_download_image_empty_url(self, mock_path_class):
-        """Test _download_image with empty URL returns None."""
-        # Arrange
-        mock_path_instance = MagicMock()
-        mock_path_class.return_value = mock_path_instance
-
-        importer = FloraImporter(
-            csv_file_path=self.csv_file_path,
-            chromadb_client=self.mock_chromadb_client,
-            img_directory=self.img_directory
-        )
-
-        # Act & Assert
-        assert importer._download_image("", "filename") is None
-        assert importer._download_image("   ", "filename") is None
-        assert importer._download_image(None, "filename") is None
+        assert result == {"image1_local_uri": "/path/img1.jpg"}
 
     def test_create_safe_filename(self):
         """Test _create_safe_filename creates proper safe filenames."""
@@ -183,10 +157,29 @@ class TestFloraImporter:
         assert flower.description == "Beautiful fragrant rose"
         assert flower.image1_url == "https://example.com/rose1.jpg"
         assert flower.image2_url == "https://example.com/rose2.jpg"
+        assert flower.region is None
 
         assert image_paths == mock_image_paths
         mock_download_images.assert_called_once_with(flower)
 
+    @patch.object(FloraImporter, "_download_images", return_value={})
+    def test_flower_metadata_holds_typed_filter_fields(self, mock_download_images):
+        """Test filter fields are normalized, counted and never stored as None."""
+        # Arrange
+        importer = FloraImporter(csv_file_path=self.csv_file_path, chromadb_client=self.mock_chromadb_client)
+        flower, _ = importer._process_row({"botanical_name": "Primula denticulata", "family": " Primulaceae ",
+                                           "url": "https://example.com/p", "common_name": "Drumstick Primula",
+                                           "region": " Sikkim ", "color": "Purple"})
+
+        # Act
+        image_paths = {"image1_local_uri": "/p1.jpg", "image2_local_uri": "/p2.jpg"}
+        metadata = FloraImporter._flower_metadata(flower, image_paths)
+
+        # Assert
+        assert FloraImporter._filter_metadata(metadata) == {
+            "family": "primulaceae", "region": "sikkim", "color": "purple", "num_images": 2}
+        assert None not in metadata.values()
+
     @patch.object(FloraImporter, "_download_image")
     @patch.object(FloraImporter, "_create_safe_filename")
     def test_download_images_processes_all_image_urls(self, mock_create_filename, mock_download_image):
@@ -242,9 +235,26 @@ class TestFloraImporter:
         ]
 
         for start, end, expected in test_cases:
-            result = FloraImporter._slice_rows(iter(test_data), start, end)
+            result = list(FloraImporter._slice_rows(iter(test_data), start, end))
             assert result == expected, f"Failed for start={start}, end={end}"
 
+    def test_slice_rows_is_lazy(self):
+        """Test _slice_rows does not consume rows past the end index."""
+        # Arrange
+        rows = iter(range(100))
+
+        # Act
+        result = list(FloraImporter._slice_rows(rows, 2, 5))
+
+        # Assert
+        assert result == [2, 3, 4]
+        assert next(rows) == 5
+
+    def test_batched_groups_rows(self):
+        """Test _batched groups rows into batches of at most batch_size."""
+        assert list(FloraImporter._batched(iter(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+        assert list(FloraImporter._batched(iter([]), 3)) == []
+
     def test_join_text_fields_creates_proper_document_text(self):
         """Test _join_text_fields creates proper document text from flower data."""
         # Arrange
@@ -266,14 +276,15 @@ class TestFloraImporter:
                     "Description: A beautiful and fragrant rose species")
         assert result == expected
 
-    @patch("uuid.uuid4")
-    @patch.object(FloraImporter, "_save_images")
+    @patch.object(FloraImporter, "_hash_file", return_value="image-hash")
+    @patch.object(FloraImporter, "_save_to_fused_collection")
+    @patch.object(FloraImporter, "_save_to_image_collection")
     @patch.object(FloraImporter, "_save_to_text_collection")
     @patch.object(FloraImporter, "_join_text_fields")
     @patch.object(FloraImporter, "_process_row")
     def test_process_rows_processes_all_rows(self, mock_process_row, mock_join_text,
-                                             mock_save_text, mock_save_images, mock_uuid):
-        """Test _process_rows processes all rows and saves data correctly."""
+                                             mock_save_text, mock_save_images, mock_save_fused, mock_hash_file):
+        """Test _process_rows processes all rows and saves each batch with one write per collection."""
         # Arrange
         importer = FloraImporter(
             csv_file_path=self.csv_file_path,
@@ -292,21 +303,66 @@ class TestFloraImporter:
                               url="https://test2.com", common_name="Rose 2")
 
         mock_process_row.side_effect = [
-            (mock_flower1, {"image1_local_uri": "/path1.jpg"}),
-            (mock_flower2, {"image1_local_uri": "/path2.jpg"})
+            (mock_flower1, {"image1_local_uri": completed("/path1.jpg")}),
+            (mock_flower2, {"image1_local_uri": completed("/path2.jpg")})
         ]
 
         mock_join_text.side_effect = ["Document text 1", "Document text 2"]
-        mock_uuid.side_effect = ["id1", "id2"]
+        id1 = FloraImporter._flower_id({"url": "https://test1.com"})
+        id2 = FloraImporter._flower_id({"url": "https://test2.com"})
+        img1 = FloraImporter._image_documents(id1, {"image1_local_uri": "/path1.jpg"})[0][0]
+        img2 = FloraImporter._image_documents(id2, {"image1_local_uri": "/path2.jpg"})[0][0]
 
         # Act
-        importer._process_rows(rows, start=0)
+        result = importer._process_rows(rows, start=0, batch_size=10)
 
         # Assert
+        assert result == 2
         assert mock_process_row.call_count == 2
         assert mock_join_text.call_count == 2
-        assert mock_save_text.call_count == 2
-        assert mock_save_images.call_count == 2
+        mock_save_text.assert_called_once_with(
+            [id1, id2],
+            ["Document text 1", "Document text 2"],
+            [
+                {**set_fields(mock_flower1), "family": "rosaceae", "image1_local_uri": "/path1.jpg",
+                 "num_images": 1,
+                 "thumbnail": "path1.jpg",
+                 "text_hash": FloraImporter._hash_text("Document text 1")},
+                {**set_fields(mock_flower2), "family": "rosaceae", "image1_local_uri": "/path2.jpg",
+                 "num_images": 1,
+                 "thumbnail": "path2.jpg",
+                 "text_hash": FloraImporter._hash_text("Document text 2")},
+            ]
+        )
+        filters = {"family": "rosaceae", "num_images": 1, "image_hash": "image-hash"}
+        mock_save_images.assert_called_once_with(
+            [img1, img2],
+            ["/path1.jpg", "/path2.jpg"],
+            [{"flora_id": id1, **filters}, {"flora_id": id2, **filters}]
+        )
+        mock_save_fused.assert_called_once_with([id1, id2])
+
+    @patch.object(FloraImporter, "_save_batch")
+    @patch.object(FloraImporter, "_process_row")
+    def test_process_rows_splits_rows_into_batches(self, mock_process_row, mock_save_batch):
+        """Test _process_rows starts each batch's downloads before saving the previous batch."""
+        # Arrange
+        importer = FloraImporter(
+            csv_file_path=self.csv_file_path,
+            chromadb_client=self.mock_chromadb_client
+        )
+        rows = [{"common_name": f"Rose {i}"} for i in range(5)]
+        events = []
+        mock_process_row.side_effect = lambda row: events.append(("download", row["common_name"])) or row
+        mock_save_batch.side_effect = lambda batch: events.append(("save", [r["common_name"] for r in batch]))
+
+        # Act
+        result = importer._process_rows(iter(rows), start=0, batch_size=2)
+
+        # Assert
+        assert result == 5
+        assert [c.args[0] for c in mock_save_batch.call_args_list] == [rows[0:2], rows[2:4], rows[4:5]]
+        assert events.index(("download", "Rose 2")) < events.index(("save", ["Rose 0", "Rose 1"]))
 
     @patch("import_data.FloraTextDAO")
     def test_save_to_text_collection(self, mock_text_dao_class):
@@ -320,46 +376,91 @@ class TestFloraImporter:
             chromadb_client=self.mock_chromadb_client
         )
 
-        document_id = "test-id"
-        document = "Test document text"
-        metadata = {"botanical_name": "Test Plant"}
+        document_ids = ["test-id"]
+        documents = ["Test document text"]
+        metadata_list = [{"botanical_name": "Test Plant"}]
 
         # Act
-        importer._save_to_text_collection(document_id, document, metadata)
+        importer._save_to_text_collection(document_ids, documents, metadata_list)
 
         # Assert
-        mock_text_dao_class.assert_called_once_with(self.mock_chromadb_client)
-        mock_text_dao.add_document.assert_called_once_with(document_id, document, metadata)
+        mock_text_dao_class.assert_called_once_with(self.mock_chromadb_client, None)
+        mock_text_dao.upsert_documents_batch.assert_called_once_with(document_ids, documents, metadata_list)
 
-    @patch("uuid.uuid4")
-    @patch.object(FloraImporter, "_save_to_image_collection")
-    def test_save_images_processes_image_paths(self, mock_save_to_collection, mock_uuid):
-        """Test _save_images processes image paths and calls batch save."""
+    @patch("import_data.FloraImageDAO")
+    @patch("import_data.FloraTextDAO")
+    def test_daos_are_reused_across_rows(self, mock_text_dao_class, mock_image_dao_class):
+        """Test the importer builds each DAO once instead of once per saved row."""
         # Arrange
         importer = FloraImporter(
             csv_file_path=self.csv_file_path,
             chromadb_client=self.mock_chromadb_client
         )
 
+        # Act
+        for i in range(3):
+            importer._save_to_text_collection([f"id-{i}"], ["text"], [{}])
+            importer._save_to_image_collection([f"img-{i}"], ["/path/img.jpg"], [{"flora_id": f"id-{i}"}])
+
+        # Assert
+        mock_text_dao_class.assert_called_once_with(self.mock_chromadb_client, None)
+        mock_image_dao_class.assert_called_once_with(self.mock_chromadb_client, None)
+        assert mock_text_dao_class.return_value.upsert_documents_batch.call_count == 3
+        assert mock_image_dao_class.return_value.upsert_documents_batch.call_count == 3
+
+    def test_image_documents_processes_image_paths(self):
+        """Test _image_documents builds stable ids, uris and metadata for every image path."""
+        # Arrange
         flower_id = "flower-123"
         image_paths = {
             "image1_local_uri": "/path/to/img1.jpg",
             "image2_local_uri": "/path/to/img2.jpg"
         }
 
-        mock_uuid.side_effect = ["img-id-1", "img-id-2"]
-
         # Act
-        importer._save_images(flower_id, image_paths)
+        result = FloraImporter._image_documents(flower_id, image_paths)
+        rerun_result = FloraImporter._image_documents(flower_id, image_paths)
 
         # Assert
-        expected_document_ids = ["img-id-1", "img-id-2"]
-        expected_uris = ["/path/to/img1.jpg", "/path/to/img2.jpg"]
-        expected_metadata = [{"flora_id": flower_id}, {"flora_id": flower_id}]
+        document_ids, uris, metadata_list = result
+        assert len(set(document_ids)) == 2
+        assert uris == ["/path/to/img1.jpg", "/path/to/img2.jpg"]
+        assert metadata_list == [{"flora_id": flower_id}, {"flora_id": flower_id}]
+        assert rerun_result == result
+
+    def test_flower_id_is_deterministic(self):
+        """Test _flower_id derives the same id from the flower url on every run."""
+        rose = {"url": "https://example.com/rosa", "botanical_name": "Rosa damascena"}
+
+        assert FloraImporter._flower_id(rose) == FloraImporter._flower_id(dict(rose))
+        assert FloraImporter._flower_id(rose) != FloraImporter._flower_id({"url": "https://example.com/lily"})
+        assert FloraImporter._flower_id({"url": "", "botanical_name": "Rosa damascena"}) == \
+            FloraImporter._flower_id({"botanical_name": "Rosa damascena"})
+        assert FloraImporter._flower_id({"url": "", "botanical_name": "", "description": "Unnamed"}) is None
+
+    @patch.object(FloraImporter, "_save_batch")
+    @patch.object(FloraImporter, "_process_row")
+    def test_process_rows_skips_checkpointed_rows(self, mock_process_row, mock_save_batch, tmp_path):
+        """Test a resumed import does not download or embed flowers recorded in the checkpoint."""
+        # Arrange
+        rows = [{"url": f"https://example.com/{i}", "common_name": f"Rose {i}"} for i in range(4)]
+        checkpoint = ImportCheckpoint(tmp_path / "checkpoint.jsonl")
+        checkpoint.mark_done({FloraImporter._flower_id(rows[0]): [], FloraImporter._flower_id(rows[2]): []})
 
-        mock_save_to_collection.assert_called_once_with(
-            expected_document_ids, expected_uris, expected_metadata
+        importer = FloraImporter(
+            csv_file_path=self.csv_file_path,
+            chromadb_client=self.mock_chromadb_client,
+            checkpoint=ImportCheckpoint(tmp_path / "checkpoint.jsonl", resume=True)
         )
+        mock_process_row.side_effect = lambda row: row
+
+        # Act
+        result = importer._process_rows(iter(rows), start=0, batch_size=10)
+
+        # Assert
+        assert result == 2
+        assert importer.num_skipped == 2
+        mock_save_batch.assert_called_once_with([rows[1], rows[3]])
 
     @patch("import_data.FloraImageDAO")
     def test_save_to_image_collection(self, mock_image_dao_class):
@@ -381,8 +482,8 @@ class TestFloraImporter:
         importer._save_to_image_collection(document_ids, image_uris, metadata_list)
 
         # Assert
-        mock_image_dao_class.assert_called_once_with(self.mock_chromadb_client)
-        mock_image_dao.add_documents_batch.assert_called_once_with(
+        mock_image_dao_class.assert_called_once_with(self.mock_chromadb_client, None)
+        mock_image_dao.upsert_documents_batch.assert_called_once_with(
             document_ids=document_ids,
             uris=image_uris,
             metadata_list=metadata_list
@@ -407,6 +508,7 @@ class TestFloraImporter:
 
         mock_rows = [{"name": "flower1"}, {"name": "flower2"}]
         mock_slice_rows.return_value = mock_rows
+        mock_process_rows.return_value = len(mock_rows)
 
         start, end = 0, 10
 
@@ -419,7 +521,7 @@ class TestFloraImporter:
         mock_file_open.assert_called_once_with(self.csv_file_path, "r", encoding="utf-8")
         mock_dict_reader.assert_called_once()
         mock_slice_rows.assert_called_once_with(mock_reader, start, end)
-        mock_process_rows.assert_called_once_with(mock_rows, start)
+        mock_process_rows.assert_called_once_with(mock_rows, start, DEFAULT_BATCH_SIZE)
 
     @patch("import_data.open", new_callable=mock_open)
     @patch("import_data.csv.DictReader")
@@ -439,6 +541,7 @@ class TestFloraImporter:
 
         mock_rows = [{"name": "flower1"}]
         mock_slice_rows.return_value = mock_rows
+        mock_process_rows.return_value = len(mock_rows)
 
         # Act
         result = importer.import_data()
@@ -446,4 +549,137 @@ class TestFloraImporter:
         # Assert
         assert result == 1
         mock_slice_rows.assert_called_once_with(mock_reader, 0, None)
-        mock_process_rows.assert_called_once_with(mock_rows, 0)
+        mock_process_rows.assert_called_once_with(mock_rows, 0, DEFAULT_BATCH_SIZE)
+
+
+class TestFloraImporterSync:
+    """Sync tests against a real, temporary ChromaDB with a counting embedding function."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, counting_embedding_function):
+        self.embedding_function = counting_embedding_function
+        self.rows = [
+            {"botanical_name": f"Primula {i}", "family": "Primulaceae", "url": f"https://example.com/{i}",
+             "common_name": f"Primrose {i}", "description": f"Primrose number {i}",
+             "image1_url": f"https://example.com/{i}.jpg"}
+            for i in range(3)
+        ]
+        self.downloads = []
+        self.failing_urls = set()
+
+    def _importer(self, tmp_path, embedding_cache_dir=None):
+        csv_path = tmp_path / "flowers.csv"
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+        img_directory = tmp_path / "img"
+        downloader = MagicMock()
+        downloader.submit.side_effect = lambda url, file_path, **refresh: completed(
+            self._fake_download(url, file_path, **refresh))
+        importer = FloraImporter(str(csv_path), chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+                                 img_directory=str(img_directory), downloader=downloader)
+        embedding_function = self.embedding_function
+        if embedding_cache_dir:
+            embedding_function = importer.embedding_function = CachedEmbeddingFunction(self.embedding_function,
+                                                                                       embedding_cache_dir)
+        importer.text_dao = FloraTextDAO(importer.chromadb_client, embedding_function=embedding_function)
+        importer.image_dao = FloraImageDAO(importer.chromadb_client, embedding_function=embedding_function)
+        return importer
+
+    def _fake_download(self, url, file_path, refresh=False, conditional=True):
+        self.downloads.append((file_path.name, refresh, conditional))
+        if url in self.failing_urls:
+            return None
+        if not file_path.is_file() or (refresh and not conditional):
+            shade = int(url.rsplit("/", 1)[1].split(".")[0]) * 40
+            Image.new("RGB", (8, 8), (shade, shade, shade)).save(file_path, "JPEG")
+        return str(file_path)
+
+    def test_sync_only_reembeds_changed_records_and_deletes_missing(self, tmp_path):
+        """Test a sync embeds only changed text and images and removes flowers gone from the CSV."""
+        # Arrange
+        self._importer(tmp_path).import_data(sync=True)
+        assert (self.embedding_function.num_texts, self.embedding_function.num_images) == (3, 3)
+
+        self.rows[1]["description"] = "An updated description"
+        removed_row = self.rows.pop(2)
+        Image.new("RGB", (8, 8), (255, 0, 0)).save(tmp_path / "img" / "primrose_0_img1.jpg", "JPEG")
+        importer = self._importer(tmp_path)
+
+        # Act
+        num_processed = importer.import_data(sync=True)
+
+        # Assert
+        assert num_processed == 2
+        assert importer.num_unchanged == 1
+        assert (self.embedding_function.num_texts, self.embedding_function.num_images) == (4, 4)
+        stored_ids = importer.text_dao.get(limit=None, include=["metadatas"])["ids"]
+        assert sorted(stored_ids) == sorted(FloraImporter._flower_id(row) for row in self.rows)
+        removed_id = FloraImporter._flower_id(removed_row)
+        assert importer.image_dao.get(where={"flora_id": removed_id}, include=["metadatas"])["ids"] == []
+        assert importer.image_dao.get_collection_count() == 2
+        assert sorted(importer.fused_dao.get(limit=None, include=[])["ids"]) == sorted(stored_ids)
+        assert (tmp_path / "img" / "thumbs" / "thumb" / "primrose_1_img1.webp").is_file()
+
+    def test_rows_of_one_flower_are_written_once_and_rows_without_id_skipped(self, tmp_path):
+        """Test a repeated url in one batch stores the last row instead of failing the write, and a row with nothing
+        to derive an id from is reported rather than imported."""
+        # Arrange
+        self.rows.append({**self.rows[0], "description": "Primrose number 0, listed again"})
+        self.rows.append({**self.rows[1], "url": "", "botanical_name": "", "common_name": ""})
+        importer = self._importer(tmp_path)
+
+        # Act
+        num_processed = importer.import_data()
+
+        # Assert
+        assert num_processed == 3
+        assert importer.num_without_id == 1
+        stored = importer.text_dao.get([FloraImporter._flower_id(self.rows[0])], include=["documents"])
+        assert stored["documents"][0].endswith("Primrose number 0, listed again")
+        assert importer.text_dao.get_collection_count() == 3
+        assert importer.image_dao.get_collection_count() == 3
+
+    def test_rebuild_of_unchanged_data_runs_no_inference(self, tmp_path):
+        """Test re-importing into emptied collections takes every embedding from the on-disk cache."""
+        # Arrange
+        first_import = self._importer(tmp_path, tmp_path / "embedding_cache")
+        first_import.import_data()
+        calls_before = self.embedding_function.num_calls
+        expected = first_import.text_dao.get(limit=None, include=["embeddings"])
+        for dao in (first_import.text_dao, first_import.image_dao, first_import.fused_dao):
+            dao.delete_collection()
+
+        # Act
+        importer = self._importer(tmp_path, tmp_path / "embedding_cache")
+        num_processed = importer.import_data()
+
+        # Assert
+        assert num_processed == 3
+        assert self.embedding_function.num_calls == calls_before
+        assert importer.embedding_function.cache.stats()["hits"] == 6
+        rebuilt = importer.text_dao.get(expected["ids"], limit=None, include=["embeddings"])
+        assert numpy.allclose(rebuilt["embeddings"], expected["embeddings"])
+
+    def test_sync_downloads_photos_whose_url_changed_and_keeps_failed_ones(self, tmp_path):
+        """Test a changed image url is downloaded and embedded again, and a failed download deletes nothing."""
+        # Arrange
+        self._importer(tmp_path).import_data(sync=True)
+        self.rows[0]["image1_url"] = "https://example.com/5.jpg"
+        self.failing_urls.add(self.rows[1]["image1_url"])
+        self.downloads.clear()
+        importer = self._importer(tmp_path)
+
+        # Act
+        importer.import_data(sync=True)
+
+        # Assert
+        assert sorted(self.downloads) == [("primrose_0_img1.jpg", True, False), ("primrose_1_img1.jpg", True, True),
+                                          ("primrose_2_img1.jpg", True, True)]
+        assert self.embedding_function.num_images == 4
+        images = importer.image_dao.get(limit=None, include=["metadatas"])
+        assert len(images["ids"]) == 3
+        assert sorted(metadata["source_url"] for metadata in images["metadatas"]) == \
+            ["https://example.com/1.jpg", "https://example.com/2.jpg", "https://example.com/5.jpg"]
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference import InferenceExecutor, InferenceQueueFull
+
+
+class TestInferenceExecutor:
+    """Test suite for InferenceExecutor class."""
+
+    def test_run_executes_off_the_event_loop(self):
+        """Test run returns the function result computed on an inference thread."""
+        executor = InferenceExecutor(workers=1, max_queue=0)
+
+        async def scenario():
+            return await executor.run(lambda x: (x * 2, threading.current_thread().name), 21)
+
+        result, thread_name = asyncio.run(scenario())
+        executor.shutdown()
+
+        assert result == 42
+        assert thread_name.startswith("inference")
+
+    def test_run_rejects_calls_beyond_workers_and_queue(self):
+        """Test calls beyond workers + max_queue fail fast while accepted ones still complete."""
+        executor = InferenceExecutor(workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def scenario():
+            accepted = [asyncio.create_task(executor.run(release.wait, 5)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(InferenceQueueFull):
+                await executor.run(release.wait, 5)
+            release.set()
+            return await asyncio.gather(*accepted)
+
+        assert asyncio.run(scenario()) == [True, True]
+        assert executor.pending == 0
+        executor.shutdown()
+
+    def test_event_loop_stays_responsive_during_inference(self):
+        """Test other coroutines keep running while inference blocks a worker thread."""
+        executor = InferenceExecutor(workers=1, max_queue=0)
+        release = threading.Event()
+
+        async def scenario():
+            inference = asyncio.create_task(executor.run(release.wait, 5))
+            await asyncio.sleep(0.01)
+            answered_while_busy = not inference.done()
+            release.set()
+            await inference
+            return answered_while_busy
+
+        assert asyncio.run(scenario())
+        executor.shutdown()
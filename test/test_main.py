@@ -0,0 +1,164 @@
+import io
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+from flower_index import FlowerIndex
+from inference import InferenceExecutor
+
+
+@pytest.fixture
+def api(monkeypatch, make_search_service):
+    """The API over a temporary ChromaDB of five flowers, with the counting embedding function in place of CLIP"""
+    service = make_search_service(num_flowers=5)
+
+    def load_search_service():
+        main.app.search_service = service
+        main.app.flower_index = FlowerIndex(service.text_dao)
+        main.app.flower_index.refresh()
+
+    monkeypatch.setattr(main, "startup_steps", lambda: [("search_service", load_search_service)])
+    # The lifespan shuts the executor down, every client gets its own
+    monkeypatch.setattr(main.app, "inference", InferenceExecutor(workers=2), raising=False)
+    with TestClient(main.app) as client:
+        assert main.app.startup.ready.wait(5)
+        yield client
+
+
+class TestSearchEndpoint:
+    """Test suite for POST /flowers/search/ driven through the ASGI app."""
+
+    def test_text_search_with_filters_and_cursor(self, api):
+        """Test every form field is read on its own: the query, a family filter and the next page's cursor."""
+        # Arrange
+        first = api.post("/flowers/search/", data={"q": "Primrose 3", "family": "Primulaceae", "limit": 2})
+
+        # Act
+        second = api.post("/flowers/search/", data={"q": "Primrose 3", "family": "Primulaceae", "limit": 2,
+                                                    "cursor": first.json()["next_cursor"]})
+        filtered_out = api.post("/flowers/search/", data={"q": "Primrose 3", "family": "Rosaceae"})
+
+        # Assert
+        assert first.status_code == 200 and second.status_code == 200
+        assert first.json()["q"] == "Primrose 3"
+        assert first.json()["items"][0]["botanical_name"] == "Primula 3"
+        names = [item["botanical_name"] for item in first.json()["items"] + second.json()["items"]]
+        assert len(names) == len(set(names)) == 4
+        assert filtered_out.json()["items"] == []
+
+    def test_photo_search_matching_no_flower_is_empty(self, api):
+        """Test an upload whose filter matches no photo answers an empty page instead of failing."""
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48), (200, 40, 120)).save(image, "JPEG")
+
+        response = api.post("/flowers/search/", data={"family": "nothing"},
+                            files={"q_img": ("rose.jpg", image.getvalue(), "image/jpeg")})
+
+        assert response.status_code == 200
+        assert response.json()["items"] == [] and response.json()["next_cursor"] is None
+
+    def test_items_carry_the_flora_id_of_their_details(self, api):
+        """Test a search item's id is the key its details are fetched by."""
+        item = api.post("/flowers/search/", data={"q": "Primrose 2", "limit": 1}).json()["items"][0]
+
+        details = api.get(f"/flowers/{item['id']}")
+
+        assert item["id"] == "id2"
+        assert details.status_code == 200
+        assert details.json()["id"] == "id2" and details.json()["botanical_name"] == item["botanical_name"]
+
+    def test_fields_select_a_preset_or_a_list(self, api):
+        """Test items hold the list view by default, every field with full, or only the named ones."""
+        # Act
+        list_view = api.post("/flowers/search/", data={"q": "Primrose 1", "limit": 1}).json()["items"][0]
+        full = api.post("/flowers/search/", data={"q": "Primrose 1", "limit": 1, "fields": "full"}).json()["items"][0]
+        named = api.post("/flowers/search/", data={"q": "Primrose 1", "limit": 1,
+                                                   "fields": "common_name,distance"}).json()["items"][0]
+        unknown = api.post("/flowers/search/", data={"q": "Primrose 1", "fields": "q"})
+
+        # Assert
+        assert "description" not in list_view and list_view["botanical_name"] == "Primula 1"
+        assert full["description"].startswith("A small perennial") and full["id"] == "id1"
+        assert set(named) == {"common_name", "distance"}
+        assert unknown.status_code == 400 and unknown.json()["detail"] == "Unknown fields: q"
+
+
+class TestFlowerEndpoint:
+    """Test suite for GET /flowers/{id} and its conditional requests."""
+
+    def test_unchanged_flower_is_not_modified(self, api):
+        # Arrange
+        first = api.get("/flowers/id1")
+
+        # Act
+        again = api.get("/flowers/id1", headers={"If-None-Match": first.headers["ETag"]})
+        other = api.get("/flowers/id1", headers={"If-None-Match": '"stale"'})
+
+        # Assert
+        assert first.status_code == 200 and first.json()["botanical_name"] == "Primula 1"
+        assert again.status_code == 304 and again.headers["ETag"] == first.headers["ETag"]
+        assert other.status_code == 200
+        assert api.get("/flowers/missing").status_code == 404
+
+
+class TestImageEndpoint:
+    """Test suite for GET /images/{variant}/{filename}."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, tmp_path):
+        self.img_dir = tmp_path / "img"
+        self.img_dir.mkdir()
+        Image.new("RGB", (640, 480), (40, 160, 60)).save(self.img_dir / "primula.jpg", "JPEG")
+        (tmp_path / "secret.jpg").write_bytes(b"outside the image folder")
+        monkeypatch.setattr(main, "IMG_DIRECTORY", self.img_dir)
+
+    def test_variant_is_rendered_and_revalidated(self, api):
+        # Act
+        thumb = api.get("/images/thumb/primula.jpg")
+        again = api.get("/images/thumb/primula.jpg", headers={"If-None-Match": thumb.headers["ETag"]})
+
+        # Assert
+        assert thumb.status_code == 200 and thumb.headers["content-type"] == "image/webp"
+        assert Image.open(io.BytesIO(thumb.content)).size == (320, 240)
+        assert again.status_code == 304 and again.content == b""
+
+    @pytest.mark.parametrize("path", ["/images/original/..%2Fsecret.jpg", "/images/original/%2E%2E",
+                                      "/images/huge/primula.jpg", "/images/original/missing.jpg"])
+    def test_paths_outside_the_photos_are_not_found(self, api, path):
+        assert api.get(path).status_code == 404
+
+
+class TestStartingUp:
+    """Test suite for the API while the startup steps are still running."""
+
+    def test_searches_wait_for_readiness(self, monkeypatch, make_search_service):
+        """Test searches and metrics answer 503 with Retry-After until startup finishes, health checks at once."""
+        # Arrange
+        service = make_search_service(num_flowers=2)
+        release = threading.Event()
+
+        def load_search_service():
+            release.wait(5)
+            main.app.search_service = service
+
+        monkeypatch.setattr(main, "startup_steps", lambda: [("search_service", load_search_service)])
+        monkeypatch.setattr(main.app, "inference", InferenceExecutor(workers=1), raising=False)
+
+        with TestClient(main.app) as client:
+            # Act
+            search = client.post("/flowers/search/", data={"q": "Primrose 1"})
+            metrics = client.get("/metrics/cache")
+            ready = client.get("/readyz")
+            health = client.get("/healthz")
+            release.set()
+            assert main.app.startup.ready.wait(5)
+
+            # Assert
+            assert search.status_code == 503 and search.headers["Retry-After"] == "5"
+            assert metrics.status_code == 503
+            assert ready.status_code == 503 and ready.json()["phase"] == "search_service"
+            assert health.status_code == 200
+            assert client.get("/metrics/cache").status_code == 200
@@ -0,0 +1,41 @@
+import pytest
+
+from models import Flower, ScoredFlower
+from payloads import FULL_FIELDS, LIST_FIELDS, parse_fields, project
+
+
+class TestPayloads:
+    """Test suite for search result projections."""
+
+    def setup_method(self):
+        self.flower = ScoredFlower(botanical_name="Primula denticulata", family="Primulaceae",
+                                   url="https://example.com/p", common_name="Drumstick Primula",
+                                   description="A long description " * 50, thumbnail="p_img1.jpg", id="p1",
+                                   distance=0.25)
+
+    def test_list_view_is_the_default_projection(self):
+        """Test results default to the compact list view without description or image urls."""
+        assert parse_fields(None) == LIST_FIELDS
+        assert project(self.flower, parse_fields(None)) == {
+            "id": "p1", "botanical_name": "Primula denticulata", "common_name": "Drumstick Primula",
+            "family": "Primulaceae", "thumbnail": "p_img1.jpg", "distance": 0.25}
+
+    def test_custom_fields_and_full_preset(self):
+        """Test a comma separated field list is projected in order and full includes every field that is set."""
+        assert project(self.flower, parse_fields("common_name, url,common_name")) == {
+            "common_name": "Drumstick Primula", "url": "https://example.com/p"}
+        assert parse_fields("full") == FULL_FIELDS
+        assert "description" in project(self.flower, parse_fields("full"))
+
+    def test_unset_fields_are_left_out(self):
+        """Test plain flowers, which have no distance, and unset fields do not produce nulls."""
+        flower = Flower(botanical_name="Rosa", family="Rosaceae", url="https://example.com/r", common_name="Rose")
+
+        assert project(flower, LIST_FIELDS) == {"botanical_name": "Rosa", "common_name": "Rose", "family": "Rosaceae"}
+
+    def test_unknown_fields_are_rejected(self):
+        """Test fields that are not flower fields raise a ValueError naming them."""
+        with pytest.raises(ValueError, match="embedding"):
+            parse_fields("common_name,embedding")
+        with pytest.raises(ValueError):
+            parse_fields(" , ")
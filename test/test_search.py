@@ -0,0 +1,432 @@
+import io
+import os
+import threading
+import timeit
+from unittest.mock import patch
+
+import numpy
+from PIL import Image
+
+from fused_index import update_fused_embeddings
+from models import Flower
+import pytest
+
+from search import (CLIP_INPUT_SIZE, IMAGE_FUSIONS, InvalidCursor, build_where, dhash, fuse_image_matches,
+                    preprocess_query_image, process_results, reciprocal_rank_fusion, unique_ids)
+
+
+def photo(seed: int, size=(640, 480)) -> Image.Image:
+    """A random but reproducible test photo with enough structure for a perceptual hash"""
+    pixels = numpy.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=numpy.uint8)
+    return Image.fromarray(pixels).resize(size, Image.Resampling.BICUBIC)
+
+
+def add_flower_images(service, tmp_path, num_flowers=20, images_per_flower=1):
+    """Store images_per_flower photos for each flower, image j of flower i uses seed i * 100 + j"""
+    ids, uris, metadatas = [], [], []
+    for i in range(num_flowers):
+        for j in range(images_per_flower):
+            path = tmp_path / f"flower{i}_img{j}.png"
+            photo(i * 100 + j, size=(64, 48)).save(path)
+            ids.append(f"img{i}-{j}")
+            uris.append(str(path))
+            metadatas.append({"flora_id": f"id{i}"})
+    service.image_dao.upsert_documents_batch(ids, uris, metadatas)
+
+
+def upload(image: Image.Image, image_format="JPEG", **kwargs) -> io.BytesIO:
+    file = io.BytesIO()
+    image.save(file, image_format, **kwargs)
+    file.seek(0)
+    return file
+
+
+class TestSearch:
+    """Test suite for search result assembly."""
+
+    def test_unique_ids_keeps_first_match_order(self):
+        """Test unique_ids collapses image matches to distinct flora ids in rank order."""
+        image_matches = {"metadatas": [[{"flora_id": "b"}, {"flora_id": "a"}, {"flora_id": "b"}, {"flora_id": "c"}]]}
+
+        assert unique_ids(image_matches) == ["b", "a", "c"]
+
+    def test_process_results_follows_ordered_ids(self, flower_metadata):
+        """Test process_results builds flowers in the requested order and drops non Flower metadata."""
+        # Arrange
+        ids = ["id0", "id1", "id2"]
+        metadatas = [flower_metadata(i) for i in range(3)]
+
+        # Act
+        flowers = process_results(metadatas, ids, ["id2", "id0"])
+
+        # Assert
+        assert [f.botanical_name for f in flowers] == ["Primula 2", "Primula 0"]
+        assert all(isinstance(f, Flower) for f in flowers)
+        assert flowers[0].image1_url == "https://example.com/2.jpg"
+
+    def test_process_results_cost_is_linear(self, flower_metadata):
+        """Micro benchmark: hydrating 1000 results costs about 10x hydrating 100, not 100x."""
+
+        def hydration_time(n):
+            ids = [f"id{i}" for i in range(n)]
+            metadatas = [flower_metadata(i) for i in range(n)]
+            ordered_ids = list(reversed(ids))
+            return min(timeit.repeat(lambda: process_results(metadatas, ids, ordered_ids), number=5, repeat=5))
+
+        small, large = hydration_time(100), hydration_time(1000)
+
+        assert large / small < 30, f"n=100: {small:.5f}s, n=1000: {large:.5f}s"
+
+    def test_preprocess_query_image_downscales_jpeg_and_applies_exif_orientation(self):
+        """Test a large rotated JPEG is decoded to the model input size in its upright orientation."""
+        # Arrange
+        upload = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        Image.new("RGB", (4000, 3000), (200, 40, 90)).save(upload, "JPEG", exif=exif)
+        upload.seek(0)
+
+        # Act
+        pixels = preprocess_query_image(upload)
+
+        # Assert
+        assert pixels.shape == (round(4000 * CLIP_INPUT_SIZE / 3000), CLIP_INPUT_SIZE, 3)
+        assert pixels.dtype.name == "uint8"
+
+    def test_preprocess_query_image_converts_to_rgb_without_upscaling(self):
+        """Test a small transparent PNG is converted to RGB and left at its own size."""
+        # Arrange
+        upload = io.BytesIO()
+        Image.new("RGBA", (120, 80), (10, 20, 30, 128)).save(upload, "PNG")
+        upload.seek(0)
+
+        # Act
+        pixels = preprocess_query_image(upload)
+
+        # Assert
+        assert pixels.shape == (80, 120, 3)
+
+    def test_batched_text_searches_match_unbatched_results(self, counting_embedding_function, make_search_service):
+        """Test concurrent searches are embedded together and each caller gets its own results."""
+        # Arrange
+        service = make_search_service(max_batch_size=8, max_wait_ms=200)
+        expected = {i: service.text_dao.query(f"Primrose {i}", 3)["ids"][0] for i in range(8)}
+        calls_before = counting_embedding_function.num_calls
+        results = {}
+        start = threading.Barrier(8)
+
+        def search(i):
+            start.wait()
+            results[i] = service.search(f"Primrose {i}", None, n=3)
+
+        threads = [threading.Thread(target=search, args=(i,)) for i in range(8)]
+
+        # Act
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        for i in range(8):
+            assert [f.botanical_name for f in results[i]] == [f"Primula {id[2:]}" for id in expected[i]]
+            assert results[i][0].botanical_name == f"Primula {i}"
+        assert counting_embedding_function.num_calls - calls_before < 8
+
+    def test_repeated_text_search_is_served_from_cache(self, counting_embedding_function, make_search_service):
+        """Test a repeated, differently spaced query reuses cached results without embedding again."""
+        # Arrange
+        service = make_search_service()
+        first = service.search("Primrose 3", None, n=3)
+        calls_before = counting_embedding_function.num_calls
+
+        # Act
+        second = service.search("  primrose   3 ", None, n=3)
+
+        # Assert
+        assert second == first
+        assert counting_embedding_function.num_calls == calls_before
+        assert service.cache_stats()["results"]["hits"] == 1
+
+    def test_cached_embedding_is_reused_when_results_are_not(self, counting_embedding_function, make_search_service):
+        """Test a query with a different n misses the results cache but not the embedding cache."""
+        service = make_search_service()
+        service.search("Primrose 3", None, n=3)
+        calls_before = counting_embedding_function.num_calls
+
+        flowers = service.search("Primrose 3", None, n=5)
+
+        assert len(flowers) == 5
+        assert counting_embedding_function.num_calls == calls_before
+        assert service.cache_stats()["embeddings"]["hits"] == 1
+
+    def test_writes_invalidate_cached_results(self, make_search_service, flower_metadata):
+        """Test results cached before a write to the text collection are not served after it."""
+        # Arrange
+        service = make_search_service()
+        service.search("Primrose 3", None, n=3)
+        metadata = {**flower_metadata(3), "common_name": "Renamed primrose"}
+
+        # Act
+        service.text_dao.update_metadata_batch(["id3"], [metadata])
+        flowers = service.search("Primrose 3", None, n=3)
+
+        # Assert
+        assert flowers[0].common_name == "Renamed primrose"
+        assert service.cache_stats()["results"]["hits"] == 0
+
+    def test_writes_from_another_process_invalidate_cached_results(self, make_search_service):
+        """Test the write marker touched by an importer process invalidates cached results."""
+        # Arrange
+        service = make_search_service()
+        service.search("Primrose 3", None, n=3)
+        marker = service.text_dao.write_marker
+        stat = marker.stat()
+
+        # Act
+        os.utime(marker, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        service.search("Primrose 3", None, n=3)
+
+        # Assert
+        assert service.cache_stats()["results"]["hits"] == 0
+
+    def test_recompressed_upload_skips_image_encoder(self, tmp_path, counting_embedding_function, make_search_service):
+        """Test a re-compressed copy of an uploaded photo reuses the cached image embedding."""
+        # Arrange
+        service = make_search_service()
+        add_flower_images(service, tmp_path)
+        first = service.search(None, upload(photo(7), quality=95))
+        images_before = counting_embedding_function.num_images
+
+        # Act
+        second = service.search(None, upload(photo(7, size=(600, 450)), quality=60))
+
+        # Assert
+        assert [f.botanical_name for f in second] == [f.botanical_name for f in first]
+        assert counting_embedding_function.num_images == images_before
+        stats = service.cache_stats()["image_embeddings"]
+        assert stats["hits"] + stats["near_hits"] == 1
+
+    def test_different_photo_misses_image_cache(self, tmp_path, counting_embedding_function, make_search_service):
+        """Test an unrelated photo is embedded rather than matched to a cached one."""
+        service = make_search_service()
+        add_flower_images(service, tmp_path)
+        service.search(None, upload(photo(7)))
+        images_before = counting_embedding_function.num_images
+
+        service.search(None, upload(photo(8)))
+
+        assert counting_embedding_function.num_images == images_before + 1
+        assert service.cache_stats()["image_embeddings"]["misses"] == 2
+
+    def test_same_shapes_in_other_colors_miss_image_cache(self, tmp_path, counting_embedding_function,
+                                                          make_search_service):
+        """Test photos sharing a difference hash, flat or shaded alike in other colours, are each embedded."""
+        # Arrange
+        service = make_search_service()
+        add_flower_images(service, tmp_path)
+        ramp = numpy.broadcast_to(numpy.linspace(0, 255, 640, dtype=numpy.uint8), (480, 640))
+        red, blue = numpy.zeros((480, 640, 3), dtype=numpy.uint8), numpy.zeros((480, 640, 3), dtype=numpy.uint8)
+        red[..., 0], blue[..., 2] = ramp, ramp
+        pairs = [(Image.new("RGB", (640, 480), (240, 220, 30)), Image.new("RGB", (640, 480), (120, 40, 150))),
+                 (Image.fromarray(red), Image.fromarray(blue))]
+        images_before = counting_embedding_function.num_images
+
+        # Act
+        for first, second in pairs:
+            assert dhash(numpy.asarray(first)) == dhash(numpy.asarray(second))
+            service.search(None, upload(first))
+            service.search(None, upload(second))
+
+        # Assert
+        assert counting_embedding_function.num_images == images_before + 4
+        stats = service.cache_stats()["image_embeddings"]
+        assert stats["hits"] + stats["near_hits"] == 0
+
+    def test_reciprocal_rank_fusion_favours_ids_ranked_well_by_both(self):
+        """Test an id near the top of both rankings beats ids that top only one of them."""
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "e"]])
+
+        assert fused[0] == "b"
+        assert set(fused[1:3]) == {"a", "d"}
+        assert set(fused[3:]) == {"c", "e"}
+
+    def test_image_mode_returns_flowers_of_matching_photos(self, tmp_path, make_search_service):
+        """Test text-to-image mode searches the photos and hydrates their distinct flowers."""
+        # Arrange
+        service = make_search_service()
+        add_flower_images(service, tmp_path, num_flowers=5, images_per_flower=2)
+
+        # Act
+        flowers = service.search("Primrose 3", None, n=4, mode="image")
+
+        # Assert
+        names = [f.botanical_name for f in flowers]
+        assert names and len(names) == len(set(names))
+        assert set(names) <= {f"Primula {i}" for i in range(5)}
+
+    def test_hybrid_mode_embeds_the_text_once(self, tmp_path, counting_embedding_function, make_search_service):
+        """Test hybrid mode shares one text embedding between both collections and fuses their flowers."""
+        # Arrange
+        service = make_search_service(max_batch_size=4)
+        add_flower_images(service, tmp_path, num_flowers=5)
+        calls_before = counting_embedding_function.num_texts
+
+        # Act
+        flowers = service.search("Primrose 3", None, n=5, mode="hybrid")
+
+        # Assert
+        assert counting_embedding_function.num_texts == calls_before + 1
+        names = [f.botanical_name for f in flowers]
+        assert len(names) == 5 and len(names) == len(set(names))
+
+    def test_fuse_image_matches_combines_photos_per_flower(self):
+        """Test max, mean and rrf fusion rank flowers over the hits of several query photos."""
+        # Arrange
+        def matches(*hits):
+            return {"metadatas": [[{"flora_id": flora_id} for flora_id, _ in hits]],
+                    "distances": [[distance for _, distance in hits]]}
+
+        close_up = matches(("a", 0.1), ("b", 0.3), ("b", 0.35))
+        leaves = matches(("b", 0.2), ("c", 0.25), ("a", 0.9))
+
+        # Act / Assert
+        assert fuse_image_matches([close_up, leaves], "max") == ["a", "b", "c"]
+        assert fuse_image_matches([close_up, leaves], "mean") == ["b", "a", "c"]
+        assert fuse_image_matches([close_up, leaves], "rrf") == ["b", "a", "c"]
+        assert fuse_image_matches([close_up], "mean") == ["a", "b"]
+
+    def test_multi_image_search_embeds_all_photos_in_one_pass(self, tmp_path, counting_embedding_function,
+                                                              make_search_service):
+        """Test several query photos cost one embedding call and return distinct flowers."""
+        # Arrange
+        service = make_search_service()
+        add_flower_images(service, tmp_path, num_flowers=5, images_per_flower=2)
+        calls_before = counting_embedding_function.num_calls
+        images_before = counting_embedding_function.num_images
+
+        # Act
+        flowers = service.search(None, [upload(photo(seed)) for seed in (7, 8, 9)], n=3, fusion="mean")
+
+        # Assert
+        assert counting_embedding_function.num_calls == calls_before + 1
+        assert counting_embedding_function.num_images == images_before + 3
+        names = [f.botanical_name for f in flowers]
+        assert len(names) == 3 and len(names) == len(set(names))
+
+    def test_image_search_over_fetches_until_n_distinct_flowers(self, make_search_service,
+                                                                add_clustered_photo_embeddings):
+        """Test photo hits of the same flower do not crowd out the n distinct flowers asked for."""
+        # Arrange
+        service = make_search_service()
+        add_clustered_photo_embeddings(service, "Primrose 0")
+
+        # Act
+        flowers = service.search("Primrose 0", None, n=3, mode="image")
+
+        # Assert
+        assert [f.botanical_name for f in flowers] == ["Primula 0", "Primula 1", "Primula 2"]
+        distances = [f.distance for f in flowers]
+        assert distances == sorted(distances)
+
+    def test_image_search_stops_when_flowers_run_out(self, make_search_service, add_clustered_photo_embeddings):
+        """Test deepening ends with every stored flower when fewer than n have photos."""
+        service = make_search_service()
+        add_clustered_photo_embeddings(service, "Primrose 0", num_flowers=3)
+
+        flowers = service.search("Primrose 0", None, n=10, mode="image")
+
+        assert [f.botanical_name for f in flowers] == ["Primula 0", "Primula 1", "Primula 2"]
+
+    def test_fused_mode_is_one_query_without_get_or_dedup(self, tmp_path, make_search_service):
+        """Test fused search hydrates flowers straight from the fused collection, for text and photo queries."""
+        # Arrange
+        service = make_search_service(num_flowers=5)
+        add_flower_images(service, tmp_path, num_flowers=5, images_per_flower=2)
+        update_fused_embeddings(service.text_dao, service.image_dao, service.fused_dao)
+
+        # Act
+        with patch.object(service.text_dao, "get", side_effect=AssertionError("fused search must not call get")):
+            by_text = service.search("Primrose 3", None, n=3, mode="fused")
+            by_photos = service.search(None, [upload(photo(7)), upload(photo(8))], n=3, mode="fused")
+
+        # Assert
+        for flowers in (by_text, by_photos):
+            names = [f.botanical_name for f in flowers]
+            assert len(names) == 3 and len(names) == len(set(names))
+            assert all(f.distance is not None for f in flowers)
+
+    def test_build_where_combines_typed_filters(self):
+        """Test filters become one Chroma where clause, with comma separated values matching any."""
+        assert build_where() is None
+        assert build_where(region=" Sikkim ") == {"region": "sikkim"}
+        assert build_where(family="primulaceae, rosaceae", min_images=2) == {"$and": [
+            {"family": {"$in": ["primulaceae", "rosaceae"]}}, {"num_images": {"$gte": 2}}]}
+        assert build_where(family="Asteraceae (Compositae)") == {"family": "asteraceae (compositae)"}
+
+    def test_filters_are_pushed_down_into_text_and_image_searches(self, tmp_path, make_search_service, flower_metadata):
+        """Test only flowers matching the filter are returned, by both description and photo searches."""
+        # Arrange
+        service = make_search_service(num_flowers=10)
+        add_flower_images(service, tmp_path, num_flowers=10)
+        sikkim = [f"id{i}" for i in range(0, 10, 3)]
+        service.text_dao.update_metadata_batch(sikkim, [{**flower_metadata(int(i[2:])), "region": "sikkim"}
+                                                        for i in sikkim])
+        service.image_dao.update_metadata_batch([f"img{i[2:]}-0" for i in sikkim],
+                                                [{"flora_id": i, "region": "sikkim"} for i in sikkim])
+        where = build_where(region="Sikkim")
+
+        # Act
+        by_text, _ = service.search_page("Primrose 1", limit=10, where=where)
+        by_photo, _ = service.search_page(None, [upload(photo(7))], limit=10, where=where)
+
+        # Assert
+        expected = {f"Primula {i[2:]}" for i in sikkim}
+        assert {f.botanical_name for f in by_text} == expected
+        assert {f.botanical_name for f in by_photo} == expected
+
+    def test_filtered_search_without_matches_is_empty(self, tmp_path, make_search_service):
+        """Test a filter no flower matches gives no results in every mode, rather than an error."""
+        # Arrange
+        service = make_search_service(num_flowers=5)
+        add_flower_images(service, tmp_path, num_flowers=5)
+        where = build_where(family="nothing")
+
+        # Act
+        by_photo, cursor = service.search_page(None, [upload(photo(2))], where=where)
+        by_photos = {fusion: service.search_page(None, [upload(photo(2)), upload(photo(3))], where=where,
+                                                 fusion=fusion) for fusion in IMAGE_FUSIONS}
+
+        # Assert
+        assert by_photo == [] and cursor is None
+        assert all(page == ([], None) for page in by_photos.values())
+        for mode in ("text", "image", "hybrid", "fused"):
+            assert service.search("Primrose 2", None, where=where, mode=mode) == []
+
+    def test_cursor_pages_through_results_without_overlap(self, make_search_service):
+        """Test following next_cursor yields the full result list, page by page, and then stops."""
+        # Arrange
+        service = make_search_service(num_flowers=7)
+        expected = [f.botanical_name for f in service.search("Primrose 2", None, n=7)]
+
+        # Act
+        pages, cursor = [], None
+        while True:
+            page, cursor = service.search_page("Primrose 2", limit=3, cursor=cursor)
+            pages.append([f.botanical_name for f in page])
+            if cursor is None:
+                break
+
+        # Assert
+        assert [name for page in pages for name in page] == expected
+        assert [len(page) for page in pages] == [3, 3, 1]
+
+    def test_cursor_of_another_search_is_rejected(self, make_search_service):
+        """Test a cursor cannot be replayed against a different query or filter."""
+        service = make_search_service(num_flowers=7)
+        _, cursor = service.search_page("Primrose 2", limit=3)
+
+        with pytest.raises(InvalidCursor):
+            service.search_page("Primrose 5", limit=3, cursor=cursor)
+        with pytest.raises(InvalidCursor):
+            service.search_page("Primrose 2", limit=3, cursor="not-a-cursor")
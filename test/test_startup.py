@@ -0,0 +1,39 @@
+import time
+
+from startup import Startup
+
+
+class TestStartup:
+    """Test suite for Startup class."""
+
+    def test_run_times_each_phase_in_order_and_becomes_ready(self):
+        """Test every step runs once, in order, with its duration recorded, before ready is set."""
+        calls = []
+        startup = Startup([("chroma", lambda: calls.append("chroma")),
+                           ("warm_up", lambda: (time.sleep(0.01), calls.append("warm_up")))])
+        assert startup.status()["ready"] is False
+
+        startup.run()
+
+        status = startup.status()
+        assert calls == ["chroma", "warm_up"]
+        assert status["ready"] is True and status["error"] is None
+        assert list(status["phases"]) == ["chroma", "warm_up", "total"]
+        assert status["phases"]["warm_up"] >= 0.01
+
+    def test_failed_step_stops_startup_and_is_reported(self):
+        """Test a failing step records the error, skips the remaining steps and never reports ready."""
+        calls = []
+
+        def load_model():
+            raise RuntimeError("no weights")
+
+        startup = Startup([("search_service", load_model), ("warm_up", lambda: calls.append("warm_up"))])
+
+        startup.run()
+
+        status = startup.status()
+        assert calls == []
+        assert status["ready"] is False
+        assert status["phase"] == "search_service"
+        assert "no weights" in status["error"]
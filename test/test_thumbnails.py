@@ -0,0 +1,74 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from thumbnails import THUMBNAIL_SIZES, file_etag, make_thumbnail, make_thumbnails, thumbnail_path
+
+
+def save_photo(path, size=(1600, 1200), color=(200, 40, 120)):
+    Image.new("RGB", size, color).save(path, "JPEG", quality=95)
+    return path
+
+
+class TestThumbnails:
+    """Test suite for the WebP image variants."""
+
+    def test_variants_are_small_webp_files_next_to_the_original(self, tmp_path):
+        """Test every variant is a WebP whose longest side is the variant size."""
+        original = save_photo(tmp_path / "primrose_img1.jpg")
+
+        paths = make_thumbnails(original)
+
+        assert paths["thumb"] == tmp_path / "thumbs" / "thumb" / "primrose_img1.webp"
+        for variant, path in paths.items():
+            with Image.open(path) as image:
+                assert image.format == "WEBP"
+                assert max(image.size) == THUMBNAIL_SIZES[variant]
+        assert paths["thumb"].stat().st_size < original.stat().st_size
+
+    def test_up_to_date_variant_is_reused_and_stale_one_rerendered(self, tmp_path):
+        """Test a variant is only rendered again once the original is newer than it."""
+        # Arrange
+        original = save_photo(tmp_path / "primrose_img1.jpg")
+        path = make_thumbnail(original, "thumb")
+        rendered_at = path.stat().st_mtime_ns
+
+        # Act / Assert
+        assert make_thumbnail(original, "thumb").stat().st_mtime_ns == rendered_at
+        save_photo(original, color=(10, 200, 30))
+        os.utime(original, ns=(rendered_at + 10 ** 9, rendered_at + 10 ** 9))
+        make_thumbnail(original, "thumb")
+        with Image.open(thumbnail_path(original, "thumb")) as image:
+            assert image.getpixel((0, 0))[1] > 150
+
+    def test_etag_follows_file_content(self, tmp_path):
+        """Test the ETag is stable for unchanged files and changes with their content."""
+        original = save_photo(tmp_path / "primrose_img1.jpg")
+        etag = file_etag(original)
+
+        assert file_etag(original) == etag
+        save_photo(original, color=(10, 200, 30))
+        os.utime(original, ns=(10 ** 18, 10 ** 18))
+        assert file_etag(original) != etag
+
+    def test_concurrent_first_renders_all_succeed(self, tmp_path):
+        """Test writers racing to create the same variant each succeed and leave one complete WebP behind."""
+        # Arrange
+        original = save_photo(tmp_path / "primrose_img1.jpg")
+        start = threading.Barrier(8)
+
+        def render(_):
+            start.wait()
+            return make_thumbnail(original, "medium")
+
+        # Act
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            paths = list(pool.map(render, range(8)))
+
+        # Assert
+        assert set(paths) == {thumbnail_path(original, "medium")}
+        with Image.open(paths[0]) as image:
+            assert image.format == "WEBP" and max(image.size) == THUMBNAIL_SIZES["medium"]
+        assert os.listdir(paths[0].parent) == [paths[0].name]